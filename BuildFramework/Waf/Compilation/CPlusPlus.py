@@ -13,6 +13,7 @@ from waflib.TaskGen import extension
 from waflib.TaskGen import feature
 from waflib.Tools import cxx
 
+from Waf.Compilation.Unity import UnityBatchTask
 from Waf.Dependency import AddSubTask
 
 ## \package Waf.Compilation.CPlusPlus
@@ -22,7 +23,9 @@ from Waf.Dependency import AddSubTask
 ##
 ## The Waf C++ tool implements a custom preprocessor to calculate the header file dependencies of
 ## each implementation file. The custom preprocessor is required to cache C++ compilation, but
-## consumes a large part of pre-build resources.
+## consumes a large part of pre-build resources. When configured with --compiler-dependencies, the
+## dependencies are instead taken from the compiler once each file has been compiled (see
+## Waf.Compilation.CompilerDependencies).
 
 # The GCC symbols are stripped from the executable and copied to an external
 # file. A two-part executable (similar to using a Visual Studio PDB) is
@@ -35,13 +38,19 @@ from Waf.Dependency import AddSubTask
 # The GNU toolchain provides a tool called 'objcopy' to separate symbols from
 # a GCC compiled binary. GCC cannot separate the symbols during compilation.
 #
+# The symbols are separated by a task of their own rather than by the linker
+# task. The linker task is free for other links as soon as it is done, and the
+# symbols are only separated again when the linked executable changes.
+#
 # \param[in,out] project - The C++ executable is given as an output of the
 # linker task. The linker task is created by the 'apply_link' method. If the
-# project is an executable, then a new task is added to separate the symbols.
-# It is risky to add a task to the built-in C++ feature because it will not be
-# considered in the built-in dependency analysis. It is safe in this case
-# because C++ projects only depend on libraries and not executables. Also, new
-# project level dependencies make sure to consider all tasks in a project.
+# project is an executable, then the linker output is renamed and a new task
+# produces the executable and its symbols from it. The task is stored in the
+# 'separate_symbols_task' attribute. It is risky to add a task to the built-in
+# C++ feature because it will not be considered in the built-in dependency
+# analysis. It is safe in this case because C++ projects only depend on
+# libraries and not executables. Also, new project level dependencies make sure
+# to consider all tasks in a project.
 @feature('c','cxx')
 @after_method('apply_link')
 def SeparateSymbolsFromGccExecutable(project):
@@ -52,7 +61,9 @@ def SeparateSymbolsFromGccExecutable(project):
 
     # CHECK THAT AN EXECUTABLE IS BEING BUILT.
     try:
-        is_exe = isinstance(project.link_task, cxx.cxxprogram)
+        # A C++ shared object is a subtype of a C++ program. Other projects link against the output
+        # of its linker task, so the output cannot be replaced by an intermediate file.
+        is_exe = isinstance(project.link_task, cxx.cxxprogram) and not isinstance(project.link_task, cxx.cxxshlib)
     except AttributeError:
         is_exe = False
     if not is_exe:
@@ -63,51 +74,149 @@ def SeparateSymbolsFromGccExecutable(project):
     if not has_symbols:
         return
 
-    # ADD A SUB-TASK TO SEPARATE THE SYMBOLS.
-    AddSubTask(project.link_task, SeparateSymbolsFromGccExecutableSubTask)
+    # LINK TO AN INTERMEDIATE EXECUTABLE.
+    # The executable that is run and installed is produced by the new task, so
+    # every task using the executable runs after its symbols are separated.
+    exe_node = project.link_task.outputs[0]
+    unstripped_exe_node = exe_node.parent.find_or_declare(exe_node.name + '.unstripped')
+    project.link_task.outputs[0] = unstripped_exe_node
 
-## The GCC symbols are stripped from the executable and copied to an external
-## file. This method executes the associated commands at build-time. See the
-## feature method for more details on symbols separation.
-## \param parent_task - The parent task object to extend.
-## \returns Zero if successful, greater than zero otherwise.
-def SeparateSymbolsFromGccExecutableSubTask(parent_task):
-    # COPY THE SYMBOLS FROM THE EXECUTABLE TO AN EXTERNAL FILE.
-    exe_node = parent_task.outputs[0]
+    # ADD A TASK TO SEPARATE THE SYMBOLS.
     sym_node = exe_node.change_ext('.sym')
-    copy_symbols_cmd = (
-        'objcopy --only-keep-debug "{exe_path}" "{sym_path}"').format(
-        exe_path = exe_node.abspath(),
-        sym_path = sym_node.abspath())
-    copy_symbols_result = parent_task.exec_command(copy_symbols_cmd)
-    CMD_SUCCESSFUL = 0
-    symbols_copied = (CMD_SUCCESSFUL == copy_symbols_result)
-    if not symbols_copied:
-        return copy_symbols_result
-
-    # REMOVE THE SYMBOLS FROM THE EXECUTABLE.
-    remove_symbols_cmd = 'objcopy --strip-all "{exe_path}"'.format(
-        exe_path = exe_node.abspath())
-    remove_symbols_result = parent_task.exec_command(remove_symbols_cmd)
-    symbols_removed = (CMD_SUCCESSFUL == remove_symbols_result)
-    if not symbols_removed:
-        return remove_symbols_result
-
-    # INSTRUCT GDB TO LOAD THE EXTERNAL SYMBOLS WHEN PRESENT.
-    # The command is executed in the same directory as the executable to
-    # to instruct GDB to look for the symbols in the current directory.
-    link_to_external_symbols_cmd = (
-        'objcopy --add-gnu-debuglink={sym_name} "{exe_path}"').format(
-        exe_path = exe_node.abspath(),
-        sym_name = sym_node.name)
-    exe_dir = exe_node.parent.abspath()
-    link_result = parent_task.exec_command(link_to_external_symbols_cmd, cwd = exe_dir)
-    symbols_linked = (CMD_SUCCESSFUL == link_result)
-    if not symbols_linked:
-        return link_result
-
-    # THE SYMBOLS WERE STRIPPED SUCCESSFULLY.
-    return 0
+    project.separate_symbols_task = project.create_task(
+        'SeparateGccSymbolsTask',
+        unstripped_exe_node,
+        [exe_node, sym_node])
+
+## Separates the symbols of a GCC compiled executable into an external file.
+## See the feature method for more details on symbols separation.
+class SeparateGccSymbolsTask(Task):
+    ## The environment variables that the outputs depend on.
+    vars = ['OBJCOPY', 'COMPRESS_SYMBOLS']
+
+    ## Executes the commands to separate the symbols. The input is the
+    ## executable with embedded symbols. The outputs are the executable without
+    ## symbols and the external symbols file.
+    ## \returns Zero if successful, greater than zero otherwise.
+    def run(self):
+        # COPY THE SYMBOLS FROM THE EXECUTABLE TO AN EXTERNAL FILE.
+        # Compressing the debug sections makes the symbols file much smaller,
+        # at the cost of some time when it is written and loaded.
+        unstripped_exe_node = self.inputs[0]
+        exe_node, sym_node = self.outputs
+        copy_symbols_cmd = self.env.OBJCOPY + ['--only-keep-debug']
+        if self.env.COMPRESS_SYMBOLS:
+            copy_symbols_cmd.append('--compress-debug-sections')
+        copy_symbols_cmd += [unstripped_exe_node.abspath(), sym_node.abspath()]
+        copy_symbols_result = self.exec_command(copy_symbols_cmd)
+        CMD_SUCCESSFUL = 0
+        symbols_copied = (CMD_SUCCESSFUL == copy_symbols_result)
+        if not symbols_copied:
+            return copy_symbols_result
+
+        # COPY THE EXECUTABLE WITHOUT SYMBOLS.
+        # GDB is instructed to load the external symbols when present. The
+        # command is executed in the same directory as the executable to
+        # instruct GDB to look for the symbols in the current directory.
+        strip_symbols_cmd = self.env.OBJCOPY + [
+            '--strip-all',
+            '--add-gnu-debuglink={}'.format(sym_node.name),
+            unstripped_exe_node.abspath(),
+            exe_node.abspath()]
+        exe_dir = exe_node.parent.abspath()
+        return self.exec_command(strip_symbols_cmd, cwd = exe_dir)
+
+    ## The action displayed in the build log.
+    def keyword(self):
+        return 'Separating symbols'
+
+    ## The executable displayed in the build log.
+    def __str__(self):
+        exe_node = self.outputs[0]
+        return exe_node.path_from(exe_node.ctx.launch_node())
+
+# With split debugging information, GCC writes the debugging information of
+# each object file to a .dwo file next to it. The .dwo files are declared as
+# outputs of the compilation tasks, so that Waf tracks and cleans them.
+# \param[in,out] project - The compilation tasks are created by the
+# 'process_source' method.
+@feature('c','cxx')
+@after_method('process_source')
+def DeclareSplitDwarfOutputs(project):
+    # VERIFY THAT SPLIT DEBUGGING INFORMATION IS ENABLED.
+    using_gcc = ('gcc' == project.env.CXX_NAME)
+    split_dwarf_enabled = using_gcc and project.env.SYMBOLS and project.env.SPLIT_DWARF
+    if not split_dwarf_enabled:
+        return
+
+    # ADD THE DEBUGGING INFORMATION FILES TO THE COMPILATION TASKS.
+    for compiled_task in getattr(project, 'compiled_tasks', []):
+        object_node = compiled_task.outputs[0]
+        compiled_task.outputs.append(object_node.change_ext('.dwo'))
+
+# The .dwo files of a GCC executable are packaged into a single .dwp file next
+# to the executable, where GDB looks for it. Only the debugging information of
+# the linked code is packaged, so the package is the split equivalent of the
+# external symbols file.
+#
+# \param[in,out] project - The C++ executable is given as an output of the
+# linker task. The linker task is created by the 'apply_link' method. If the
+# project is an executable, then a new task is added to package the debugging
+# information. The task is stored in the 'package_split_dwarf_task' attribute.
+@feature('c','cxx')
+@after_method('apply_link')
+@after_method('SeparateSymbolsFromGccExecutable')
+def PackageSplitDwarf(project):
+    # VERIFY THAT SPLIT DEBUGGING INFORMATION IS ENABLED.
+    using_gcc = ('gcc' == project.env.CXX_NAME)
+    split_dwarf_enabled = using_gcc and project.env.SYMBOLS and project.env.SPLIT_DWARF
+    if not split_dwarf_enabled:
+        return
+
+    # CHECK THAT AN EXECUTABLE IS BEING BUILT.
+    try:
+        # A C++ shared object is a subtype of a C++ program, but only executables are packaged.
+        is_exe = isinstance(project.link_task, cxx.cxxprogram) and not isinstance(project.link_task, cxx.cxxshlib)
+    except AttributeError:
+        is_exe = False
+    if not is_exe:
+        return
+
+    # ADD A TASK TO PACKAGE THE DEBUGGING INFORMATION.
+    # The package is read from the output of the linker, which still contains
+    # the references to the .dwo files when the symbols are separated.
+    linked_exe_node = project.link_task.outputs[0]
+    separate_symbols_task = getattr(project, 'separate_symbols_task', None)
+    exe_node = separate_symbols_task.outputs[0] if separate_symbols_task else linked_exe_node
+    dwp_node = exe_node.parent.find_or_declare(exe_node.name + '.dwp')
+    project.package_split_dwarf_task = project.create_task(
+        'PackageSplitDwarfTask',
+        linked_exe_node,
+        dwp_node)
+
+## Packages the split debugging information of a GCC compiled executable. See
+## the feature method for more details on packaging.
+class PackageSplitDwarfTask(Task):
+    ## The environment variables that the outputs depend on.
+    vars = ['DWP']
+
+    ## Executes the command to package the debugging information. The input is
+    ## the linked executable. The output is the package.
+    ## \returns Zero if successful, greater than zero otherwise.
+    def run(self):
+        package_cmd = self.env.DWP + [
+            '-e', self.inputs[0].abspath(),
+            '-o', self.outputs[0].abspath()]
+        return self.exec_command(package_cmd)
+
+    ## The action displayed in the build log.
+    def keyword(self):
+        return 'Packaging debug information'
+
+    ## The package displayed in the build log.
+    def __str__(self):
+        dwp_node = self.outputs[0]
+        return dwp_node.path_from(dwp_node.ctx.launch_node())
 
 # C++ executables are installed along side their external symbols.
 # \param[in,out] project - The C++ executable is given as an output of the
@@ -116,6 +225,8 @@ def SeparateSymbolsFromGccExecutableSubTask(parent_task):
 @feature('c','cxx')
 @after_method('apply_link')
 @after_method('apply_flags_msvc')
+@after_method('SeparateSymbolsFromGccExecutable')
+@after_method('PackageSplitDwarf')
 def InstallExecutablesWithSymbols(project):
     # VERIFY THAT AN INSTALLATION WITH SYMBOLS IS BEING PERFORMED.
     has_symbols = project.env.SYMBOLS
@@ -139,11 +250,15 @@ def InstallExecutablesWithSymbols(project):
     symbols_files = []
     if using_gcc:
         # INSTALL THE SYMBOLS FILE.
-        exe_node = project.link_task.outputs[0]
-        sym_node = exe_node.change_ext('.sym')
-        project.link_task.outputs.append(sym_node)
+        # The symbols file is produced by the task that separates the symbols.
+        sym_node = project.separate_symbols_task.outputs[1]
         symbols_files.append(sym_node)
 
+        # INSTALL THE SPLIT DEBUGGING INFORMATION.
+        package_split_dwarf_task = getattr(project, 'package_split_dwarf_task', None)
+        if package_split_dwarf_task:
+            symbols_files.extend(package_split_dwarf_task.outputs)
+
     elif using_visual_studio:
         # INSTALL THE MAP FILE.
         # The PDB file is already installed by the Visual C++ feature.
@@ -160,6 +275,100 @@ def InstallExecutablesWithSymbols(project):
         install_node = project.bld.root.make_node(project.install_task.get_install_path())
         project.install_task.outputs.extend([install_node.make_node(symbols_file.name) for symbols_file in symbols_files])
 
+## Precompiles the header given by the 'pch' attribute of a C++ project and
+## includes it in every C++ file of the project. Headers that are included by
+## every file, such as the standard library or SFML, are then parsed once per
+## project rather than once per file.
+##
+## The header is precompiled with the same flags as the files of the project,
+## which each compiler requires. It is precompiled again whenever the header or
+## any of the headers it includes change, and all files of the project are then
+## recompiled.
+## \param[in,out] project - The project may specify the 'pch' attribute, which
+## is the path of the header relative to the project. The task precompiling the
+## header is stored in the 'pch_task' attribute.
+@feature('cxx')
+@after_method('apply_link')
+@after_method('apply_incpaths')
+def ApplyPrecompiledHeader(project):
+    # CHECK IF A PRECOMPILED HEADER IS REQUESTED.
+    pch = getattr(project, 'pch', None)
+    if not pch:
+        return
+
+    # CHECK IF THERE ARE ANY C++ FILES TO INCLUDE THE HEADER IN.
+    compiled_tasks = [
+        compiled_task for compiled_task in getattr(project, 'compiled_tasks', [])
+        if isinstance(compiled_task, cxx.cxx)]
+    if not compiled_tasks:
+        return
+
+    # DETERMINE HOW THE COMPILER PRECOMPILES HEADERS.
+    # GCC finds a precompiled header while searching the include paths for the
+    # included header, while Clang and Visual Studio are given the precompiled
+    # header directly. GCC searches the directory of the precompiled header
+    # first, and falls back to the header itself if the precompiled header
+    # cannot be used.
+    # Visual Studio can only precompile headers included by a source file, and
+    # the object file it produces must be linked into the project.
+    header_node = project.to_nodes([pch])[0]
+    pch_dir = project.path.get_bld().make_node('pch.{}'.format(project.idx))
+    pch_env = project.env.derive()
+    compile_env = project.env.derive()
+    using_gcc = ('gcc' == project.env.CXX_NAME)
+    using_clang = ('clang' == project.env.CXX_NAME)
+    using_visual_studio = ('msvc' == project.env.CXX_NAME)
+    if using_gcc:
+        pch_source_node = header_node
+        pch_node = pch_dir.find_or_declare(header_node.name + '.gch')
+        pch_outputs = [pch_node]
+        pch_env.CXX_PCH_CREATE_F = ['-x', 'c++-header']
+        compile_env.append_value('CXXFLAGS', [
+            '-Winvalid-pch',
+            '-iquote', pch_dir.abspath(),
+            '-iquote', header_node.parent.abspath(),
+            '-include', header_node.name])
+    elif using_clang:
+        pch_source_node = header_node
+        pch_node = pch_dir.find_or_declare(header_node.name + '.pch')
+        pch_outputs = [pch_node]
+        pch_env.CXX_PCH_CREATE_F = ['-x', 'c++-header']
+        compile_env.append_value('CXXFLAGS', ['-include-pch', pch_node.abspath()])
+    elif using_visual_studio:
+        pch_source_node = pch_dir.find_or_declare(header_node.name + '.cpp')
+        pch_source_task = project.create_task(UnityBatchTask.__name__, [], pch_source_node)
+        pch_source_task.batch_nodes = [header_node]
+        pch_node = pch_dir.find_or_declare(header_node.name + '.pch')
+        pch_object_node = pch_dir.find_or_declare(header_node.name + '.obj')
+        pch_outputs = [pch_object_node, pch_node]
+        pch_env.CXX_PCH_CREATE_F = ['/Yc' + header_node.abspath(), '/Fp' + pch_node.abspath()]
+        compile_env.append_value('CXXFLAGS', [
+            '/Yu' + header_node.abspath(),
+            '/FI' + header_node.abspath(),
+            '/Fp' + pch_node.abspath()])
+        if getattr(project, 'link_task', None):
+            project.link_task.inputs.append(pch_object_node)
+    else:
+        raise WafError('Precompiled headers are not supported by the C++ compiler: {}'.format(project.env.CXX_NAME))
+
+    # PRECOMPILE THE HEADER.
+    project.pch_task = project.create_task('CxxPrecompiledHeaderTask', pch_source_node, pch_outputs, env = pch_env)
+
+    # INCLUDE THE PRECOMPILED HEADER IN EVERY C++ FILE.
+    for compiled_task in compiled_tasks:
+        compiled_task.env = compile_env
+        compiled_task.dep_nodes.append(pch_node)
+
+## Precompiles a C++ header. The header is compiled like any other C++ file of
+## the project, except that the compiler is told to precompile it. The headers
+## it includes are found by the C++ preprocessor.
+class CxxPrecompiledHeaderTask(cxx.cxx):
+    run_str = '${CXX} ${ARCH_ST:ARCH} ${CXXFLAGS} ${FRAMEWORKPATH_ST:FRAMEWORKPATH} ${CPPPATH_ST:INCPATHS} ${DEFINES_ST:DEFINES} ${CXX_PCH_CREATE_F} ${CXX_SRC_F}${SRC} ${CXX_TGT_F}${TGT[0].abspath()} ${CPPFLAGS}'
+
+    ## The action displayed in the build log.
+    def keyword(self):
+        return 'Precompiling'
+
 ## Applies custom manifests to the given project, mainly for GUI applications.
 ## Only applies to Visual Studio projects. The method must be run after the link
 ## tasks are created or else the output executable will not be known.
@@ -182,7 +391,7 @@ def ApplyCustomManifests(project):
 
     # ADD A SUB-TASK TO APPLY THE CUSTOM MANIFESTS.
     project.manifest_files = manifest_files
-    AddSubTask(project.link_task, ApplyCustomManifestsSubTask)
+    AddSubTask(project.link_task, ApplyCustomManifestsSubTask, name = 'mt')
 
 ## Custom manifests to an exe or DLL.
 ## See the feature method for more information on how the custom manifests are applied.
@@ -0,0 +1,243 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import re
+import sys
+import tempfile
+import threading
+
+from waflib import Context
+from waflib import Logs
+from waflib.TaskGen import after_method
+from waflib.TaskGen import feature
+from waflib.Tools import c
+from waflib.Tools import cxx
+
+## \package Waf.Compilation.CompilerDependencies
+## This package gets the header dependencies of C and C++ files from the compiler instead of Waf's
+## custom preprocessor. It is enabled by configuring with --compiler-dependencies.
+##
+## The compiler writes the headers it includes while it compiles each file: GCC and Clang write them
+## to a dependency file given by the -MMD flag, and Visual Studio prints them when given the
+## /showIncludes flag, after which they are written to a dependency file in the same format. The
+## dependency file is an output of the compilation task, so it is restored along with the object
+## file by the compilation cache. The headers are stored in the build state and are used to decide
+## whether a file must be compiled again, so the custom preprocessor does not run on incremental or
+## no-op builds.
+##
+## A file that has never been compiled has no dependency file yet. Its headers are found by the
+## custom preprocessor, so that its signature covers its headers before it is first compiled, which
+## the compilation cache relies on. Headers outside the code base are ignored, as they are by the
+## custom preprocessor.
+
+## The prefix of the lines printed by Visual Studio for each included header. The compiler is run in
+## English so that the lines can be recognized.
+SHOW_INCLUDES_PREFIX = 'Note: including file:'
+
+## Guards the node tree, which is updated by the parallel task consumers when dependencies are found.
+_node_lock = threading.Lock()
+
+## Declares the dependency file written by each compilation task as one of its outputs. The file is
+## stored in the 'dependency_file_node' attribute of the task.
+## \param[in,out] project - The compilation tasks are created by the 'process_source' method, and the
+##      task precompiling a header is created by the 'ApplyPrecompiledHeader' method.
+@feature('c','cxx')
+@after_method('process_source')
+@after_method('ApplyPrecompiledHeader')
+def DeclareDependencyFileOutputs(project):
+    # CHECK IF THE DEPENDENCIES ARE FOUND BY THE COMPILER.
+    if not project.env.COMPILER_DEPENDENCIES:
+        return
+
+    # ADD THE DEPENDENCY FILES TO THE COMPILATION TASKS.
+    # The compiler names the dependency file after the first output of the task.
+    compiled_tasks = list(getattr(project, 'compiled_tasks', []))
+    pch_task = getattr(project, 'pch_task', None)
+    if pch_task:
+        compiled_tasks.append(pch_task)
+    for compiled_task in compiled_tasks:
+        compiled_task.dependency_file_node = compiled_task.outputs[0].change_ext('.d')
+        compiled_task.outputs.append(compiled_task.dependency_file_node)
+
+## Reads the dependencies listed by a dependency file in the Make format.
+## \param[in] dependency_file_text - The contents of the dependency file.
+## \return The paths of the dependencies, as written by the compiler.
+def ParseDependencyFile(dependency_file_text):
+    # FIND THE DEPENDENCIES OF THE FIRST RULE.
+    # The dependencies may be split across several lines. The target may be an absolute Windows path,
+    # so it ends at the first colon followed by a space.
+    rule_text = dependency_file_text.replace('\\\r\n', ' ').replace('\\\n', ' ').splitlines()[0]
+    dependencies_text = re.split(r':\s', rule_text, 1)[-1]
+
+    # SPLIT THE DEPENDENCIES.
+    # Spaces within paths are escaped.
+    dependency_paths = []
+    for escaped_path in re.split(r'(?<!\\)\s+', dependencies_text.strip()):
+        if escaped_path:
+            dependency_paths.append(escaped_path.replace('\\ ', ' ').replace('\\#', '#').replace('$$', '$'))
+    return dependency_paths
+
+## Writes a dependency file in the Make format.
+## \param[in] dependency_file_node - The dependency file to write.
+## \param[in] target_node - The file depending on the dependencies.
+## \param[in] dependency_paths - The paths of the dependencies.
+def WriteDependencyFile(dependency_file_node, target_node, dependency_paths):
+    escape_path = lambda path: path.replace(' ', '\\ ')
+    dependency_lines = [' {} \\\n'.format(escape_path(dependency_path)) for dependency_path in dependency_paths]
+    dependency_file_node.write('{}: \\\n{}\n'.format(escape_path(target_node.abspath()), ''.join(dependency_lines)))
+
+## Records the headers found by the compiler as the implicit dependencies of a task that has just
+## been run or restored from the compilation cache.
+## \param[in] task - The compilation task. Its dependency file exists.
+def RecordCompilerDependencies(task):
+    # READ THE DEPENDENCY FILE.
+    # Relative paths are relative to the directory in which the compiler was run.
+    build_context = task.generator.bld
+    dependency_paths = ParseDependencyFile(task.dependency_file_node.read())
+    task_dir_path = task.get_cwd().abspath()
+
+    # FIND THE NODES OF THE HEADERS.
+    # The inputs of the task are already part of its signature.
+    header_nodes = []
+    with _node_lock:
+        for dependency_path in dependency_paths:
+            header_path = os.path.normpath(os.path.join(task_dir_path, dependency_path))
+            header_node = build_context.root.find_node(header_path)
+            is_in_code_base = header_node and (
+                header_node.is_child_of(build_context.srcnode) or
+                header_node.is_child_of(build_context.bldnode))
+            if is_in_code_base and (header_node not in task.inputs) and (header_node not in header_nodes):
+                header_nodes.append(header_node)
+
+    # STORE THE DEPENDENCIES IN THE BUILD STATE.
+    # The signature is computed again with the new dependencies when it is stored.
+    task_key = task.uid()
+    build_context.node_deps[task_key] = header_nodes
+    build_context.raw_deps[task_key] = []
+    try:
+        del task.cache_sig
+    except AttributeError:
+        pass
+    Logs.debug('deps: compiler dependencies for {}: {}'.format(task, header_nodes))
+
+## Adds the headers found by the compiler the last time a task was run to its signature.
+## \param[in,out] task - The compilation task. Its dependencies have been recorded.
+def SignCompilerDependencies(task):
+    try:
+        task.compute_sig_implicit_deps()
+    except EnvironmentError:
+        # FORGET THE DEPENDENCIES IF A HEADER WAS DELETED.
+        # The task is run again, which finds the current dependencies.
+        build_context = task.generator.bld
+        with _node_lock:
+            for header_node in build_context.node_deps.get(task.uid(), []):
+                if not header_node.is_bld() and not header_node.exists():
+                    header_node.parent.children.pop(header_node.name, None)
+        build_context.node_deps[task.uid()] = []
+
+## Runs a Visual Studio command that shows the headers it includes, writing the headers to the
+## dependency file of the task instead of the build log.
+## \param[in] task - The compilation task.
+## \param[in] execute_command - Runs the command.
+## \param[in] command - The command to run.
+## \param[in] command_arguments - The keyword arguments of the command.
+## \return The exit code of the command.
+def ExecuteWithShowIncludes(task, execute_command, command, command_arguments):
+    # RUN THE COMMAND.
+    # The output of the compiler is redirected to a file, since it is printed by Waf otherwise.
+    environment = dict(command_arguments.get('env') or task.env.env or os.environ)
+    environment['VSLANG'] = '1033'
+    command_arguments['env'] = environment
+    output_file = tempfile.TemporaryFile()
+    try:
+        command_arguments['stdout'] = output_file
+        exit_code = execute_command(task, command, **command_arguments)
+        output_file.seek(0)
+        output = output_file.read().decode(Context.default_encoding, 'replace')
+    finally:
+        output_file.close()
+
+    # SEPARATE THE HEADERS FROM THE REST OF THE OUTPUT.
+    header_paths = []
+    output_lines = []
+    for output_line in output.splitlines():
+        if output_line.startswith(SHOW_INCLUDES_PREFIX):
+            header_paths.append(output_line[len(SHOW_INCLUDES_PREFIX):].strip())
+        else:
+            output_lines.append(output_line)
+
+    # PRINT THE REST OF THE OUTPUT.
+    # Visual Studio prints the name of the file it compiles, which is not worth showing.
+    source_names = set(input_node.name for input_node in task.inputs)
+    output_lines = [output_line for output_line in output_lines if output_line.strip() not in source_names]
+    if output_lines:
+        Logs.info('\n'.join(output_lines), extra = {'stream': sys.stdout, 'c1': ''})
+
+    # WRITE THE DEPENDENCY FILE.
+    # The headers are written relative to the directory in which the compiler was run, like GCC does,
+    # so that the file can be restored by the compilation cache in another checkout. Headers on
+    # another drive cannot be made relative.
+    if 0 == exit_code:
+        task_dir_path = task.get_cwd().abspath()
+        relative_header_paths = []
+        for header_path in header_paths:
+            try:
+                relative_header_paths.append(os.path.relpath(header_path, task_dir_path))
+            except ValueError:
+                relative_header_paths.append(header_path)
+        WriteDependencyFile(task.dependency_file_node, task.outputs[0], relative_header_paths)
+    return exit_code
+
+## Patches a compilation task class to use the headers found by the compiler. The class is patched
+## rather than replaced, so tasks that derive from it (such as the task precompiling a header) use
+## the compiler as well.
+## \param[in,out] task_class - The task class to patch.
+def PatchCompilationTaskClass(task_class):
+    # SIGN THE HEADERS FOUND BY THE COMPILER.
+    # Tasks that have not been run yet are scanned by the custom preprocessor.
+    old_sig_implicit_deps = task_class.sig_implicit_deps
+    def sig_implicit_deps(self):
+        dependencies_recorded = (self.uid() in self.generator.bld.node_deps)
+        uses_compiler_dependencies = self.env.COMPILER_DEPENDENCIES and hasattr(self, 'dependency_file_node')
+        if uses_compiler_dependencies and dependencies_recorded:
+            return SignCompilerDependencies(self)
+        return old_sig_implicit_deps(self)
+    task_class.sig_implicit_deps = sig_implicit_deps
+
+    # RECORD THE HEADERS FOUND BY THE COMPILER.
+    # They are recorded before the signature of the task is stored. A missing dependency file is
+    # reported as a missing output by the original method.
+    old_post_run = task_class.post_run
+    def post_run(self):
+        dependency_file_node = getattr(self, 'dependency_file_node', None)
+        if dependency_file_node and dependency_file_node.exists():
+            RecordCompilerDependencies(self)
+        return old_post_run(self)
+    task_class.post_run = post_run
+
+    # CAPTURE THE HEADERS SHOWN BY VISUAL STUDIO.
+    old_exec_command = task_class.exec_command
+    def exec_command(self, command, **command_arguments):
+        shows_includes = hasattr(self, 'dependency_file_node') and ('/showIncludes' in command)
+        if shows_includes:
+            return ExecuteWithShowIncludes(self, old_exec_command, command, command_arguments)
+        return old_exec_command(self, command, **command_arguments)
+    task_class.exec_command = exec_command
+
+    # SHOW THE TASKS AS COMPILING.
+    # Waf shows tasks with more than one output as processing, but the dependency file is only a
+    # by-product of the compilation.
+    old_keyword = task_class.keyword
+    def keyword(self):
+        if hasattr(self, 'dependency_file_node') and (1 == len(self.inputs)):
+            return 'Compiling'
+        return old_keyword(self)
+    task_class.keyword = keyword
+
+# Find the dependencies of C and C++ files with the compiler. The patches must only be applied once
+# even if this module is loaded more than once.
+for _task_class in (c.c, cxx.cxx):
+    _task_class_is_patched = getattr(_task_class, 'uses_compiler_dependencies', False)
+    if not _task_class_is_patched:
+        PatchCompilationTaskClass(_task_class)
+        _task_class.uses_compiler_dependencies = True
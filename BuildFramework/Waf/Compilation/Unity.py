@@ -0,0 +1,138 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict
+import os
+
+from waflib.Errors import WafError
+from waflib.Task import Task
+from waflib.TaskGen import before_method
+from waflib.TaskGen import feature
+
+## \package Waf.Compilation.Unity
+## This package adds unity builds for C and C++ projects. A unity build combines the source files of
+## a project into a few generated source files that include the originals. Each header is parsed once
+## per combined file instead of once per source file, which makes clean builds of large libraries
+## much faster.
+##
+## ~~~ {.py}
+## ## Demonstrates how a library is built as a unity build.
+## def build(bld):
+##     bld.stlib(
+##         features = 'unity',
+##         source = bld.path.ant_glob('Code/**/*.cpp'),
+##         # Each combined file includes at most 16 source files...
+##         unity_batch_size = 16,
+##         # ...and at most 512 KiB of source code.
+##         unity_batch_bytes = 512 * 1024,
+##         # Source files that cannot be combined with others are compiled on their own.
+##         unity_exclude = ['Code/Conflicting.cpp'],
+##         target = 'MyLibrary')
+## ~~~
+##
+## Source files that define the same names with internal linkage, or that leak macros into the files
+## that follow them, conflict when they are combined. Such files must be excluded.
+
+## The extensions of the source files that can be combined.
+UNITY_EXTENSIONS = ['.c', '.cc', '.cpp', '.cxx']
+
+## The number of source files combined into each file, unless the project specifies a size.
+DEFAULT_UNITY_BATCH_SIZE = 8
+
+## Replaces the source files of a project with combined source files. The combined files are generated
+## in the build directory of the project.
+## \param[in,out] project - The project may specify the 'unity_batch_size', 'unity_batch_bytes' and
+##      'unity_exclude' attributes. The original source files are stored in the
+##      'unity_original_source' attribute.
+@feature('unity')
+@before_method('process_source')
+def ApplyUnityBuild(project):
+    # GET THE BATCH LIMITS.
+    batch_size = getattr(project, 'unity_batch_size', DEFAULT_UNITY_BATCH_SIZE)
+    batch_bytes = getattr(project, 'unity_batch_bytes', 0)
+    if batch_size < 1:
+        raise WafError('The unity batch size of {} must be at least 1.'.format(project.name))
+
+    # SORT THE SOURCE FILES.
+    # Files of different languages are combined separately. Files that are excluded or that cannot be
+    # compiled are left as they are.
+    source_nodes = project.to_nodes(getattr(project, 'source', []))
+    excluded_nodes = set(project.to_nodes(getattr(project, 'unity_exclude', [])))
+    project.unity_original_source = source_nodes
+    nodes_by_extension = OrderedDict()
+    remaining_source_nodes = []
+    for source_node in source_nodes:
+        can_combine = (source_node.suffix() in UNITY_EXTENSIONS) and (source_node not in excluded_nodes)
+        if can_combine:
+            nodes_by_extension.setdefault(source_node.suffix(), []).append(source_node)
+        else:
+            remaining_source_nodes.append(source_node)
+
+    # COMBINE THE SOURCE FILES.
+    # The batches are formed in the order in which the source files are given, so adding a source
+    # file only changes the batches that follow it.
+    unity_nodes = []
+    project_name = project.name.replace(os.sep, '_').replace('/', '_')
+    for extension, nodes in nodes_by_extension.items():
+        for batch_nodes in GetBatches(nodes, batch_size, batch_bytes):
+            unity_file_name = '{}.unity.{}{}'.format(project_name, len(unity_nodes), extension)
+            unity_node = project.path.get_bld().find_or_declare(unity_file_name)
+            unity_task = project.create_task('UnityBatchTask', [], unity_node)
+            unity_task.batch_nodes = batch_nodes
+            unity_nodes.append(unity_node)
+
+    # COMPILE THE COMBINED FILES INSTEAD OF THE ORIGINALS.
+    project.source = unity_nodes + remaining_source_nodes
+
+## Splits source files into batches.
+## \param[in] nodes - The source files to split.
+## \param[in] batch_size - The maximum number of files in each batch.
+## \param[in] batch_bytes - The maximum total size of the files in each batch, or zero for no limit. A
+##      file larger than the limit is placed in a batch of its own.
+## \return The source files of each batch.
+def GetBatches(nodes, batch_size, batch_bytes):
+    batches = []
+    current_batch = []
+    current_batch_bytes = 0
+    for node in nodes:
+        # START A NEW BATCH IF THE CURRENT BATCH IS FULL.
+        node_bytes = os.path.getsize(node.abspath()) if batch_bytes else 0
+        batch_full = current_batch and (
+            (len(current_batch) >= batch_size) or
+            (batch_bytes and (current_batch_bytes + node_bytes > batch_bytes)))
+        if batch_full:
+            batches.append(current_batch)
+            current_batch = []
+            current_batch_bytes = 0
+
+        # ADD THE FILE TO THE CURRENT BATCH.
+        current_batch.append(node)
+        current_batch_bytes += node_bytes
+
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+## Generates a source file that includes a batch of source files.
+class UnityBatchTask(Task):
+    ## Writes the combined source file.
+    def run(self):
+        self.outputs[0].write(self.GetContents())
+
+    ## The combined source file only depends on the paths of the files in the batch. Changes to the
+    ## files themselves are found by scanning the combined file when it is compiled.
+    def sig_vars(self):
+        super(UnityBatchTask, self).sig_vars()
+        self.m.update(self.GetContents().encode('utf-8'))
+
+    ## Returns the contents of the combined source file. The files are included relative to the
+    ## combined file, so the contents do not depend on where the code base is checked out.
+    def GetContents(self):
+        unity_dir = self.outputs[0].parent
+        include_lines = [
+            '#include "{}"\n'.format(batch_node.path_from(unity_dir).replace('\\', '/'))
+            for batch_node in self.batch_nodes]
+        return '// Generated by the unity feature. Do not edit.\n' + ''.join(include_lines)
+
+    ## The action displayed in the build log.
+    def keyword(self):
+        return 'Combining'
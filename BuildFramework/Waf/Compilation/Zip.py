@@ -10,6 +10,8 @@ from waflib.TaskGen import after_method
 from waflib.TaskGen import before_method
 from waflib.TaskGen import feature
 
+from Waf.Utilities.GlobCache import CachedAntGlob
+
 ## \package Waf.Compilation.Zip
 ## This package provides an interface for creating zip files.
 ## The following examples show how to create a zip file using source
@@ -162,7 +164,7 @@ class ZipBuildTask(Task.Task):
             # WRITE ANY SPECIFIED DIRECTORIES TO THE ZIP ARCHIVE.
             for source_directory_node in waf_project.source_dirs:
                 # Get all files in this directory.
-                files_in_directory = source_directory_node.ant_glob('**/*')
+                files_in_directory = CachedAntGlob(source_directory_node, '**/*')
                 for file in files_in_directory:
                     # Get the path to this file.
                     absolute_filepath = file.abspath()
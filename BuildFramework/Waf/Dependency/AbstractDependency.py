@@ -1,6 +1,8 @@
 from __future__ import absolute_import, division, print_function
 
+from waflib import Build
 from waflib import Errors
+from waflib import Task
 from waflib import Utils
 from waflib.TaskGen import after_method
 from waflib.TaskGen import before_method
@@ -26,6 +28,11 @@ from waflib.TaskGen import feature
 ## \endcode
 ##
 ## The build logs will show "Project A" before "Project B"
+##
+## Each dependency project summarizes its outputs in a single stamp file. The
+## tasks of the dependent project depend on the stamp instead of every output,
+## so a dependency between projects with P and Q tasks adds P + Q edges rather
+## than P * Q edges.
 
 ## Adds a dependency on all specified projects. All outputs of the specified
 ## projects are written before any task of the current project.
@@ -54,8 +61,63 @@ def AddAbstractDependencies(project):
         dependency_projects.append(dependency_project)
 
     # ADD THE DEPENDENCIES.
+    # Dependencies without outputs cannot be waited on.
     for dependency_project in dependency_projects:
-        for dependency_task in dependency_project.tasks:
-            for task in project.tasks:
-                task.dep_nodes.extend(dependency_task.outputs)
+        outputs_stamp_node = GetProjectOutputsStamp(dependency_project)
+        if not outputs_stamp_node:
+            continue
+        for task in project.tasks:
+            if outputs_stamp_node not in task.dep_nodes:
+                task.dep_nodes.append(outputs_stamp_node)
+
+## Returns the stamp summarizing all outputs of the given project. The stamp is
+## created on first use and shared by all dependent projects.
+## \param[in,out] project - The posted project to summarize. The stamp is
+## stored in the 'outputs_stamp_node' attribute.
+## \return The stamp node, or None if the project has no outputs.
+def GetProjectOutputsStamp(project):
+    # CHECK IF THE STAMP HAS ALREADY BEEN CREATED.
+    try:
+        return project.outputs_stamp_node
+    except AttributeError:
+        pass
+
+    # GATHER THE OUTPUTS OF THE PROJECT.
+    # Installed files are only written by the install command and are never
+    # consumed by other projects.
+    project_outputs = []
+    gathered_outputs = set()
+    for task in project.tasks:
+        is_installation_task = isinstance(task, Build.inst)
+        if is_installation_task:
+            continue
+        for output in task.outputs:
+            if output not in gathered_outputs:
+                gathered_outputs.add(output)
+                project_outputs.append(output)
+
+    # CREATE THE STAMP.
+    if project_outputs:
+        stamp_node = project.path.find_or_declare(project.name + '.outputs.stamp')
+        project.create_task('ProjectOutputsStamp', project_outputs, stamp_node)
+        project.outputs_stamp_node = stamp_node
+    else:
+        project.outputs_stamp_node = None
+    return project.outputs_stamp_node
+
+## Writes a stamp file that changes whenever any output of a project changes.
+## The inputs of the task are the outputs of the project, so the task runs
+## after all tasks of the project and the signature of the task summarizes
+## the signatures of all outputs.
+class ProjectOutputsStamp(Task.Task):
+    # Identifies the task so that it is not mistaken for a project output.
+    is_project_outputs_stamp = True
+
+    ## Stamps are internal bookkeeping, so they are not shown in the build logs.
+    def display(self):
+        return ''
 
+    ## Writes the signature of the project outputs to the stamp file.
+    def run(self):
+        self.outputs[0].write(Utils.to_hex(self.signature()))
+        return 0
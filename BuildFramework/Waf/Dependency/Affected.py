@@ -0,0 +1,168 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+
+from waflib import Context
+from waflib import Errors
+from waflib import Logs
+from waflib import Options
+from waflib import Utils
+from waflib.Build import BuildContext
+
+from Waf.Dependency.DependencyGraph import GetDependencyGraph
+from Waf.Utilities import GetAllProjects
+
+## \package Waf.Dependency.Affected
+## This package defines the 'affected' command, which finds the projects that must be rebuilt when a
+## set of files changes. Continuous integration jobs can use it to build and prove only the affected
+## projects rather than the whole code base.
+##
+## A changed file affects a project if it is one of the project's source files, is below one of the
+## project's include directories, or is the Waf script that defines the project. A deleted file is
+## no longer found by the Waf scripts, so it affects the projects defined by the nearest Waf script
+## above it. Changes to the build framework or the root Waf script affect all projects. All children
+## of an affected project are affected as well.
+
+## Adds the options for the affected command.
+## \param[in] options_context - The options context is shared by all user defined options methods.
+def options(options_context):
+    # CREATE AN OPTION GROUP FOR THE AFFECTED OPTIONS.
+    affected_option_group = options_context.add_option_group("Affected options")
+
+    # LOAD THE COMMAND LINE ARGUMENTS.
+    affected_option_group.add_option(
+        '--changed-files',
+        action = 'store',
+        default = '-',
+        help = 'A file listing the changed paths, one per line. The paths are read from standard input by default.')
+
+## Prints the projects affected by a list of changed files.
+class AffectedContext(BuildContext):
+    '''prints the projects that must be rebuilt for the changed files given on standard input'''
+    cmd = 'affected'
+
+    # Finds the affected projects. The method disables the actual build.
+    def execute_build(self):
+        # READ THE CHANGED PATHS.
+        changed_paths = ReadChangedPaths(Options.options.changed_files, self.launch_dir)
+
+        # FIND THE PROJECTS DIRECTLY AFFECTED BY THE CHANGES.
+        dependency_graph = GetDependencyGraph(self)
+        projects = GetAllProjects(self)
+        directly_affected_project_names = GetDirectlyAffectedProjectNames(self, projects, changed_paths)
+
+        # FIND ALL CHILDREN OF THE AFFECTED PROJECTS.
+        # The children are found using the shared reverse closure of the dependency graph.
+        affected_project_names = set(directly_affected_project_names)
+        for project_name in directly_affected_project_names:
+            affected_project_names.update(dependency_graph.GetAllChildren(project_name))
+
+        # PRINT THE AFFECTED PROJECTS.
+        # Children may be referenced without being defined, so only defined projects are printed.
+        for project_name in sorted(affected_project_names):
+            if dependency_graph.HasProject(project_name):
+                Logs.info(project_name)
+
+## Reads the changed paths from the given file.
+## \param[in] changed_files_path - The path of the file listing the changed paths, or '-' for
+##      standard input.
+## \param[in] launch_dir_path - The directory relative paths are resolved against.
+## \return The absolute, normalized changed paths.
+def ReadChangedPaths(changed_files_path, launch_dir_path):
+    # READ THE LINES OF THE FILE.
+    try:
+        if ('-' == changed_files_path):
+            lines = sys.stdin.read().splitlines()
+        else:
+            lines = Utils.readf(changed_files_path).splitlines()
+    except EnvironmentError as error:
+        raise Errors.WafError('Could not read the changed files: {}'.format(error))
+
+    # NORMALIZE THE PATHS.
+    changed_paths = set()
+    for line in lines:
+        changed_path = line.strip()
+        if changed_path:
+            changed_paths.add(os.path.normpath(os.path.join(launch_dir_path, changed_path)))
+    return changed_paths
+
+## Returns the projects that are directly affected by the changed paths.
+## \param[in] command_context - The context of the current command.
+## \param[in] projects - All projects in the code base. The projects do not need to be posted.
+## \param[in] changed_paths - The absolute, normalized changed paths.
+## \return The names of the projects directly affected by the changes.
+def GetDirectlyAffectedProjectNames(command_context, projects, changed_paths):
+    # INDEX THE FILES AND DIRECTORIES OF EACH PROJECT.
+    # The index is built once, so each changed path is only looked up in the index.
+    project_names_by_source_path = Utils.defaultdict(set)
+    project_names_by_include_dir_path = Utils.defaultdict(set)
+    project_names_by_project_dir_path = Utils.defaultdict(set)
+    for project in projects:
+        for source_path in GetProjectPaths(project, 'source'):
+            project_names_by_source_path[source_path].add(project.name)
+        for include_dir_path in GetProjectPaths(project, 'includes') + GetProjectPaths(project, 'export_includes'):
+            project_names_by_include_dir_path[include_dir_path].add(project.name)
+        project_names_by_project_dir_path[project.path.abspath()].add(project.name)
+
+    # FIND THE AFFECTED PROJECTS.
+    affected_project_names = set()
+    build_framework_path = GetBuildFrameworkPath()
+    root_wscript_path = os.path.join(command_context.srcnode.abspath(), Context.WSCRIPT_FILE)
+    for changed_path in changed_paths:
+        # CHECK IF THE BUILD ITSELF CHANGED.
+        # The build framework and the root Waf script can change how any project is built.
+        build_changed = (
+            (changed_path == root_wscript_path) or
+            os.path.realpath(changed_path).startswith(build_framework_path + os.sep))
+        if build_changed:
+            return set(project.name for project in projects)
+
+        # CHECK THE SOURCE FILES OF EACH PROJECT.
+        affected_project_names.update(project_names_by_source_path.get(changed_path, ()))
+
+        # CHECK THE WAF SCRIPTS.
+        changed_file_name = os.path.basename(changed_path)
+        changed_dir_path = os.path.dirname(changed_path)
+        is_wscript = (Context.WSCRIPT_FILE == changed_file_name)
+        if is_wscript:
+            affected_project_names.update(project_names_by_project_dir_path.get(changed_dir_path, ()))
+
+        # CHECK THE DIRECTORIES CONTAINING THE PATH.
+        is_deleted = not os.path.exists(changed_path)
+        while True:
+            # CHECK THE INCLUDE DIRECTORIES.
+            affected_project_names.update(project_names_by_include_dir_path.get(changed_dir_path, ()))
+
+            # CHECK FOR THE NEAREST WAF SCRIPT ABOVE A DELETED FILE.
+            deleted_file_projects = project_names_by_project_dir_path.get(changed_dir_path) if is_deleted else None
+            if deleted_file_projects:
+                affected_project_names.update(deleted_file_projects)
+                is_deleted = False
+
+            # MOVE TO THE PARENT DIRECTORY.
+            parent_dir_path = os.path.dirname(changed_dir_path)
+            if parent_dir_path == changed_dir_path:
+                break
+            changed_dir_path = parent_dir_path
+
+    return affected_project_names
+
+## Returns the absolute paths given by an attribute of a project. The project does not need to be
+## posted, so the paths are resolved without looking up nodes.
+## \param[in] project - The project declaring the paths.
+## \param[in] attribute_name - The attribute containing paths relative to the project, or nodes.
+## \return The absolute, normalized paths.
+def GetProjectPaths(project, attribute_name):
+    paths = []
+    for item in Utils.to_list(getattr(project, attribute_name, [])):
+        if isinstance(item, str):
+            paths.append(os.path.normpath(os.path.join(project.path.abspath(), item)))
+        elif hasattr(item, 'abspath'):
+            paths.append(os.path.normpath(item.abspath()))
+    return paths
+
+## Returns the absolute path of the build framework directory.
+def GetBuildFrameworkPath():
+    waf_package_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    return os.path.dirname(waf_package_path)
@@ -1,13 +1,10 @@
 from __future__ import absolute_import, division, print_function
 
-from collections import defaultdict
-import itertools
-
 from waflib.Build import BuildContext
 from waflib import Logs
 
-from Waf.Dependency.Parents import GetImmediateParents
-from Waf.Utilities import GetTargetProjects
+from Waf.Dependency.DependencyGraph import GetDependencyGraph
+from Waf.Utilities import SelectTargetProjects
 
 ## \package Waf.Dependency.Children
 ## This package defines the 'children' command.
@@ -17,30 +14,18 @@ class Children(BuildContext):
     '''prints the top-level child dependencies of the target projects.'''
     cmd = 'children'
 
-    # Creates a parent-child lookup for all projects. This must be done in pre_build().
-    def pre_build(self):
-        # GATHER THE CHILDREN OF ALL PROJECTS.
+    # Prints the children of the target projects. The method disables the actual build.
+    def execute_build(self):
+        # LOAD THE DEPENDENCY GRAPH.
         # A project expresses parent dependencies using the 'use', 'depends_on', 'runs_after'
-        # or dynamic attribute. The children are gathered up front so that the algorithm can
-        # efficiently traverse the project tree from parent to children.
-        children_by_parent_name = defaultdict(set)
-        projects = list(itertools.chain.from_iterable(self.groups))
-        for project in projects:
-            # Get the immediate parents of the project.
-            parent_names = GetImmediateParents(project)
-
-            # Add this project as a child of its parent project.
-            for parent_name in parent_names:
-                children_by_parent_name[parent_name].add(project.name)
+        # or dynamic attribute. The graph indexes the children of all projects up front so that
+        # the algorithm can efficiently traverse the project tree from parent to children.
+        dependency_graph = GetDependencyGraph(self)
 
         # TARGET PROJECTS ARE RESTRICTED BASED ON THE COMMAND CONTEXT.
         # This provides consistent target semantics across all commands.
-        target_projects = GetTargetProjects(self)
+        target_projects = SelectTargetProjects(self, dependency_graph.GetProjectRecords(self))
 
         # PRINT CHILDREN OF SPECIFIED TARGETS.
         for project in target_projects:
-            Logs.info('{}: {}'.format(project.name, sorted(children_by_parent_name[project.name])))
-
-    # Overrides the default compile() to prevent the target projects from building.
-    def compile(self):
-        pass
+            Logs.info('{}: {}'.format(project.name, sorted(dependency_graph.GetImmediateChildren(project.name))))
@@ -0,0 +1,280 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import defaultdict
+
+from waflib import Build
+from waflib import Errors
+from waflib import Logs
+from waflib import Task
+from waflib.Build import BuildContext
+
+from Waf.Utilities.TaskHistory import GetTaskKey
+from Waf.Utilities.TaskHistory import LoadSubTaskDurations
+from Waf.Utilities.TaskHistory import LoadTaskDurations
+
+## \package Waf.Dependency.Critical
+## This package defines the 'critical' command. With enough parallel jobs, the time taken by a build
+## is bounded by the longest chain of tasks that must run one after another, rather than by the total
+## time taken by all tasks. The command finds that chain using the durations recorded by previous
+## builds, so that effort can be focused on the projects that actually bound the build time.
+##
+## The same analysis orders every build. Waf starts the ready tasks that have the most tasks waiting
+## on them first, so a long translation unit with few dependents can start last and leave every other
+## core idle at the end of the build. Each task is instead weighted by the longest chain of recorded
+## durations from its start to the end of the build, so the longest chains start first.
+
+## The task weight given to each second of recorded duration remaining after a task starts. Waf adds
+## the number of tasks waiting on a task to its weight, so a millisecond of work outweighs a single
+## waiting task.
+REMAINING_DURATION_WEIGHT_PER_SECOND = 1000
+
+## The largest task weight given for the recorded duration remaining after a task starts, which is
+## reached by chains of more than thirteen hours. Orders imposed by commands such as 'prove' are
+## derived from it so that they take precedence.
+MAX_REMAINING_DURATION_WEIGHT = 50000000
+
+## Prints the critical path of the target projects and the slack of each project. The slack of a
+## project is how much longer its tasks could take without making the build take longer. Projects
+## on the critical path have no slack.
+class CriticalPathContext(BuildContext):
+    '''prints the longest chain of tasks in the build using the durations of previous builds'''
+    cmd = 'critical'
+
+    # Analyzes the build graph. The method disables the actual build.
+    def execute_build(self):
+        # LOAD THE PROJECTS.
+        self.recurse([self.run_dir])
+        self.pre_build()
+
+        # CREATE THE TASKS.
+        # The tasks are created and ordered exactly as they are for a build, but they are not run.
+        # The build iterator yields an empty list of tasks forever once all groups are exhausted.
+        tasks = []
+        for group_tasks in self.get_build_iterator():
+            if not group_tasks:
+                break
+            tasks.extend(group_tasks)
+
+        # FIND THE CRITICAL PATH.
+        durations_by_task_key = LoadTaskDurations(self)
+        critical_path = CriticalPath(self, tasks, durations_by_task_key)
+
+        # PRINT THE CRITICAL PATH.
+        # Tasks made of several sub-tasks are broken down, so that it is clear which step is slow.
+        sub_task_durations_by_task_key = LoadSubTaskDurations(self)
+        Logs.info('Critical path: {:.2f}s of {:.2f}s total task time'.format(
+            critical_path.length,
+            critical_path.total_duration))
+        for task in critical_path.GetTasks():
+            Logs.info('    {:8.2f}s  {}: {} {}'.format(
+                critical_path.GetDuration(task),
+                getattr(task.generator, 'name', ''),
+                task.__class__.__name__,
+                task))
+            for sub_task_name, sub_task_duration in sub_task_durations_by_task_key.get(GetTaskKey(task), []):
+                Logs.info('              {:8.2f}s  {}'.format(sub_task_duration, sub_task_name))
+
+        # PRINT THE SLACK OF EACH PROJECT.
+        # The projects that bound the build time are printed first.
+        Logs.info('Slack by project:')
+        slack_by_project_name = critical_path.GetSlackByProjectName()
+        for project_name in sorted(slack_by_project_name, key = lambda name: (slack_by_project_name[name], name)):
+            Logs.info('    {:8.2f}s  {}'.format(slack_by_project_name[project_name], project_name))
+
+        # WARN ABOUT TASKS THAT HAVE NEVER BEEN RUN.
+        if critical_path.unrecorded_task_count:
+            Logs.warn('{} of {} tasks have no recorded duration. Build the target projects to record them.'.format(
+                critical_path.unrecorded_task_count,
+                len(tasks)))
+
+## Returns the tasks and task groups that must be complete before the given task runs.
+## \param[in] build_context - The context in which the task was created.
+## \param[in] task - The task whose predecessors should be found. File constraints must already
+##      have been applied.
+## \param[in] tasks_by_output - The task producing each output node.
+## \return The predecessors of the task.
+def GetTaskPredecessors(build_context, task, tasks_by_output):
+    # GATHER THE EXPLICIT PREDECESSORS.
+    # The run-after constraints include the producers of the inputs and dependent nodes.
+    predecessors = set(task.run_after)
+
+    # GATHER THE IMPLICIT PREDECESSORS.
+    # The headers found by the scanner during the previous build may be produced by other tasks.
+    for dependency_node in build_context.node_deps.get(task.uid(), []):
+        producing_task = tasks_by_output.get(dependency_node)
+        if producing_task and (producing_task is not task):
+            predecessors.add(producing_task)
+
+    return predecessors
+
+## The longest weighted path through a graph of tasks.
+class CriticalPath(object):
+    ## Finds the critical path through the given tasks.
+    ## \param[in] build_context - The context in which the tasks were created.
+    ## \param[in] tasks - The tasks of the build, with file and precedence constraints applied.
+    ## \param[in] durations_by_task_key - The recorded duration of each task, in seconds. Tasks
+    ##      without a recorded duration are assumed to take no time.
+    def __init__(self, build_context, tasks, durations_by_task_key):
+        # DETERMINE THE DURATION OF EACH TASK.
+        self.durations_by_task = {}
+        self.unrecorded_task_count = 0
+        for task in tasks:
+            duration = durations_by_task_key.get(GetTaskKey(task))
+            if duration is None:
+                self.unrecorded_task_count += 1
+                duration = 0.0
+            self.durations_by_task[task] = duration
+        self.total_duration = sum(self.durations_by_task.values())
+
+        # GATHER THE PREDECESSORS OF EACH NODE.
+        # Task groups are treated as nodes that take no time, which avoids expanding each group
+        # into an edge between every pair of tasks.
+        tasks_by_output = {}
+        for task in tasks:
+            for output in task.outputs:
+                tasks_by_output[output] = task
+        self.predecessors_by_node = {}
+        pending_nodes = list(tasks)
+        while pending_nodes:
+            node = pending_nodes.pop()
+            if node in self.predecessors_by_node:
+                continue
+            if isinstance(node, Task.TaskGroup):
+                predecessors = set(node.prev)
+            else:
+                predecessors = GetTaskPredecessors(build_context, node, tasks_by_output)
+            self.predecessors_by_node[node] = predecessors
+            pending_nodes.extend(predecessors)
+
+        # CALCULATE THE EARLIEST FINISH TIME OF EACH NODE.
+        self.topological_order = self.__GetTopologicalOrder()
+        self.earliest_finish_by_node = {}
+        self.critical_predecessor_by_node = {}
+        for node in self.topological_order:
+            earliest_start = 0.0
+            critical_predecessor = None
+            for predecessor in self.predecessors_by_node[node]:
+                predecessor_finish = self.earliest_finish_by_node[predecessor]
+                if (critical_predecessor is None) or (predecessor_finish > earliest_start):
+                    earliest_start = predecessor_finish
+                    critical_predecessor = predecessor
+            self.earliest_finish_by_node[node] = earliest_start + self.GetDuration(node)
+            self.critical_predecessor_by_node[node] = critical_predecessor
+
+        # THE LENGTH OF THE BUILD IS THE LATEST FINISH TIME.
+        self.length = max(self.earliest_finish_by_node.values()) if self.earliest_finish_by_node else 0.0
+
+        # CALCULATE THE LATEST FINISH TIME OF EACH NODE.
+        # A node must finish before any of its successors start.
+        self.latest_finish_by_node = dict((node, self.length) for node in self.topological_order)
+        for node in reversed(self.topological_order):
+            latest_start = self.latest_finish_by_node[node] - self.GetDuration(node)
+            for predecessor in self.predecessors_by_node[node]:
+                if latest_start < self.latest_finish_by_node[predecessor]:
+                    self.latest_finish_by_node[predecessor] = latest_start
+
+    ## Returns the duration of the given task or task group, in seconds.
+    def GetDuration(self, node):
+        return self.durations_by_task.get(node, 0.0)
+
+    ## Returns the length of the longest chain of tasks starting with the given task or task group,
+    ## in seconds. This is the shortest time in which the build can finish once the node starts.
+    def GetRemainingDuration(self, node):
+        return self.length - self.latest_finish_by_node[node] + self.GetDuration(node)
+
+    ## Returns the tasks on the critical path, in the order in which they run.
+    def GetTasks(self):
+        # FIND THE LAST NODE ON THE PATH.
+        if not self.earliest_finish_by_node:
+            return []
+        node = max(self.topological_order, key = lambda node: self.earliest_finish_by_node[node])
+
+        # FOLLOW THE CRITICAL PREDECESSORS BACK TO THE START OF THE BUILD.
+        critical_tasks = []
+        while node is not None:
+            if not isinstance(node, Task.TaskGroup):
+                critical_tasks.append(node)
+            node = self.critical_predecessor_by_node[node]
+        critical_tasks.reverse()
+        return critical_tasks
+
+    ## Returns the slack of each project, which is the smallest slack of any of its tasks.
+    def GetSlackByProjectName(self):
+        slack_by_project_name = {}
+        for task in self.durations_by_task:
+            project_name = getattr(task.generator, 'name', '')
+            slack = self.latest_finish_by_node[task] - self.earliest_finish_by_node[task]
+            if (project_name not in slack_by_project_name) or (slack < slack_by_project_name[project_name]):
+                slack_by_project_name[project_name] = slack
+        return slack_by_project_name
+
+    ## Orders the nodes so that every node follows all of its predecessors.
+    ## \return The ordered nodes.
+    def __GetTopologicalOrder(self):
+        # COUNT THE PREDECESSORS OF EACH NODE.
+        successors_by_node = defaultdict(list)
+        unresolved_predecessor_counts = {}
+        for node, predecessors in self.predecessors_by_node.items():
+            unresolved_predecessor_counts[node] = len(predecessors)
+            for predecessor in predecessors:
+                successors_by_node[predecessor].append(node)
+
+        # ORDER THE NODES.
+        ready_nodes = [node for node, count in unresolved_predecessor_counts.items() if not count]
+        topological_order = []
+        while ready_nodes:
+            node = ready_nodes.pop()
+            topological_order.append(node)
+            for successor in successors_by_node[node]:
+                unresolved_predecessor_counts[successor] -= 1
+                if not unresolved_predecessor_counts[successor]:
+                    ready_nodes.append(successor)
+
+        # CHECK FOR CYCLES.
+        all_nodes_ordered = (len(topological_order) == len(unresolved_predecessor_counts))
+        if not all_nodes_ordered:
+            raise Errors.WafError('The build graph contains a dependency cycle, so it has no critical path.')
+        return topological_order
+
+## Weights the given tasks so that the tasks starting the longest chains of recorded durations are
+## run first. The weight is added to any weight the tasks already have, so orders imposed by commands
+## such as 'prove' still take precedence. Tasks reused by later builds, such as those of the 'watch'
+## command, have the weight from their previous build replaced rather than added to.
+## \param[in] build_context - The context in which the tasks were created.
+## \param[in,out] tasks - The tasks of a build group, with file and precedence constraints applied.
+## \param[in] durations_by_task_key - The recorded duration of each task, in seconds.
+def PrioritizeTasksByRemainingDuration(build_context, tasks, durations_by_task_key):
+    # FIND THE CRITICAL PATH.
+    # A cycle is reported by the scheduler itself, which describes the tasks involved.
+    try:
+        critical_path = CriticalPath(build_context, tasks, durations_by_task_key)
+    except Errors.WafError:
+        return
+
+    # WEIGHT THE TASKS.
+    for task in tasks:
+        remaining_duration = critical_path.GetRemainingDuration(task)
+        previous_remaining_duration_weight = getattr(task, 'remaining_duration_weight', 0)
+        task.remaining_duration_weight = min(
+            int(remaining_duration * REMAINING_DURATION_WEIGHT_PER_SECOND),
+            MAX_REMAINING_DURATION_WEIGHT)
+        task.weight += task.remaining_duration_weight - previous_remaining_duration_weight
+
+# Weight the tasks of each build group before they are scheduled. The patch wraps the build iterator,
+# so it must only be applied once even if this module is loaded more than once.
+_build_iterator_is_patched = getattr(Build.BuildContext.get_build_iterator, 'prioritizes_tasks', False)
+if not _build_iterator_is_patched:
+    _old_get_build_iterator = Build.BuildContext.get_build_iterator
+    def _get_build_iterator(self):
+        # Execute the original method.
+        durations_by_task_key = None
+        for tasks in _old_get_build_iterator(self):
+            # The history is only loaded once there are tasks to schedule.
+            if tasks:
+                if durations_by_task_key is None:
+                    durations_by_task_key = LoadTaskDurations(self)
+                if durations_by_task_key:
+                    PrioritizeTasksByRemainingDuration(self, tasks, durations_by_task_key)
+            yield tasks
+    _get_build_iterator.prioritizes_tasks = True
+    Build.BuildContext.get_build_iterator = _get_build_iterator
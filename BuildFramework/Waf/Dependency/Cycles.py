@@ -0,0 +1,131 @@
+from __future__ import absolute_import, division, print_function
+
+from waflib import Errors
+
+from Waf.Dependency.DependencyGraph import GetDependencyGraph
+
+## \package Waf.Dependency.Cycles
+## This package detects cycles between projects before any project is posted. A cycle through the
+## 'use', 'depends_on', 'runs_after' or dynamic attributes otherwise shows up as deeply recursive
+## post() calls or as a build that never finishes.
+##
+## Cycles are found with Tarjan's strongly connected components algorithm, which visits each project
+## and each dependency once. The check uses the shared dependency graph, which is normally loaded from
+## the build cache, so it is cheap enough to run before every build.
+
+## Raises an error describing every cycle between the projects in the code base.
+## \param[in] build_context - The context of the current build.
+## \throws WafError - Thrown if any cycles are found.
+def CheckForDependencyCycles(build_context):
+    # FIND THE CYCLES.
+    dependency_graph = GetDependencyGraph(build_context)
+    cycles = FindCycles(
+        dependency_graph.GetProjectNames(),
+        dependency_graph.GetImmediateParents)
+    if not cycles:
+        return
+
+    # DESCRIBE EACH CYCLE.
+    # Each dependency in the cycle is described with the attribute that introduced it, since that is
+    # what must be changed in the Waf script to break the cycle.
+    cycle_descriptions = []
+    for cycle_project_names in cycles:
+        cycle_project_name_set = set(cycle_project_names)
+        dependency_descriptions = []
+        for project_name in cycle_project_names:
+            parent_names_by_attribute_name = dependency_graph.GetImmediateParentsByAttribute(project_name)
+            for attribute_name, parent_names in sorted(parent_names_by_attribute_name.items()):
+                for parent_name in parent_names:
+                    if parent_name in cycle_project_name_set:
+                        dependency_descriptions.append('    {} -> {} ({})'.format(project_name, parent_name, attribute_name))
+        cycle_descriptions.append(
+            'Cycle between {}:\n{}'.format(', '.join(cycle_project_names), '\n'.join(dependency_descriptions)))
+
+    error_msg = 'The project dependencies contain {} cycle(s):\n{}'.format(
+        len(cycles),
+        '\n'.join(cycle_descriptions))
+    raise Errors.WafError(error_msg)
+
+## Finds the groups of nodes that depend on each other in a directed graph.
+## \param[in] node_names - The names of the nodes in the graph.
+## \param[in] get_adjacent_names - A function returning the names of the nodes immediately reachable
+##      from the given node name. Nodes that are not in node_names are ignored.
+## \return The sorted node names of each cycle. A node that depends on itself is a cycle of one node.
+def FindCycles(node_names, get_adjacent_names):
+    cycles = []
+    for component in FindStronglyConnectedComponents(node_names, get_adjacent_names):
+        is_cycle = (len(component) > 1) or (component[0] in get_adjacent_names(component[0]))
+        if is_cycle:
+            cycles.append(sorted(component))
+    return sorted(cycles)
+
+## Finds the strongly connected components of a directed graph using Tarjan's algorithm. The
+## traversal uses an explicit stack, so deep dependency chains do not exceed the recursion limit.
+## \param[in] node_names - The names of the nodes in the graph.
+## \param[in] get_adjacent_names - A function returning the names of the nodes immediately reachable
+##      from the given node name. Nodes that are not in node_names are ignored.
+## \return The node names of each component, in reverse topological order.
+def FindStronglyConnectedComponents(node_names, get_adjacent_names):
+    node_name_set = set(node_names)
+    index_by_node_name = {}
+    low_link_by_node_name = {}
+    component_stack = []
+    on_component_stack = set()
+    components = []
+
+    # Each traversal stack entry is a node and an iterator over the adjacent nodes left to visit.
+    traversal_stack = []
+    def VisitNode(node_name):
+        index_by_node_name[node_name] = len(index_by_node_name)
+        low_link_by_node_name[node_name] = index_by_node_name[node_name]
+        component_stack.append(node_name)
+        on_component_stack.add(node_name)
+        adjacent_names = [
+            adjacent_name for adjacent_name in sorted(get_adjacent_names(node_name))
+            if adjacent_name in node_name_set]
+        traversal_stack.append((node_name, iter(adjacent_names)))
+
+    for root_node_name in sorted(node_name_set):
+        # CHECK IF THE NODE HAS ALREADY BEEN VISITED.
+        if root_node_name in index_by_node_name:
+            continue
+
+        # VISIT ALL NODES REACHABLE FROM THE ROOT.
+        VisitNode(root_node_name)
+
+        while traversal_stack:
+            node_name, adjacent_names = traversal_stack[-1]
+
+            # VISIT THE NEXT ADJACENT NODE.
+            adjacent_name = next(adjacent_names, None)
+            if adjacent_name is not None:
+                if adjacent_name not in index_by_node_name:
+                    VisitNode(adjacent_name)
+                elif adjacent_name in on_component_stack:
+                    low_link_by_node_name[node_name] = min(
+                        low_link_by_node_name[node_name],
+                        index_by_node_name[adjacent_name])
+                continue
+
+            # FINISH THE NODE.
+            # All adjacent nodes have been visited, so the node's low link is final.
+            traversal_stack.pop()
+            if traversal_stack:
+                parent_node_name = traversal_stack[-1][0]
+                low_link_by_node_name[parent_node_name] = min(
+                    low_link_by_node_name[parent_node_name],
+                    low_link_by_node_name[node_name])
+
+            # GATHER THE COMPONENT IF THE NODE IS ITS ROOT.
+            is_component_root = (low_link_by_node_name[node_name] == index_by_node_name[node_name])
+            if is_component_root:
+                component = []
+                while True:
+                    component_node_name = component_stack.pop()
+                    on_component_stack.discard(component_node_name)
+                    component.append(component_node_name)
+                    if component_node_name == node_name:
+                        break
+                components.append(component)
+
+    return components
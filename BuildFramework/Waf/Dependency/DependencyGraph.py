@@ -0,0 +1,311 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import defaultdict
+from collections import namedtuple
+import os
+import time
+
+from waflib import Build
+from waflib import ConfigSet
+from waflib import Logs
+from waflib import Utils
+
+from Waf.Dependency.DynamicAttribute import GetDynamicAttributeNames
+from Waf.Dependency.TransitiveClosure import TransitiveClosure
+from Waf.Utilities import GetAllProjects
+
+## \package Waf.Dependency.DependencyGraph
+## This package defines an index of the dependencies between all projects in the code base. The
+## index is shared by the commands that query the dependency tree (parents, children, prove).
+##
+## Gathering the parents of a project requires inspecting its task generator, so building the
+## index requires evaluating every Waf script. The index is built once per command context and
+## persisted in the build cache. It is reused by later commands until a Waf script, the directory
+## structure around the Waf scripts, or the variant configuration changes.
+
+## A lightweight stand-in for a task generator when the index is loaded from the build cache. It
+## provides the attributes used to select target projects.
+ProjectRecord = namedtuple('ProjectRecord', ['name', 'path'])
+
+## The forward and reverse adjacency between all projects in the code base.
+class DependencyGraph(object):
+    ## Creates the index from the parents of each project.
+    ## \param[in] parent_names_by_attribute_name_by_project_name - The immediate parent names of
+    ##      each project, grouped by the attribute that expresses the dependency.
+    ## \param[in] project_dirs_by_name - The directory of the Waf script that defines each project,
+    ##      relative to the root of the code base.
+    def __init__(self, parent_names_by_attribute_name_by_project_name, project_dirs_by_name):
+        self.parent_names_by_attribute_name_by_project_name = parent_names_by_attribute_name_by_project_name
+        self.project_dirs_by_name = project_dirs_by_name
+
+        # BUILD THE FORWARD AND REVERSE ADJACENCY.
+        # Parents may be referenced without being defined (for example, system libraries in 'use').
+        self.parent_names_by_project_name = defaultdict(set)
+        self.child_names_by_project_name = defaultdict(set)
+        for project_name, parent_names_by_attribute_name in parent_names_by_attribute_name_by_project_name.items():
+            for parent_names in parent_names_by_attribute_name.values():
+                self.parent_names_by_project_name[project_name].update(parent_names)
+                for parent_name in parent_names:
+                    self.child_names_by_project_name[parent_name].add(project_name)
+
+        # The transitive closures are only computed when queried.
+        self.parent_closure = None
+        self.child_closure = None
+        self.parent_closures_by_attribute_name = {}
+
+    ## Returns the names of all projects defined in the code base.
+    def GetProjectNames(self):
+        return list(self.project_dirs_by_name.keys())
+
+    ## Returns whether a project with the given name is defined in the code base.
+    def HasProject(self, project_name):
+        return (project_name in self.project_dirs_by_name)
+
+    ## Returns lightweight records for all projects, in a stable order. The records can be given to
+    ## SelectTargetProjects() in place of task generators.
+    ## \param[in] command_context - The context used to resolve the project directories.
+    def GetProjectRecords(self, command_context):
+        project_records = []
+        for project_name in sorted(self.project_dirs_by_name):
+            project_dir_path = self.project_dirs_by_name[project_name]
+            project_dir = command_context.srcnode.make_node(project_dir_path) if project_dir_path else command_context.srcnode
+            project_records.append(ProjectRecord(name = project_name, path = project_dir))
+        return project_records
+
+    ## Returns the immediate parent names of the given project.
+    def GetImmediateParents(self, project_name):
+        return set(self.parent_names_by_project_name.get(project_name, set()))
+
+    ## Returns the immediate parent names of the given project, grouped by dependency attribute.
+    def GetImmediateParentsByAttribute(self, project_name):
+        return self.parent_names_by_attribute_name_by_project_name.get(project_name, {})
+
+    ## Returns the immediate child names of the given project.
+    def GetImmediateChildren(self, project_name):
+        return set(self.child_names_by_project_name.get(project_name, set()))
+
+    ## Returns the names of all direct and indirect parents of the given project.
+    def GetAllParents(self, project_name):
+        return self.GetParentClosure().GetReachableNames(project_name)
+
+    ## Returns the names of all direct and indirect children of the given project.
+    def GetAllChildren(self, project_name):
+        return self.GetChildClosure().GetReachableNames(project_name)
+
+    ## Returns the transitive closure over the parents of each project. The closure is computed for
+    ## all projects on first use and shared by later queries.
+    def GetParentClosure(self):
+        if self.parent_closure is None:
+            self.parent_closure = TransitiveClosure(
+                self.project_dirs_by_name.keys(),
+                lambda project_name: self.parent_names_by_project_name.get(project_name, ()))
+        return self.parent_closure
+
+    ## Returns the transitive closure over the parents of each project given by a single dependency
+    ## attribute. Each closure is computed for all projects on first use and shared by later queries.
+    ## \param[in] attribute_name - The attribute expressing the dependencies to follow.
+    def GetParentClosureByAttribute(self, attribute_name):
+        parent_closure = self.parent_closures_by_attribute_name.get(attribute_name)
+        if parent_closure is None:
+            parent_closure = TransitiveClosure(
+                self.project_dirs_by_name.keys(),
+                lambda project_name: self.GetImmediateParentsByAttribute(project_name).get(attribute_name, ()))
+            self.parent_closures_by_attribute_name[attribute_name] = parent_closure
+        return parent_closure
+
+    ## Returns the transitive closure over the children of each project. The closure is computed for
+    ## all projects on first use and shared by later queries.
+    def GetChildClosure(self):
+        if self.child_closure is None:
+            self.child_closure = TransitiveClosure(
+                self.project_dirs_by_name.keys(),
+                lambda project_name: self.child_names_by_project_name.get(project_name, ()))
+        return self.child_closure
+
+## Returns the immediate parents of the given project, grouped by the attribute that expresses
+## each dependency. The attribute is useful when explaining why a dependency exists.
+## \param    project - The waf task whose immediate parents should be found.
+## \return   The sorted immediate parent names of the project by dependency attribute name. Attributes
+##           without parents are excluded.
+def GetImmediateParentsByAttribute(project):
+    # GATHER THE DYNAMIC ATTRIBUTES.
+    dynamic_attribute_names = GetDynamicAttributeNames(project)
+
+    # GET THE PARENTS OF THE PROJECT.
+    # A project expresses parent dependencies using the 'use', 'depends_on', or 'runs_after'
+    # attributes, or using a dynamic attribute.
+    # The code_generator attribute is not included because it would pull in libraries that are
+    # used to build the code generator, which the target project may not actually depend on.
+    parent_names_by_attribute_name = {}
+    parent_dependency_attribute_names = (
+        ['use', 'depends_on', 'runs_after'] +
+        dynamic_attribute_names)
+    for parent_dependency_attribute_name in parent_dependency_attribute_names:
+        # GATHER THE PARENTS.
+        parent_names = set(project.to_list(getattr(
+            project, parent_dependency_attribute_name, [])))
+        if parent_names:
+            parent_names_by_attribute_name[parent_dependency_attribute_name] = sorted(parent_names)
+
+    return parent_names_by_attribute_name
+
+## Returns the dependency graph of all projects for the given command context. The graph is built
+## at most once per context. If the graph stored in the build cache is still valid, the Waf scripts
+## are not evaluated at all.
+## \param[in,out] command_context - The context of the current command. The graph is stored in its
+##      'dependency_graph' attribute.
+## \return The dependency graph of all projects.
+def GetDependencyGraph(command_context):
+    # CHECK IF THE GRAPH HAS ALREADY BEEN BUILT FOR THE CURRENT COMMAND.
+    dependency_graph = getattr(command_context, 'dependency_graph', None)
+    if dependency_graph:
+        return dependency_graph
+
+    # LOAD THE GRAPH FROM THE BUILD CACHE IF IT IS STILL VALID.
+    dependency_graph = LoadDependencyGraph(command_context)
+    if not dependency_graph:
+        # BUILD THE GRAPH FROM THE TASK GENERATORS.
+        parent_names_by_attribute_name_by_project_name = {}
+        project_dirs_by_name = {}
+        for project in GetAllProjects(command_context):
+            parent_names_by_attribute_name_by_project_name[project.name] = GetImmediateParentsByAttribute(project)
+            project_dir_path = project.path.path_from(command_context.srcnode)
+            project_dirs_by_name[project.name] = '' if (project_dir_path == '.') else project_dir_path
+        dependency_graph = DependencyGraph(parent_names_by_attribute_name_by_project_name, project_dirs_by_name)
+
+        # STORE THE GRAPH FOR LATER COMMANDS.
+        StoreDependencyGraph(command_context, dependency_graph)
+
+    # SHARE THE GRAPH WITH THE REST OF THE COMMAND.
+    command_context.dependency_graph = dependency_graph
+    return dependency_graph
+
+## Returns the path of the build cache file storing the dependency graph. Each variant has its own
+## graph because Waf scripts may declare different projects for different configurations.
+## \param[in] command_context - The context of the current command.
+def GetDependencyGraphStoragePath(command_context):
+    storage_file_name = '{}_dependency_graph.py'.format(command_context.variant or 'default')
+    return os.path.join(command_context.cache_dir, storage_file_name)
+
+## Loads the dependency graph from the build cache.
+## \param[in] command_context - The context of the current command.
+## \return The stored dependency graph, or None if it does not exist or is out of date.
+def LoadDependencyGraph(command_context):
+    # LOAD THE STORED GRAPH.
+    stored_graph = ConfigSet.ConfigSet()
+    try:
+        stored_graph.load(GetDependencyGraphStoragePath(command_context))
+    except EnvironmentError:
+        return None
+
+    # VERIFY THAT THE GRAPH IS STILL VALID.
+    # The stamps of all inputs are recalculated without evaluating any Waf scripts.
+    stored_stamps = stored_graph.stamps
+    if not stored_stamps:
+        return None
+    current_stamps = CalculateStamps(stored_stamps.keys())
+    graph_is_valid = (current_stamps == stored_stamps)
+    if not graph_is_valid:
+        Logs.debug('dependency_graph: the stored graph is out of date')
+        return None
+
+    # RETURN THE STORED GRAPH.
+    dependency_graph = DependencyGraph(
+        stored_graph.parent_names_by_attribute_name_by_project_name,
+        stored_graph.project_dirs_by_name)
+    return dependency_graph
+
+## Stores the dependency graph in the build cache. The graph is stored along with the stamps of the
+## inputs that were used to build it, so that it can be invalidated when they change.
+## \param[in] command_context - The context of the current command. The Waf scripts must have been
+##      evaluated in this context.
+## \param[in] dependency_graph - The graph to store.
+def StoreDependencyGraph(command_context, dependency_graph):
+    # GATHER THE INPUTS OF THE GRAPH.
+    # The projects are declared by the evaluated Waf scripts. The configuration of the variant can
+    # also change which projects are declared.
+    stamped_paths = set([GetVariantConfigurationPath(command_context)])
+    for wscript_node in GetEvaluatedWscripts(command_context):
+        stamped_paths.update(GetWscriptStampedPaths(command_context, wscript_node))
+
+    # STORE THE GRAPH.
+    stored_graph = ConfigSet.ConfigSet()
+    stored_graph.parent_names_by_attribute_name_by_project_name = dependency_graph.parent_names_by_attribute_name_by_project_name
+    stored_graph.project_dirs_by_name = dependency_graph.project_dirs_by_name
+    stored_graph.stamps = CalculateStamps(stamped_paths)
+    try:
+        stored_graph.store(GetDependencyGraphStoragePath(command_context))
+    except EnvironmentError:
+        Logs.warn('Could not store the dependency graph in ' + command_context.cache_dir)
+
+## Returns the path of the configuration of the current variant in the build cache.
+## \param[in] command_context - The context of the current command.
+def GetVariantConfigurationPath(command_context):
+    configuration_file_name = command_context.variant + Build.CACHE_SUFFIX
+    return os.path.join(command_context.cache_dir, configuration_file_name)
+
+## Returns the Waf script nodes that have been evaluated in the given context.
+## \param[in] command_context - The context of the current command.
+def GetEvaluatedWscripts(command_context):
+    # Waf records each evaluated Waf script to avoid evaluating it twice. A script is recorded as
+    # a node, or as a (node, function name) pair.
+    wscript_nodes = set()
+    for recursion_key in getattr(command_context, 'recurse_cache', {}):
+        wscript_node = recursion_key[0] if isinstance(recursion_key, tuple) else recursion_key
+        wscript_nodes.add(wscript_node)
+    return wscript_nodes
+
+## Returns the paths that must be stamped to detect changes to the projects declared by a Waf
+## script, other than the files it reads. Waf scripts recurse into the entries of their directory,
+## so adding a Waf script to an existing directory changes the modification time of its parent or
+## of the directory itself.
+## \param[in] command_context - The context of the current command.
+## \param[in] wscript_node - The Waf script.
+## \return The absolute paths of the Waf script, its directory and the sub-directories of its
+##      directory.
+def GetWscriptStampedPaths(command_context, wscript_node):
+    stamped_paths = [wscript_node.abspath()]
+    wscript_dir_path = wscript_node.parent.abspath()
+    stamped_paths.append(wscript_dir_path)
+    for entry_name in Utils.listdir(wscript_dir_path):
+        # Hidden directories and the build directory change frequently but never contain Waf
+        # scripts.
+        entry_path = os.path.join(wscript_dir_path, entry_name)
+        is_stamped_dir = (
+            os.path.isdir(entry_path) and
+            not entry_name.startswith('.') and
+            (os.path.abspath(entry_path) != os.path.abspath(command_context.out_dir)))
+        if is_stamped_dir:
+            stamped_paths.append(entry_path)
+    return stamped_paths
+
+## Directories modified this recently may be modified again without their modification time
+## changing, on file systems that only record the modification time to the second. Directories are
+## stamped by modification time, so their stamps cannot be trusted until this much time has passed.
+RECENT_MODIFICATION_IN_SECONDS = 2
+
+## Checks if any of the given modification times is too recent for a later change to be detected.
+## \param[in] modification_times - The modification times, in seconds since the epoch. Missing paths
+##      are given None.
+## \return True if any of the modification times is recent; false otherwise.
+def IsRecentlyModified(modification_times):
+    current_time = time.time()
+    return any(
+        (modification_time is not None) and ((current_time - modification_time) < RECENT_MODIFICATION_IN_SECONDS)
+        for modification_time in modification_times)
+
+## Calculates the stamps of the given files and directories. Files are stamped by content, and
+## directories by modification time.
+## \param[in] paths - The absolute paths to stamp.
+## \return The stamps by path. Missing paths are given an empty stamp.
+def CalculateStamps(paths):
+    stamps = {}
+    for path in paths:
+        try:
+            if os.path.isdir(path):
+                stamps[path] = repr(os.stat(path).st_mtime)
+            else:
+                stamps[path] = Utils.to_hex(Utils.h_file(path))
+        except EnvironmentError:
+            stamps[path] = ''
+    return stamps
@@ -1,10 +1,13 @@
 from __future__ import absolute_import, division, print_function
 
 from waflib import Errors
+from waflib import TaskGen
 from waflib import Utils
 from waflib.TaskGen import before_method
 from waflib.TaskGen import feature
 
+from Waf.Dependency import GetProjectOutputs
+
 ## \package Waf.Dependency.DynamicAttribute
 ## Projects may populate attributes with the outputs of other projects. To
 ## populate an attribute 'my_attr' with the outputs of a project 'MyProject',
@@ -24,6 +27,9 @@ from waflib.TaskGen import feature
 ##         dynamic_source = 'GeneratedCode',
 ##         target = 'LibraryName')
 ## \endcode
+##
+## Dynamic attributes are recorded when the project is created, so they must be
+## given as keyword arguments when the project is declared.
 
 ## Populates all target attributes with outputs of specified projects.
 ## \param[in,out] project - Target attributes are specified with the 'dynamic_'
@@ -33,11 +39,7 @@ from waflib.TaskGen import feature
 @before_method('process_rule')
 def ResolveDynamicAttributes(project):
     # GATHER THE DYNAMIC ATTRIBUTES.
-    is_dynamic_attribute = lambda attribute_name: (
-        'dynamic_' in attribute_name)
-    dynamic_attribute_names = [
-        attribute_name for attribute_name in dir(project)
-        if is_dynamic_attribute(attribute_name)]
+    dynamic_attribute_names = GetDynamicAttributeNames(project)
 
     # INITIALIZE THE PROJECT DEPENDENCIES.
     project.runs_after = Utils.to_list(getattr(project, 'runs_after', []))
@@ -61,9 +63,7 @@ def ResolveDynamicAttributes(project):
             referenced_project.post()
 
             # GATHER THE REFERENCED OUTPUTS.
-            referenced_outputs = []
-            for task in referenced_project.tasks:
-                referenced_outputs.extend(task.outputs)
+            referenced_outputs = GetProjectOutputs(referenced_project)
 
             # GET THE EXISTING TARGET ATTRIBUTE.
             target_attribute_name = dynamic_attribute_name.split('dynamic_')[1]
@@ -76,3 +76,29 @@ def ResolveDynamicAttributes(project):
             # EXTEND THE ATTRIBUTE WITH ALL REFERENCED OUTPUTS.
             target_attribute.extend(referenced_outputs)
             setattr(project, target_attribute_name, target_attribute)
+
+## Returns the names of the dynamic attributes of the given project.
+## \param[in] project - The project whose dynamic attributes were recorded when
+## it was created.
+## \return The names of the dynamic attributes, including the prefix.
+def GetDynamicAttributeNames(project):
+    return getattr(project, 'dynamic_attribute_names', [])
+
+# Record the dynamic attributes of each project when it is created. Scanning all
+# attributes of every project for the prefix is expensive, and it matches
+# unrelated attributes that only contain it. The patch wraps the existing
+# constructor, so it must only be applied once even if this module is loaded
+# more than once.
+_task_gen_init_is_patched = getattr(TaskGen.task_gen.__init__, 'records_dynamic_attributes', False)
+if not _task_gen_init_is_patched:
+    _old_task_gen_init = TaskGen.task_gen.__init__
+    def _task_gen_init(self, *args, **kwargs):
+        # Execute the original method.
+        _old_task_gen_init(self, *args, **kwargs)
+
+        # Record the dynamic attributes given as keywords.
+        self.dynamic_attribute_names = sorted(
+            attribute_name for attribute_name in kwargs
+            if attribute_name.startswith('dynamic_'))
+    _task_gen_init.records_dynamic_attributes = True
+    TaskGen.task_gen.__init__ = _task_gen_init
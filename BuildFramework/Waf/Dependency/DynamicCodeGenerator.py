@@ -8,6 +8,8 @@ from waflib.TaskGen import after_method
 from waflib.TaskGen import before_method
 from waflib.TaskGen import feature
 
+from Waf.Dependency import RunAfterProject
+
 ## \package Waf.Dependency.DynamicCodeGenerator
 ## While some code generation tools are from a third party, others are built
 ## from source. The project must ensure that the tool is built before being
@@ -109,6 +111,5 @@ def WaitForGeneratorBeforeUse(project):
     # A dependency will also regenerate the code if the executable is changed.
     for task in project.tasks:
         task.dep_nodes.append(project.code_generator_exe)
-        for code_generator_task in code_generator_project.tasks:
-            task.set_run_after(code_generator_task)
+        RunAfterProject(task, code_generator_project)
 
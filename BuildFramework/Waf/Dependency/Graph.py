@@ -0,0 +1,248 @@
+from __future__ import absolute_import, division, print_function
+
+import json
+import sys
+
+from waflib import Errors
+from waflib import Options
+from waflib import Task
+from waflib.Build import BuildContext
+
+from Waf.Dependency.DependencyGraph import GetDependencyGraph
+from Waf.Utilities import GetTargetProjects
+from Waf.Utilities.TaskHistory import GetTaskKey
+
+## \package Waf.Dependency.Graph
+## This package defines the 'graph' command, which exports the build graph for analysis by other
+## tools. The graph contains the projects with the parents given by each dependency attribute, and
+## the tasks of the projects with their input, output, and dependent nodes and run-after
+## constraints.
+##
+## Two formats are supported:
+## - JSON Lines (the default), with one record per project, task, and task group.
+## - DOT, for rendering with Graphviz. Tasks are grouped in a cluster per project.
+##
+## Records are written as soon as they are produced, so the size of the graph is not limited by the
+## memory available for the output.
+
+## Adds the options for the graph command.
+## \param[in] options_context - The options context is shared by all user defined options methods.
+def options(options_context):
+    # CREATE AN OPTION GROUP FOR THE GRAPH OPTIONS.
+    graph_option_group = options_context.add_option_group("Graph options")
+
+    # LOAD THE COMMAND LINE ARGUMENTS.
+    graph_option_group.add_option(
+        '--graph-format',
+        action = 'store',
+        choices = ['jsonl', 'dot'],
+        default = 'jsonl',
+        help = 'The format of the exported build graph (jsonl or dot).')
+    graph_option_group.add_option(
+        '--graph-file',
+        action = 'store',
+        default = '',
+        help = 'The file to write the build graph to. The graph is written to the console by default.')
+
+## Exports the build graph of the target projects and all projects they depend on.
+class GraphContext(BuildContext):
+    '''exports the projects and tasks of the target projects as JSON Lines or DOT'''
+    cmd = 'graph'
+
+    # Exports the graph. The method disables the actual build.
+    def execute_build(self):
+        # LOAD THE DEPENDENCY GRAPH.
+        # The parents are gathered before any project is posted, because posting a project adds
+        # the projects referenced by dynamic attributes to its runs-after dependencies.
+        dependency_graph = GetDependencyGraph(self)
+
+        # CREATE THE TASKS OF THE TARGET PROJECTS.
+        # Posting a project also posts the projects it depends on.
+        for project in GetTargetProjects(self):
+            project.post()
+        projects = [
+            project for group in self.groups for project in group
+            if getattr(project, 'posted', False)]
+
+        # EXPORT THE GRAPH.
+        graph_file_path = Options.options.graph_file
+        graph_file = open(graph_file_path, 'w') if graph_file_path else sys.stdout
+        try:
+            if ('dot' == Options.options.graph_format):
+                graph_writer = DotGraphWriter(self, graph_file)
+            else:
+                graph_writer = JsonLinesGraphWriter(self, graph_file)
+            WriteGraph(graph_writer, dependency_graph, projects)
+        except EnvironmentError as error:
+            raise Errors.WafError('Could not write the build graph: {}'.format(error))
+        finally:
+            if graph_file_path:
+                graph_file.close()
+
+## Writes the graph of the given projects.
+## \param[in,out] graph_writer - The writer for the graph format.
+## \param[in] dependency_graph - The dependency graph of all projects.
+## \param[in] projects - The posted projects to write.
+def WriteGraph(graph_writer, dependency_graph, projects):
+    graph_writer.WriteHeader()
+    for project in projects:
+        parent_names_by_attribute_name = dependency_graph.GetImmediateParentsByAttribute(project.name)
+        graph_writer.WriteProject(project, parent_names_by_attribute_name)
+    graph_writer.WriteTaskGroups()
+    graph_writer.WriteFooter()
+
+## Identifies the tasks and task groups of a build graph. Task groups have no identity of their own,
+## so they are numbered as they are found. The groups are written after all tasks, so only the
+## groups themselves are kept in memory.
+class GraphIds(object):
+    def __init__(self):
+        self.task_groups = []
+        self.task_group_ids_by_task_group = {}
+
+    ## Returns the ID of a task or task group.
+    def GetId(self, task_or_task_group):
+        # IDENTIFY TASKS BY THEIR UNIQUE ID.
+        if not isinstance(task_or_task_group, Task.TaskGroup):
+            return GetTaskKey(task_or_task_group)
+
+        # NUMBER THE TASK GROUP.
+        task_group_id = self.task_group_ids_by_task_group.get(task_or_task_group)
+        if task_group_id is None:
+            task_group_id = 'group:{}'.format(len(self.task_groups))
+            self.task_group_ids_by_task_group[task_or_task_group] = task_group_id
+            self.task_groups.append(task_or_task_group)
+        return task_group_id
+
+## Writes the build graph as JSON Lines. Each line is a record with a 'type' of 'project', 'task',
+## or 'group'. Nodes are given as paths relative to the root of the code base.
+class JsonLinesGraphWriter(object):
+    ## Creates the writer.
+    ## \param[in] build_context - The context of the current command.
+    ## \param[in,out] graph_file - The file to write to.
+    def __init__(self, build_context, graph_file):
+        self.build_context = build_context
+        self.graph_file = graph_file
+        self.graph_ids = GraphIds()
+
+    def WriteHeader(self):
+        pass
+
+    ## Writes a project and all of its tasks.
+    def WriteProject(self, project, parent_names_by_attribute_name):
+        # WRITE THE PROJECT.
+        self.__WriteRecord({
+            'type': 'project',
+            'name': project.name,
+            'path': project.path.path_from(self.build_context.srcnode),
+            'parents': parent_names_by_attribute_name})
+
+        # WRITE THE TASKS OF THE PROJECT.
+        for task in project.tasks:
+            self.__WriteRecord({
+                'type': 'task',
+                'id': self.graph_ids.GetId(task),
+                'project': project.name,
+                'class': task.__class__.__name__,
+                'inputs': self.__GetPaths(task.inputs),
+                'outputs': self.__GetPaths(task.outputs),
+                'dep_nodes': self.__GetPaths(task.dep_nodes),
+                'run_after': sorted(self.graph_ids.GetId(predecessor) for predecessor in task.run_after)})
+
+    ## Writes the task groups used by the tasks that have been written.
+    def WriteTaskGroups(self):
+        for task_group in self.graph_ids.task_groups:
+            self.__WriteRecord({
+                'type': 'group',
+                'id': self.graph_ids.GetId(task_group),
+                'prev': sorted(self.graph_ids.GetId(predecessor) for predecessor in task_group.prev)})
+
+    def WriteFooter(self):
+        pass
+
+    ## Returns the paths of the given nodes relative to the root of the code base.
+    def __GetPaths(self, nodes):
+        return [node.path_from(self.build_context.srcnode) for node in nodes]
+
+    ## Writes a single record on its own line.
+    def __WriteRecord(self, record):
+        self.graph_file.write(json.dumps(record, sort_keys = True))
+        self.graph_file.write('\n')
+
+## Writes the build graph in the DOT language. Projects are drawn as boxes linked to their parents,
+## and the tasks of each project are drawn in a cluster. Tasks are linked to the tasks that produce
+## their inputs (solid) and dependent nodes (dotted), and to the tasks and task groups that they run
+## after (dashed).
+class DotGraphWriter(object):
+    ## Creates the writer.
+    ## \param[in] build_context - The context of the current command.
+    ## \param[in,out] graph_file - The file to write to.
+    def __init__(self, build_context, graph_file):
+        self.build_context = build_context
+        self.graph_file = graph_file
+        self.graph_ids = GraphIds()
+
+        # INDEX THE TASK PRODUCING EACH NODE.
+        # Only the nodes and tasks already held by the build are referenced.
+        self.tasks_by_output = {}
+        for group in build_context.groups:
+            for project in group:
+                for task in getattr(project, 'tasks', []):
+                    for output in task.outputs:
+                        self.tasks_by_output[output] = task
+
+    def WriteHeader(self):
+        self.graph_file.write('digraph build {\n')
+
+    ## Writes a project and all of its tasks.
+    def WriteProject(self, project, parent_names_by_attribute_name):
+        # WRITE THE PROJECT.
+        project_id = Quote('project:' + project.name)
+        self.graph_file.write('  {} [shape=box, style=bold, label={}];\n'.format(project_id, Quote(project.name)))
+        for attribute_name, parent_names in sorted(parent_names_by_attribute_name.items()):
+            for parent_name in parent_names:
+                self.graph_file.write('  {} -> {} [label={}];\n'.format(
+                    project_id,
+                    Quote('project:' + parent_name),
+                    Quote(attribute_name)))
+
+        # WRITE THE TASKS OF THE PROJECT.
+        self.graph_file.write('  subgraph {} {{\n'.format(Quote('cluster_' + project.name)))
+        self.graph_file.write('    label={};\n'.format(Quote(project.name)))
+        for task in project.tasks:
+            self.graph_file.write('    {} [label={}];\n'.format(
+                Quote(self.graph_ids.GetId(task)),
+                Quote('{} {}'.format(task.__class__.__name__, task))))
+        self.graph_file.write('  }\n')
+
+        # WRITE THE EDGES OF THE TASKS.
+        for task in project.tasks:
+            task_id = Quote(self.graph_ids.GetId(task))
+            for edge_style, nodes in (('solid', task.inputs), ('dotted', task.dep_nodes)):
+                for node in nodes:
+                    producing_task = self.tasks_by_output.get(node)
+                    if producing_task:
+                        self.graph_file.write('  {} -> {} [style={}];\n'.format(
+                            task_id,
+                            Quote(self.graph_ids.GetId(producing_task)),
+                            edge_style))
+            for predecessor in task.run_after:
+                self.graph_file.write('  {} -> {} [style=dashed];\n'.format(
+                    task_id,
+                    Quote(self.graph_ids.GetId(predecessor))))
+
+    ## Writes the task groups used by the tasks that have been written.
+    def WriteTaskGroups(self):
+        for task_group in self.graph_ids.task_groups:
+            task_group_id = Quote(self.graph_ids.GetId(task_group))
+            self.graph_file.write('  {} [shape=point];\n'.format(task_group_id))
+            for predecessor in task_group.prev:
+                self.graph_file.write('  {} -> {} [style=dashed];\n'.format(
+                    task_group_id,
+                    Quote(self.graph_ids.GetId(predecessor))))
+
+    def WriteFooter(self):
+        self.graph_file.write('}\n')
+
+## Quotes a string as a DOT identifier.
+def Quote(text):
+    return json.dumps(text)
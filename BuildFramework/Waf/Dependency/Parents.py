@@ -5,7 +5,10 @@ from waflib import Logs
 from waflib import Options
 from waflib.Build import BuildContext
 
-from Waf.Utilities import GetTargetProjects
+from Waf.Dependency.DependencyGraph import GetDependencyGraph
+from Waf.Dependency.DependencyGraph import GetImmediateParentsByAttribute
+from Waf.Utilities import GetAllProjects
+from Waf.Utilities import SelectTargetProjects
 
 ## \package Waf.Dependency.Parents
 ## This package defines the 'parents' command and tools for gathering parents from task generators.
@@ -24,6 +27,13 @@ def options(options_context):
         default = False,
         help = 'Show all dependencies.')
 
+    # Add an option to find dependencies that are already implied by other dependencies.
+    parent_option_group.add_option(
+        '--redundant',
+        action='store_true',
+        default = False,
+        help = 'Show dependencies that are implied by other dependencies.')
+
 ## Returns the parents (immediate only, or all) of a given target project. Showing only the immediate parents
 # supports creation and maintenance of Waf scripts. It can be used to determine if a project's dependencies
 # are redundant. Showing all parents can assist in understanding the overall dependencies of a product.
@@ -36,28 +46,39 @@ class Parents(BuildContext):
 
     # Gets the parents for the target project(s). The method disables the actual build.
     def execute_build(self):
+        # LOAD THE DEPENDENCY GRAPH.
+        # The graph is shared with other dependency commands and is only rebuilt when the Waf
+        # scripts change.
+        dependency_graph = GetDependencyGraph(self)
+
         # PROJECTS ARE RESTRICTED BASED ON THE COMMAND CONTEXT.
         # This provides consistent target semantics across all commands.
-        projects = GetTargetProjects(self)
+        projects = SelectTargetProjects(self, dependency_graph.GetProjectRecords(self))
+
+        # CHECK WHETHER REDUNDANT DEPENDENCIES WERE REQUESTED.
+        if Options.options.redundant:
+            PrintRedundantDependencies(self, dependency_graph, projects)
+            return
 
         # PRINT THE PARENTS OF EACH OF THE TARGET.
         immediate_only = not Options.options.allparents
         for project in projects:
-            Logs.info('{}: {}'.format(project.name, GetParents(project, immediate_only)))
+            Logs.info('{}: {}'.format(project.name, GetParents(dependency_graph, project.name, immediate_only)))
 
 ## Gets the dependencies of the target project.
-# \param    project - The task generator of the project for which to find parents.
+# \param    dependency_graph - The dependency graph of all projects.
+# \param    project_name - The name of the project for which to find parents.
 # \param    immediate_only - Indicates whether only the immediate parents should be retrieved.
 # \return   The sorted dependencies of the target project.
-def GetParents(project, immediate_only):
+def GetParents(dependency_graph, project_name, immediate_only):
     # CHECK WHETHER IMMEDIATE PARENTS WERE REQUESTED.
     if (immediate_only):
         # Return the sorted list of immediate parents.
-        parent_names = GetImmediateParents(project)
+        parent_names = dependency_graph.GetImmediateParents(project_name)
         return sorted(parent_names)
     else:
         # Return the sorted list of all parents.
-        all_parent_names = GetAllParents(project)
+        all_parent_names = GetAllParents(dependency_graph, project_name)
         return sorted(all_parent_names)
 
 ## Returns the immediate parents of the given project. Showing only the immediate parents
@@ -66,57 +87,124 @@ def GetParents(project, immediate_only):
 # \param    project - The waf task whose immediate parents should be found.
 # \return   The immediate parents of the project.
 def GetImmediateParents(project):
-    # GATHER THE DYNAMIC ATTRIBUTES.
-    is_dynamic_attribute = lambda attribute_name: ('dynamic_' in attribute_name)
-    dynamic_attribute_names = [
-        attribute_name for attribute_name in dir(project)
-        if is_dynamic_attribute(attribute_name)]
-
-    # GET THE PARENTS OF THE PROJECT.
-    # A project expresses parent dependencies using the 'use', 'depends_on', or 'runs_after'
-    # attributes, or using a dynamic attribute.
-    # The code_generator attribute is not included because it would pull in libraries that are
-    # used to build the code generator, which the target project may not actually depend on.
+    # GATHER THE PARENTS FROM ALL DEPENDENCY ATTRIBUTES.
     parent_names = set()
-    parent_dependency_attribute_names = (
-        ['use', 'depends_on', 'runs_after'] +
-        dynamic_attribute_names)
-    for parent_dependency_attribute_name in parent_dependency_attribute_names:
-        # GATHER THE PARENTS.
-        parent_names.update(project.to_list(getattr(
-            project, parent_dependency_attribute_name, [])))
+    parent_names_by_attribute_name = GetImmediateParentsByAttribute(project)
+    for attribute_parent_names in parent_names_by_attribute_name.values():
+        parent_names.update(attribute_parent_names)
 
     return parent_names
 
-## Returns all of the parents of the given project.
-# \param    project - The waf task for which all parents should be found.
+## Returns all of the parents of the given project. The parents of all projects are computed once
+# in topological order and shared across projects, so printing all parents of every project is
+# linear in the number of dependencies rather than repeating a traversal per project.
+# \param    dependency_graph - The dependency graph of all projects.
+# \param    project_name - The name of the project for which all parents should be found.
 # \return   All of the parents of the project.
-def GetAllParents(project):
-    # GATHER THE IMMEDIATE PARENTS OF THE TARGET PROJECT.
-    parent_names = GetImmediateParents(project)
-
-    # UPDATE THE LIST OF ALL PARENT NAMES WITH THE IMMEDIATE PARENTS.
-    all_parent_names = parent_names
-
-    # GATHER THE REST OF THE PARENTS OF THE PROJECT.
-    while parent_names:
-        # GET THE PARENT NAMES IN THE NEXT TIER.
-        next_parent_names = set()
+def GetAllParents(dependency_graph, project_name):
+    return dependency_graph.GetAllParents(project_name)
+
+## The attributes whose entries can be removed from a Waf script when they are implied by other
+## dependencies. Dynamic attributes are excluded because they also provide the outputs of the parent.
+REDUCIBLE_ATTRIBUTE_NAMES = ['use', 'depends_on', 'runs_after']
+
+## Returns the dependencies of the given project that are already implied by a path through another
+## of its immediate parents. Each kind of dependency has a different effect (for example, only 'use'
+## carries the link, include and define usage of the parent), so a dependency is only implied by a
+## path made of dependencies of the same kind. Removing all of them gives the transitive reduction
+## of the project graph for each kind of dependency.
+# \param    dependency_graph - The dependency graph of all projects.
+# \param    project_name - The name of the project whose dependencies should be checked.
+# \return   Tuples of the attribute name, the redundant parent name, and the name of an immediate
+#           parent through which the redundant parent is already reached.
+def GetRedundantDependencies(dependency_graph, project_name):
+    redundant_dependencies = []
+    parent_names_by_attribute_name = dependency_graph.GetImmediateParentsByAttribute(project_name)
+    for attribute_name in REDUCIBLE_ATTRIBUTE_NAMES:
+        # GET THE ANCESTORS OF EACH IMMEDIATE PARENT OF THE SAME KIND.
+        # The ancestors are bitsets from the shared transitive closure of the attribute, so each check
+        # is a single AND.
+        parent_names = sorted(parent_names_by_attribute_name.get(attribute_name, []))
+        if not parent_names:
+            continue
+        parent_closure = dependency_graph.GetParentClosureByAttribute(attribute_name)
+        ancestor_bits_by_parent_name = dict(
+            (parent_name, parent_closure.GetReachableBits(parent_name))
+            for parent_name in parent_names)
+
+        # FIND THE PARENTS REACHED THROUGH ANOTHER PARENT.
         for parent_name in parent_names:
-            # Get the project for the parent.
-            try:
-                parent_project = project.bld.get_tgen_by_name(parent_name)
-            except Errors.WafError:
-                continue
-
-            # Get the immediate parents of this parent project.  These will be used for traversing
-            # the next tier of parent projects.
-            next_parent_names.update(GetImmediateParents(parent_project))
-
-        # UPDATE THE LIST OF ALL PARENT NAMES WITH THE NEXT TIER OF PARENTS.
-        all_parent_names.update(next_parent_names)
-
-        # PREPARE FOR TRAVERSING THE NEXT TIER OF PARENTS.
-        parent_names = next_parent_names
-
-    return all_parent_names
+            parent_bit = parent_closure.GetNodeBit(parent_name)
+            for other_parent_name in parent_names:
+                if other_parent_name == parent_name:
+                    continue
+                parent_is_implied = (ancestor_bits_by_parent_name[other_parent_name] & parent_bit)
+                if parent_is_implied:
+                    redundant_dependencies.append((attribute_name, parent_name, other_parent_name))
+                    break
+    return redundant_dependencies
+
+## Returns the number of task-level edges that a dependency adds to the build. A 'depends_on' or 'use'
+## dependency constrains each task of the child project. A 'runs_after' dependency also adds each task
+## of the parent project to the barrier that the child waits on.
+# \param    command_context - The context in which the projects are posted.
+# \param    attribute_name - The attribute expressing the dependency.
+# \param    project_name - The name of the child project.
+# \param    parent_name - The name of the parent project.
+# \return   The number of task-level edges.
+def CountTaskEdges(command_context, attribute_name, project_name, parent_name):
+    # COUNT THE TASKS OF THE CHILD.
+    task_edge_count = GetTaskCount(command_context, project_name)
+
+    # COUNT THE TASKS OF THE PARENT.
+    parent_tasks_wait_on_barrier = ('runs_after' == attribute_name)
+    if parent_tasks_wait_on_barrier:
+        task_edge_count += GetTaskCount(command_context, parent_name)
+
+    return task_edge_count
+
+## Returns the number of tasks of the given project. Projects that are not defined in the code base
+## (for example, system libraries in 'use') have no tasks.
+# \param    command_context - The context in which the project is posted.
+# \param    project_name - The name of the project.
+# \return   The number of tasks of the project.
+def GetTaskCount(command_context, project_name):
+    try:
+        project = command_context.get_tgen_by_name(project_name)
+    except Errors.WafError:
+        return 0
+    project.post()
+    return len(project.tasks)
+
+## Prints the redundant dependencies of the given projects, ranked by the number of task-level edges
+## that each one adds to the build. Only the projects with redundant dependencies are posted.
+# \param    command_context - The context of the current command.
+# \param    dependency_graph - The dependency graph of all projects.
+# \param    projects - The projects whose dependencies should be checked.
+def PrintRedundantDependencies(command_context, dependency_graph, projects):
+    # FIND THE REDUNDANT DEPENDENCIES.
+    redundant_dependencies = []
+    for project in projects:
+        for attribute_name, parent_name, other_parent_name in GetRedundantDependencies(dependency_graph, project.name):
+            redundant_dependencies.append((project.name, attribute_name, parent_name, other_parent_name))
+    if not redundant_dependencies:
+        Logs.info('No redundant dependencies were found.')
+        return
+
+    # RANK THE REDUNDANT DEPENDENCIES.
+    # The tasks are only created when needed, so the Waf scripts are only evaluated at this point.
+    GetAllProjects(command_context)
+    ranked_dependencies = []
+    for project_name, attribute_name, parent_name, other_parent_name in redundant_dependencies:
+        task_edge_count = CountTaskEdges(command_context, attribute_name, project_name, parent_name)
+        ranked_dependencies.append((task_edge_count, project_name, attribute_name, parent_name, other_parent_name))
+    ranked_dependencies.sort(key = lambda dependency: (-dependency[0],) + dependency[1:])
+
+    # PRINT THE REDUNDANT DEPENDENCIES.
+    for task_edge_count, project_name, attribute_name, parent_name, other_parent_name in ranked_dependencies:
+        Logs.info('{:8} task edges  {}: {} in {} (implied by {})'.format(
+            task_edge_count,
+            project_name,
+            parent_name,
+            attribute_name,
+            other_parent_name))
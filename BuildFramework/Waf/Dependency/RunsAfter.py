@@ -6,6 +6,8 @@ from waflib.TaskGen import after_method
 from waflib.TaskGen import before_method
 from waflib.TaskGen import feature
 
+from Waf.Dependency import RunAfterProject
+
 ## \package Waf.Dependency.RunsAfter
 ## Add a runs-after dependency between projects. If project A depends on project B,
 ## then all outputs of A must be written before any task in project B is
@@ -55,6 +57,5 @@ def AddRunsAfterDependencies(project):
 
     # ADD THE DEPENDENCIES.
     for dependency_project in dependency_projects:
-        for dependency_task in dependency_project.tasks:
-            for task in project.tasks:
-               task.set_run_after(dependency_task)
+        for task in project.tasks:
+            RunAfterProject(task, dependency_project)
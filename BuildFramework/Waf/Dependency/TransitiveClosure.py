@@ -0,0 +1,135 @@
+from __future__ import absolute_import, division, print_function
+
+## \package Waf.Dependency.TransitiveClosure
+## This package computes the transitive closure of the project dependency graph. Answering "what
+## are all parents of this project" for every project by walking the graph from each project
+## repeats the walk for every shared ancestor. Instead, the ancestors of each project are computed
+## exactly once, in topological order, as the union of the ancestors of its immediate parents.
+##
+## Ancestor sets are stored as Python integers used as bitsets, where bit N is set if the project
+## with index N is an ancestor. A union of two sets is a single bitwise OR, so computing the
+## closure for all projects costs one OR per edge.
+
+## The memoized transitive closure of a directed graph.
+class TransitiveClosure(object):
+    ## Computes the closure of the given graph.
+    ## \param[in] node_names - The names of all nodes in the graph.
+    ## \param[in] get_adjacent_names - A function that returns the names of the nodes immediately
+    ##      reachable from the given node name. Nodes reached this way are added to the graph if
+    ##      they are not in node_names.
+    def __init__(self, node_names, get_adjacent_names):
+        # INDEX ALL NODES.
+        # Each node is assigned a bit in the reachability bitsets.
+        self.node_names = []
+        self.index_by_node_name = {}
+        self.adjacent_indices_by_index = []
+        pending_node_names = list(node_names)
+        while pending_node_names:
+            node_name = pending_node_names.pop()
+            if node_name in self.index_by_node_name:
+                continue
+            self.index_by_node_name[node_name] = len(self.node_names)
+            self.node_names.append(node_name)
+            self.adjacent_indices_by_index.append(None)
+            pending_node_names.extend(get_adjacent_names(node_name))
+
+        # RESOLVE THE ADJACENT NODES OF EACH NODE.
+        for index, node_name in enumerate(self.node_names):
+            self.adjacent_indices_by_index[index] = [
+                self.index_by_node_name[adjacent_name]
+                for adjacent_name in get_adjacent_names(node_name)]
+
+        # COMPUTE THE REACHABLE NODES OF EACH NODE.
+        self.reachable_bits_by_index = self.__ComputeReachableBits()
+
+    ## Returns the names of all nodes reachable from the given node, excluding the node itself
+    ## unless it is part of a cycle.
+    ## \param[in] node_name - The name of the node to start from.
+    ## \return The set of reachable node names. Unknown nodes reach nothing.
+    def GetReachableNames(self, node_name):
+        index = self.index_by_node_name.get(node_name)
+        if index is None:
+            return set()
+        return self.GetNamesFromBits(self.reachable_bits_by_index[index])
+
+    ## Returns the reachability bitset of the given node.
+    ## \param[in] node_name - The name of the node to start from.
+    ## \return The bitset of reachable nodes. Unknown nodes reach nothing.
+    def GetReachableBits(self, node_name):
+        index = self.index_by_node_name.get(node_name)
+        if index is None:
+            return 0
+        return self.reachable_bits_by_index[index]
+
+    ## Returns the bitset containing only the given node.
+    ## \param[in] node_name - The name of the node.
+    ## \return The bitset of the node, or zero for unknown nodes.
+    def GetNodeBit(self, node_name):
+        index = self.index_by_node_name.get(node_name)
+        if index is None:
+            return 0
+        return (1 << index)
+
+    ## Converts a bitset to the set of node names it contains.
+    ## \param[in] bits - The bitset to convert.
+    ## \return The set of node names.
+    def GetNamesFromBits(self, bits):
+        node_names = set()
+        while bits:
+            # ISOLATE THE LOWEST SET BIT.
+            lowest_bit = bits & -bits
+            node_names.add(self.node_names[lowest_bit.bit_length() - 1])
+            bits ^= lowest_bit
+        return node_names
+
+    ## Computes the reachability bitset of every node. Nodes are visited in reverse topological
+    ## order, so the bitsets of all adjacent nodes are complete before they are merged. Nodes that
+    ## are part of a cycle cannot be ordered, so they are resolved by iterating until no bitset
+    ## changes.
+    ## \return The reachability bitsets, indexed by node index.
+    def __ComputeReachableBits(self):
+        # COUNT THE UNRESOLVED ADJACENT NODES OF EACH NODE.
+        node_count = len(self.node_names)
+        unresolved_adjacent_counts = [len(set(adjacent_indices)) for adjacent_indices in self.adjacent_indices_by_index]
+        dependent_indices_by_index = [[] for index in range(node_count)]
+        for index, adjacent_indices in enumerate(self.adjacent_indices_by_index):
+            for adjacent_index in set(adjacent_indices):
+                dependent_indices_by_index[adjacent_index].append(index)
+
+        # RESOLVE THE NODES IN TOPOLOGICAL ORDER.
+        # A node is resolved once all of its adjacent nodes have been resolved.
+        reachable_bits_by_index = [0] * node_count
+        ready_indices = [index for index in range(node_count) if not unresolved_adjacent_counts[index]]
+        resolved_count = 0
+        while ready_indices:
+            index = ready_indices.pop()
+            resolved_count += 1
+            reachable_bits = 0
+            for adjacent_index in self.adjacent_indices_by_index[index]:
+                reachable_bits |= (1 << adjacent_index) | reachable_bits_by_index[adjacent_index]
+            reachable_bits_by_index[index] = reachable_bits
+
+            # RELEASE THE NODES WAITING ON THE CURRENT NODE.
+            for dependent_index in dependent_indices_by_index[index]:
+                unresolved_adjacent_counts[dependent_index] -= 1
+                if not unresolved_adjacent_counts[dependent_index]:
+                    ready_indices.append(dependent_index)
+
+        # RESOLVE THE NODES IN CYCLES.
+        # Cycles are reported by CheckForDependencyCycles() in Waf.Dependency.Cycles, but the closure
+        # is still well defined.
+        all_nodes_resolved = (resolved_count == node_count)
+        if not all_nodes_resolved:
+            cyclic_indices = [index for index in range(node_count) if unresolved_adjacent_counts[index]]
+            bitsets_changed = True
+            while bitsets_changed:
+                bitsets_changed = False
+                for index in cyclic_indices:
+                    reachable_bits = reachable_bits_by_index[index]
+                    for adjacent_index in self.adjacent_indices_by_index[index]:
+                        reachable_bits |= (1 << adjacent_index) | reachable_bits_by_index[adjacent_index]
+                    if reachable_bits != reachable_bits_by_index[index]:
+                        reachable_bits_by_index[index] = reachable_bits
+                        bitsets_changed = True
+
+        return reachable_bits_by_index
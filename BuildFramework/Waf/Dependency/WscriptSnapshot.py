@@ -0,0 +1,437 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import stat
+import sys
+import types
+
+from waflib import Build
+from waflib import Context
+from waflib import Logs
+from waflib import Node
+from waflib import Options
+from waflib import Task
+from waflib import TaskGen
+from waflib import Utils
+
+from Waf.Dependency.DependencyGraph import CalculateStamps
+from Waf.Dependency.DependencyGraph import GetVariantConfigurationPath
+from Waf.Dependency.DependencyGraph import GetWscriptStampedPaths
+from Waf.Dependency.DependencyGraph import IsRecentlyModified
+from Waf.Utilities.ToolManifest import GetToolPaths
+
+## \package Waf.Dependency.WscriptSnapshot
+## This package keeps a snapshot of the projects declared by each Waf script in the build cache, so
+## that the build functions of the Waf scripts do not have to be evaluated again until they change.
+## Evaluating the Waf scripts globs the source files of every project, which is most of the time
+## taken by a no-op build.
+##
+## The snapshot of a Waf script holds the arguments of each project it declares, including those
+## declared by the Waf scripts it recurses into, with nodes stored as paths. It is reused until one
+## of the following changes:
+## - The contents of the Waf scripts.
+## - The directories around the Waf scripts, into which they may recurse.
+## - The directories listed while the Waf scripts were evaluated (for example, by ant_glob()).
+## - The configuration of the variant.
+## - The custom Waf tools, which may define the methods used to declare projects.
+##
+## A Waf script is only snapshotted if declaring its projects is all that it does. Waf scripts that
+## change the build context in any other way (for example, by adding a pre-build function), or
+## change their projects after declaring them, are evaluated by every command. Waf scripts that
+## depend on anything else, such as the contents of other files, the command being run or the command
+## line options, must be evaluated every time with --evaluate-wscripts.
+
+## The key marking a node in the stored arguments of a project.
+NODE_KEY = '__node__'
+
+## The key marking a function in the stored arguments of a project.
+FUNCTION_KEY = '__function__'
+
+## The types of strings, which differ between Python 2 and 3.
+STRING_TYPES = (str, type(u''))
+
+## The types of values stored as they are in the stored arguments of a project.
+PLAIN_TYPES = STRING_TYPES + (bool, int, float, type(None))
+
+## The attributes of the build context that are expected to change while projects are declared.
+DECLARATION_ATTRIBUTE_NAMES = ['path', 'cur_script', 'task_gen_cache_names', 'idx', 'tg_idx_count']
+
+## The Waf scripts evaluated by the current process. The methods and task classes registered by a
+## Waf script are already registered when it is evaluated again, so it can no longer be checked.
+_evaluated_wscript_paths = set()
+
+## Adds the options for the Waf script snapshot.
+## \param[in] options_context - The options context is shared by all user defined options methods.
+def options(options_context):
+    # CREATE AN OPTION GROUP FOR THE WAF SCRIPT SNAPSHOT OPTIONS.
+    snapshot_option_group = options_context.add_option_group("Waf script snapshot options")
+
+    # LOAD THE COMMAND LINE ARGUMENTS.
+    snapshot_option_group.add_option(
+        '--evaluate-wscripts',
+        action = 'store_true',
+        default = False,
+        help = 'Evaluate all Waf scripts instead of reusing the projects they declared in previous commands.')
+
+## Returns the path of the Waf script snapshot in the build cache. Each variant has its own snapshot
+## because Waf scripts may declare different projects for different configurations.
+## \param[in] build_context - The context of the current command.
+def GetWscriptSnapshotPath(build_context):
+    snapshot_file_name = '{}_wscript_snapshot.pickle'.format(build_context.variant or 'default')
+    return os.path.join(build_context.cache_dir, snapshot_file_name)
+
+## Encodes a value given when declaring a project so that it can be stored.
+## \param[in] value - The value to encode.
+## \return The encoded value.
+## \throws ValueError - Thrown if the value cannot be stored.
+def EncodeValue(value):
+    if isinstance(value, PLAIN_TYPES):
+        return value
+    elif isinstance(value, list):
+        return [EncodeValue(item) for item in value]
+    elif isinstance(value, tuple):
+        return tuple(EncodeValue(item) for item in value)
+    elif isinstance(value, dict):
+        if (NODE_KEY in value) or (FUNCTION_KEY in value):
+            raise ValueError('the dictionary {!r} uses a reserved key'.format(value))
+        return dict((EncodeValue(key), EncodeValue(item)) for key, item in value.items())
+    elif isinstance(value, Node.Node):
+        return {NODE_KEY: value.abspath()}
+    elif isinstance(value, types.FunctionType):
+        # Only functions that can be imported again are stored.
+        module = sys.modules.get(value.__module__)
+        if getattr(module, value.__name__, None) is not value:
+            raise ValueError('the function {} cannot be imported'.format(value.__name__))
+        return {FUNCTION_KEY: [value.__module__, value.__name__]}
+    raise ValueError('the value {!r} cannot be stored'.format(value))
+
+## Decodes a stored value given when declaring a project.
+## \param[in] build_context - The context of the current command.
+## \param[in] encoded_value - The value to decode.
+## \return The decoded value.
+## \throws ImportError - Thrown if a function cannot be imported.
+def DecodeValue(build_context, encoded_value):
+    if isinstance(encoded_value, list):
+        return [DecodeValue(build_context, item) for item in encoded_value]
+    elif isinstance(encoded_value, tuple):
+        return tuple(DecodeValue(build_context, item) for item in encoded_value)
+    elif isinstance(encoded_value, dict):
+        if NODE_KEY in encoded_value:
+            return build_context.root.make_node(encoded_value[NODE_KEY])
+        if FUNCTION_KEY in encoded_value:
+            module_name, function_name = encoded_value[FUNCTION_KEY]
+            module = sys.modules.get(module_name) or __import__(module_name, fromlist = [function_name])
+            return getattr(module, function_name)
+        return dict((DecodeValue(build_context, key), DecodeValue(build_context, item)) for key, item in encoded_value.items())
+    return encoded_value
+
+## Returns the modification time of a directory.
+## \param[in] path - The absolute path of the directory.
+## \return The modification time in seconds since the epoch, or None if the path is not a directory.
+def GetDirModificationTime(path):
+    try:
+        path_status = os.stat(path)
+    except OSError:
+        return None
+    return path_status.st_mtime if stat.S_ISDIR(path_status.st_mode) else None
+
+## Describes the parts of a build context and of Waf that Waf scripts may change other than by
+## declaring projects. For example, a Waf script may add a pre-build function or define a feature.
+## \param[in] build_context - The context of the current command.
+## \return The description, which changes if the build context or the registries of Waf are changed.
+def DescribeBuildState(build_context):
+    attribute_ids = dict(
+        (attribute_name, id(value))
+        for attribute_name, value in vars(build_context).items()
+        if attribute_name not in DECLARATION_ATTRIBUTE_NAMES)
+    return (
+        attribute_ids,
+        len(getattr(build_context, 'pre_funs', [])),
+        len(getattr(build_context, 'post_funs', [])),
+        # The first project declared creates the default group.
+        max(len(build_context.groups), 1),
+        build_context.current_group,
+        sorted(build_context.all_envs),
+        sorted(build_context.env.get_merged_dict().items()),
+        sum(len(method_names) for method_names in TaskGen.feats.values()),
+        len(TaskGen.task_gen.mappings),
+        len(Task.classes))
+
+## Describes the attributes of a project, so that changes made after it is declared can be detected.
+## \param[in] project - The task generator of the project.
+## \return The description, which changes if an attribute of the project is replaced.
+def DescribeProject(project):
+    attribute_ids = dict((attribute_name, id(value)) for attribute_name, value in vars(project).items())
+    return (attribute_ids, sorted(project.env.table))
+
+## The recording of the projects declared by a Waf script while it is evaluated.
+class WscriptRecording(object):
+    ## Starts recording a Waf script.
+    ## \param[in] build_context - The context of the current command.
+    ## \param[in] wscript_node - The Waf script being evaluated.
+    def __init__(self, build_context, wscript_node):
+        self.wscript_node = wscript_node
+        self.build_state_description = DescribeBuildState(build_context)
+        self.wscript_paths = []
+        self.stamped_paths = set(GetWscriptStampedPaths(build_context, wscript_node))
+        self.encoded_projects = []
+        self.projects = []
+        self.not_snapshotted_reason = None
+
+    ## Stops recording the Waf script. It can only be snapshotted if it did nothing but declare
+    ## projects.
+    ## \param[in] build_context - The context of the current command.
+    def Finish(self, build_context):
+        if self.build_state_description != DescribeBuildState(build_context):
+            self.Reject('it changes the build context or the registries of Waf')
+        for project, project_description in self.projects:
+            if project_description != DescribeProject(project):
+                self.Reject('it changes the project {} after declaring it'.format(getattr(project, 'name', project)))
+
+    ## Records that the Waf script cannot be snapshotted.
+    ## \param[in] reason - Why the Waf script cannot be snapshotted.
+    def Reject(self, reason):
+        if not self.not_snapshotted_reason:
+            self.not_snapshotted_reason = reason
+
+## The snapshot of the projects declared by the Waf scripts, which is shared by all recursions into
+## Waf scripts during a command.
+class WscriptSnapshot(object):
+    ## Loads the snapshot from the build cache.
+    ## \param[in] build_context - The context of the current command.
+    def __init__(self, build_context):
+        # LOAD THE STORED SNAPSHOTS.
+        # The snapshot is pickled like the build state, since it is loaded by every command.
+        try:
+            self.entries_by_wscript_path = Build.cPickle.loads(Utils.readf(GetWscriptSnapshotPath(build_context), 'rb'))
+        except (EnvironmentError, EOFError):
+            self.entries_by_wscript_path = {}
+        except Exception as error:
+            Logs.debug('wscript_snapshot: the stored snapshot cannot be loaded: {!r}'.format(error))
+            self.entries_by_wscript_path = {}
+        self.changed = False
+
+        # The stamps of the custom Waf tools are the same for every Waf script.
+        self.tool_paths = GetToolPaths()
+        self.tool_stamps = None
+
+        # The Waf scripts being recorded, from the outermost to the innermost.
+        self.recordings = []
+
+        # The paths stamped by all Waf scripts recursed into during the command, whether they were
+        # evaluated or declared from the snapshot.
+        self.stamped_paths = set()
+
+    ## Recurses into the Waf script in a directory, declaring its projects from the snapshot if it
+    ## has not changed, or evaluating and snapshotting it otherwise.
+    ## \param[in] build_context - The context of the current command.
+    ## \param[in] dir_path - The absolute path of the directory.
+    ## \param[in] recurse - Evaluates the Waf script in the directory.
+    def Recurse(self, build_context, dir_path, recurse):
+        # CHECK IF THE DIRECTORY HAS A WAF SCRIPT THAT HAS NOT BEEN EVALUATED.
+        # Waf scripts defining the build function in a separate file are always evaluated.
+        wscript_path = os.path.join(dir_path, Context.WSCRIPT_FILE)
+        if os.path.exists(wscript_path + '_build'):
+            self.RejectRecordings('it recurses into {}_build'.format(wscript_path))
+            return recurse()
+        wscript_node = build_context.root.find_node(wscript_path)
+        recursion_key = (wscript_node, 'build')
+        if (not wscript_node) or (recursion_key in getattr(build_context, 'recurse_cache', {})):
+            return recurse()
+
+        # DECLARE THE PROJECTS FROM THE SNAPSHOT IF THE WAF SCRIPT HAS NOT CHANGED.
+        entry = self.entries_by_wscript_path.get(wscript_path)
+        if entry and not Options.options.evaluate_wscripts:
+            projects_declared = self.DeclareProjects(build_context, entry)
+            if projects_declared:
+                return
+            del self.entries_by_wscript_path[wscript_path]
+            self.changed = True
+
+        # EVALUATE AND RECORD THE WAF SCRIPT.
+        recording = WscriptRecording(build_context, wscript_node)
+        if wscript_path in _evaluated_wscript_paths:
+            recording.Reject('it has already been evaluated by this process')
+        _evaluated_wscript_paths.add(wscript_path)
+        self.recordings.append(recording)
+        try:
+            recurse()
+        finally:
+            self.recordings.pop()
+        recording.Finish(build_context)
+        self.StoreRecording(build_context, recording)
+        self.stamped_paths.update(recording.stamped_paths)
+
+        # INCLUDE THE WAF SCRIPT IN THE RECORDINGS OF THE WAF SCRIPTS RECURSING INTO IT.
+        for outer_recording in self.recordings:
+            outer_recording.wscript_paths.append(wscript_path)
+            outer_recording.wscript_paths.extend(recording.wscript_paths)
+            outer_recording.stamped_paths.update(recording.stamped_paths)
+            if recording.not_snapshotted_reason:
+                outer_recording.Reject(recording.not_snapshotted_reason)
+
+    ## Declares the projects of a Waf script from the snapshot, if the Waf script has not changed.
+    ## \param[in] build_context - The context of the current command.
+    ## \param[in] entry - The snapshot of the Waf script.
+    ## \return True if the projects were declared; false if the snapshot is out of date.
+    def DeclareProjects(self, build_context, entry):
+        # CHECK IF THE SNAPSHOT IS UP TO DATE.
+        if self.tool_stamps is None:
+            self.tool_stamps = CalculateStamps(self.tool_paths)
+        if entry['tool_stamps'] != self.tool_stamps:
+            return False
+        if CalculateStamps(entry['stamps'].keys()) != entry['stamps']:
+            return False
+
+        # DECODE THE PROJECTS.
+        # All projects are decoded before any is declared, so that none are declared twice if a
+        # function cannot be imported and the Waf script is evaluated instead.
+        try:
+            decoded_projects = [
+                (DecodeValue(build_context, arguments), DecodeValue(build_context, keyword_arguments))
+                for arguments, keyword_arguments in entry['projects']]
+        except (ImportError, AttributeError) as error:
+            Logs.debug('wscript_snapshot: the snapshot of {} cannot be decoded: {}'.format(entry['wscript_paths'][0], error))
+            return False
+
+        # DECLARE THE PROJECTS.
+        # The Waf scripts are marked as evaluated, as if they had been.
+        recurse_cache = build_context.__dict__.setdefault('recurse_cache', {})
+        for wscript_path in entry['wscript_paths']:
+            recurse_cache[(build_context.root.make_node(wscript_path), 'build')] = True
+        for arguments, keyword_arguments in decoded_projects:
+            build_context(*arguments, **keyword_arguments)
+
+        # INCLUDE THE SNAPSHOT IN THE RECORDINGS OF THE WAF SCRIPTS RECURSING INTO IT.
+        for outer_recording in self.recordings:
+            outer_recording.wscript_paths.extend(entry['wscript_paths'])
+            outer_recording.stamped_paths.update(entry['stamps'].keys())
+        self.stamped_paths.update(entry['stamps'].keys())
+        return True
+
+    ## Records a project as it is declared by the Waf scripts being recorded.
+    ## \param[in] project - The task generator of the project.
+    ## \param[in] arguments - The positional arguments the project was declared with.
+    ## \param[in] keyword_arguments - The keyword arguments the project was declared with.
+    def RecordProject(self, project, arguments, keyword_arguments):
+        # ENCODE THE ARGUMENTS.
+        # The project is declared in the directory of its Waf script unless another is given.
+        keyword_arguments = dict(keyword_arguments)
+        keyword_arguments.pop('bld', None)
+        keyword_arguments.setdefault('path', project.path)
+        try:
+            encoded_project = (EncodeValue(list(arguments)), EncodeValue(keyword_arguments))
+        except ValueError as error:
+            self.RejectRecordings('{} cannot be stored: {}'.format(getattr(project, 'name', project), error))
+            return
+
+        # RECORD THE PROJECT.
+        project_description = DescribeProject(project)
+        for recording in self.recordings:
+            recording.encoded_projects.append(encoded_project)
+            recording.projects.append((project, project_description))
+
+    ## Records a directory listed by the Waf scripts being recorded.
+    ## \param[in] dir_path - The absolute path of the directory.
+    def RecordListedDirectory(self, dir_path):
+        for recording in self.recordings:
+            recording.stamped_paths.add(dir_path)
+
+    ## Records that none of the Waf scripts being recorded can be snapshotted.
+    ## \param[in] reason - Why the Waf scripts cannot be snapshotted.
+    def RejectRecordings(self, reason):
+        for recording in self.recordings:
+            recording.Reject(reason)
+
+    ## Adds the snapshot of a recorded Waf script, if it can be snapshotted.
+    ## \param[in] build_context - The context of the current command.
+    ## \param[in] recording - The recording of the Waf script.
+    def StoreRecording(self, build_context, recording):
+        # CHECK IF THE WAF SCRIPT CAN BE SNAPSHOTTED.
+        # A file added to a recently modified directory may not change its stamp, so the file would
+        # never be found by the Waf script.
+        wscript_path = recording.wscript_node.abspath()
+        if IsRecentlyModified(GetDirModificationTime(path) for path in recording.stamped_paths):
+            recording.Reject('the directories it depends on were modified too recently')
+        if recording.not_snapshotted_reason:
+            Logs.debug('wscript_snapshot: {} is not snapshotted, since {}'.format(wscript_path, recording.not_snapshotted_reason))
+            return
+
+        # ADD THE SNAPSHOT.
+        # The configuration of the variant may change which projects are declared.
+        stamped_paths = recording.stamped_paths | set([GetVariantConfigurationPath(build_context)])
+        if self.tool_stamps is None:
+            self.tool_stamps = CalculateStamps(self.tool_paths)
+        self.entries_by_wscript_path[wscript_path] = {
+            'wscript_paths': [wscript_path] + recording.wscript_paths,
+            'stamps': CalculateStamps(stamped_paths),
+            'tool_stamps': self.tool_stamps,
+            'projects': recording.encoded_projects}
+        self.changed = True
+
+    ## Stores the snapshot in the build cache if it has changed.
+    ## \param[in] build_context - The context of the current command.
+    def Store(self, build_context):
+        if not self.changed:
+            return
+        try:
+            Utils.writef(
+                GetWscriptSnapshotPath(build_context),
+                Build.cPickle.dumps(self.entries_by_wscript_path, Build.PROTOCOL),
+                'wb')
+            self.changed = False
+        except EnvironmentError:
+            Logs.warn('Could not store the Waf script snapshot in ' + build_context.cache_dir)
+
+# Declare the projects of unchanged Waf scripts from the snapshot instead of evaluating them. The
+# patches must only be applied once even if this module is loaded more than once.
+_build_recurse_is_patched = getattr(Build.BuildContext.recurse, 'uses_wscript_snapshot', False)
+if not _build_recurse_is_patched:
+    _old_build_recurse = Build.BuildContext.recurse
+    def _build_recurse(self, dirs, name = None, mandatory = True, once = True, encoding = None):
+        # CHECK IF THE PROJECTS ARE BEING DECLARED.
+        # The snapshot is only kept for builds with a build cache, not for configuration checks.
+        is_declaring_projects = (
+            ('build' == (name or self.fun)) and
+            once and
+            os.path.isdir(self.cache_dir))
+        if not is_declaring_projects:
+            return _old_build_recurse(self, dirs, name, mandatory, once, encoding)
+
+        # RECURSE INTO EACH DIRECTORY.
+        snapshot = getattr(self, 'wscript_snapshot', None)
+        if not snapshot:
+            snapshot = self.wscript_snapshot = WscriptSnapshot(self)
+        for dir_path in Utils.to_list(dirs):
+            if not os.path.isabs(dir_path):
+                dir_path = os.path.join(self.path.abspath(), dir_path)
+            recurse = lambda: _old_build_recurse(self, [dir_path], name, mandatory, once, encoding)
+            snapshot.Recurse(self, dir_path, recurse)
+
+        # STORE THE SNAPSHOT ONCE ALL WAF SCRIPTS HAVE BEEN EVALUATED.
+        if not self.stack_path:
+            snapshot.Store(self)
+    _build_recurse.__dict__.update(_old_build_recurse.__dict__)
+    _build_recurse.uses_wscript_snapshot = True
+    Build.BuildContext.recurse = _build_recurse
+
+    # Record the projects declared by the Waf scripts being evaluated.
+    _old_build_call = Build.BuildContext.__call__
+    def _build_call(self, *k, **kw):
+        project = _old_build_call(self, *k, **kw)
+        snapshot = getattr(self, 'wscript_snapshot', None)
+        if snapshot and snapshot.recordings:
+            snapshot.RecordProject(project, k, kw)
+        return project
+    _build_call.__dict__.update(_old_build_call.__dict__)
+    Build.BuildContext.__call__ = _build_call
+
+    # Record the directories listed by the Waf scripts being evaluated, such as by ant_glob().
+    _old_node_listdir = Node.Node.listdir
+    def _node_listdir(self):
+        snapshot = getattr(self.ctx, 'wscript_snapshot', None)
+        if snapshot and snapshot.recordings:
+            snapshot.RecordListedDirectory(self.abspath())
+        return _old_node_listdir(self)
+    _node_listdir.__dict__.update(_old_node_listdir.__dict__)
+    Node.Node.listdir = _node_listdir
@@ -1,6 +1,10 @@
 from __future__ import absolute_import, division, print_function
 
-import types
+import threading
+import time
+
+from waflib import Logs
+from waflib import Task
 
 from Waf.Utilities import LoadTools
 
@@ -104,6 +108,71 @@ def init(command_context):
 def configure(configure_context):
     LoadTools(configure_context, __file__)
 
+## Returns the outputs of all tasks of the given project. Tasks that only summarize the outputs of
+## the project for its dependents are excluded. The outputs are gathered once and shared by all
+## projects that reference the project.
+## \param[in,out] project - The posted project whose outputs should be gathered. The outputs are
+##      stored in the 'project_outputs' attribute.
+## \return The output nodes of the project. The list must not be modified.
+def GetProjectOutputs(project):
+    # CHECK IF THE OUTPUTS HAVE ALREADY BEEN GATHERED.
+    try:
+        return project.project_outputs
+    except AttributeError:
+        pass
+
+    # GATHER THE OUTPUTS.
+    project_outputs = []
+    for task in project.tasks:
+        # Stamps are bookkeeping for other projects and are never consumed directly.
+        is_outputs_stamp = getattr(task, 'is_project_outputs_stamp', False)
+        if is_outputs_stamp:
+            continue
+        project_outputs.extend(task.outputs)
+    project.project_outputs = project_outputs
+    return project_outputs
+
+## Makes a task run after all tasks of a project. The tasks of the project are
+## gathered into a single barrier that is shared by all dependent tasks, so
+## ordering P dependent tasks after a project with Q tasks takes P + Q edges
+## instead of P * Q. The barrier does not add any inputs to the task, so the
+## task is not re-run when the project changes.
+## \param[in,out] task - The task that must run after the project. The project
+## is recorded in the 'run_after_projects' attribute, so that builds reusing the
+## task can wait for the project again.
+## \param[in,out] project - The posted project to wait for. The barrier is
+## stored in the 'completion_barrier' attribute.
+def RunAfterProject(task, project):
+    # REMEMBER THE PROJECT.
+    # Waf empties the barrier once the project is built, so a build reusing the
+    # task needs a new barrier.
+    run_after_projects = getattr(task, 'run_after_projects', None)
+    if run_after_projects is None:
+        run_after_projects = []
+        task.run_after_projects = run_after_projects
+    if project not in run_after_projects:
+        run_after_projects.append(project)
+
+    # CREATE THE BARRIER ON FIRST USE.
+    # Waf's scheduler releases all tasks that are waiting on a task group once
+    # every task in the group has run.
+    completion_barrier = getattr(project, 'completion_barrier', None)
+    if not completion_barrier:
+        completion_barrier = Task.TaskGroup(set(project.tasks), [])
+        project.completion_barrier = completion_barrier
+
+    # CHECK IF THERE IS ANYTHING TO WAIT FOR.
+    if not completion_barrier.prev:
+        return
+
+    # WAIT FOR THE BARRIER.
+    # The scheduler releases each waiting task once, so a task must not be
+    # added twice.
+    already_waiting = (completion_barrier in task.run_after)
+    if not already_waiting:
+        completion_barrier.next.append(task)
+        task.run_after.add(completion_barrier)
+
 ## A task is an edge in the build graph. It connects a set of input nodes to a
 ## set of output nodes. Caching and dependency analysis require that every
 ## output node in the build graph is produced by a single task. Sub-tasks are
@@ -112,48 +181,129 @@ def configure(configure_context):
 ## A task can be thought of as a series of methods that produce an output. Each
 ## of these methods is a sub-task. This method allows sub-tasks to be added
 ## after the task has been created. This is useful when sub-tasks are optional
-## or defined by independent build system features.
+## or defined by independent build system features. The sub-tasks are run by a
+## pipeline attached to the task, which records how long each of them takes.
 ## \param parent_task - The task object to extend.
 ## \param sub_task - The method to add as a sub-task. The method takes the
 ## parent task as its only argument. It will be executed only after all
 ## previous sub-tasks have completed successfully.
-def AddSubTask(parent_task, sub_task):
-    # LOAD THE PREVIOUS SUB-TASKS.
-    # The "run" attribute stores a chain of methods that produce the outputs of
-    # the task. The methods are chained together through wrapping.
-    previous_sub_tasks = parent_task.run
-
-    # DEFINE A METHOD TO RUN THE ADDITIONAL SUB-TASK.
-    # The interface is designed to match the run method of the Task class. See
-    # the Task class for possible return values.
-    def RunSubTask(self):
-        # RUN THE PREVIOUS SUB-TASKS.
-        # The previous sub-tasks take no parameters because the method has
-        # already been bound to the parent task object.
+## \param name - The name of the sub-task in the build log and timing reports.
+## The name of the method is used by default.
+## \param can_overlap - True if the sub-task can run at the same time as the
+## sub-tasks added immediately before or after it that can also overlap. Such
+## sub-tasks must not modify any file used by the others.
+def AddSubTask(parent_task, sub_task, name = None, can_overlap = False):
+    # CREATE THE PIPELINE ON FIRST USE.
+    # The pipeline replaces the "run" attribute of the task, so the original
+    # method becomes its first sub-task.
+    sub_task_pipeline = getattr(parent_task, 'sub_task_pipeline', None)
+    if not sub_task_pipeline:
+        sub_task_pipeline = SubTaskPipeline(parent_task)
+        parent_task.sub_task_pipeline = sub_task_pipeline
+        parent_task.run = sub_task_pipeline.Run
+
+    # ADD THE SUB-TASK TO THE PIPELINE.
+    sub_task_pipeline.AddSubTask(sub_task, name or sub_task.__name__, can_overlap)
+
+## The sub-tasks that produce the outputs of a task. Each time the pipeline is
+## run, the duration and result of every sub-task is recorded so that slow
+## tasks can be broken down into their steps.
+class SubTaskPipeline(object):
+    ## Creates a pipeline that starts with the original run method of a task.
+    ## \param[in] parent_task - The task whose outputs the pipeline produces.
+    def __init__(self, parent_task):
+        self.parent_task = parent_task
+        # Each sub-task is described by its name, its method and whether it can overlap.
+        self.sub_tasks = [(parent_task.__class__.__name__, parent_task.run.__func__, False)]
+        ## The name, duration in seconds and result of each sub-task run by the most recent
+        ## run of the pipeline, in the order in which the sub-tasks were added.
+        self.sub_task_results = []
+
+    ## Adds a sub-task to the end of the pipeline. See the AddSubTask function.
+    def AddSubTask(self, sub_task, name, can_overlap):
+        self.sub_tasks.append((name, sub_task, can_overlap))
+
+    ## Runs the sub-tasks. The interface is designed to match the run method of
+    ## the Task class. See the Task class for possible return values.
+    ## \return Zero if all sub-tasks were successful, the result of the first
+    ## failed sub-task otherwise.
+    def Run(self):
         TASK_SUCCESSFUL = 0
-        previous_sub_tasks_result = previous_sub_tasks()
-        previous_sub_tasks_successful = (
-            TASK_SUCCESSFUL == previous_sub_tasks_result)
-        if not previous_sub_tasks_successful:
-            # Return the error that occurred.
-            return previous_sub_tasks_result
-
-        # RUN THE NEW SUB-TASK.
-        # The method is given an instance to the parent task.
-        sub_task_result = sub_task(self)
-        sub_task_sucessful = (TASK_SUCCESSFUL == sub_task_result)
-        if not sub_task_sucessful:
-            # Return the error that occurred.
-            return sub_task_result
+        self.sub_task_results = []
+        for stage in self.GetStages():
+            # RUN THE SUB-TASKS OF THE STAGE.
+            # The sub-tasks of a stage are independent, so they are run at
+            # the same time.
+            if len(stage) > 1:
+                stage_results = self.RunOverlappingSubTasks(stage)
+            else:
+                stage_results = [self.RunSubTask(stage[0])]
+            self.sub_task_results.extend(stage_results)
+
+            # STOP AT THE FIRST FAILURE.
+            for sub_task_name, duration, sub_task_result in stage_results:
+                sub_task_successful = (TASK_SUCCESSFUL == sub_task_result)
+                if not sub_task_successful:
+                    # Return the error that occurred.
+                    return sub_task_result
 
         # ALL SUB-TASKS WERE SUCCESSFUL.
         return TASK_SUCCESSFUL
 
-    # ADD THE SUB-TASK TO THE CHAIN.
-    # The method type class binds the wrapper method to the parent task object.
-    parent_task_run_method = types.MethodType(
-        RunSubTask,
-        parent_task,
-        type(parent_task))
-    parent_task.run = parent_task_run_method
+    ## Groups the sub-tasks into stages that are run one after another. Adjacent
+    ## sub-tasks that can overlap are placed in the same stage.
+    ## \return The sub-tasks of each stage.
+    def GetStages(self):
+        stages = []
+        for sub_task in self.sub_tasks:
+            name, method, can_overlap = sub_task
+            joins_previous_stage = can_overlap and stages and stages[-1][-1][2]
+            if joins_previous_stage:
+                stages[-1].append(sub_task)
+            else:
+                stages.append([sub_task])
+        return stages
+
+    ## Runs a single sub-task.
+    ## \param[in] sub_task - The name, method and overlap flag of the sub-task.
+    ## \return The name, duration in seconds and result of the sub-task.
+    def RunSubTask(self, sub_task):
+        # RUN THE SUB-TASK.
+        # The method is given an instance to the parent task.
+        name, method, can_overlap = sub_task
+        start_time = time.time()
+        sub_task_result = method(self.parent_task)
+        duration = time.time() - start_time
+
+        # LOG THE SUB-TASK.
+        Logs.debug('subtask: {} of {} took {:.3f}s and returned {}'.format(
+            name,
+            self.parent_task,
+            duration,
+            sub_task_result))
+        return (name, duration, sub_task_result)
+
+    ## Runs sub-tasks at the same time.
+    ## \param[in] sub_tasks - The name, method and overlap flag of each sub-task.
+    ## \return The name, duration in seconds and result of each sub-task.
+    ## \throws Exception - The first exception raised by a sub-task is re-raised.
+    def RunOverlappingSubTasks(self, sub_tasks):
+        # START A THREAD FOR EACH SUB-TASK.
+        results = [None] * len(sub_tasks)
+        errors = [None] * len(sub_tasks)
+        def RunSubTaskInThread(sub_task_index):
+            try:
+                results[sub_task_index] = self.RunSubTask(sub_tasks[sub_task_index])
+            except Exception as error:
+                errors[sub_task_index] = error
+        threads = [threading.Thread(target = RunSubTaskInThread, args = (sub_task_index,)) for sub_task_index in range(len(sub_tasks))]
+        for thread in threads:
+            thread.start()
 
+        # WAIT FOR ALL SUB-TASKS TO COMPLETE.
+        for thread in threads:
+            thread.join()
+        for error in errors:
+            if error is not None:
+                raise error
+        return results
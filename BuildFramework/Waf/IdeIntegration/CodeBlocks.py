@@ -20,6 +20,7 @@ from Waf.Utilities import GetTargetProjects
 from Waf.Utilities import GetWafScriptFilepath
 from Waf.Utilities import OpenFileInDefaultProgram
 from Waf.Utilities import UuidMd5Hash
+from Waf.Utilities.GlobCache import CachedAntGlob
 
 ## \package Waf.IdeIntegration.CodeBlocks
 ## This package defines command for generating project files for the Code::Blocks C++ IDE.
@@ -119,7 +120,7 @@ class CodeBlocksContext(BuildContext):
     # Generates a workspace file containing all projects in the given directory.
     def GenerateWorkspaceFile(self, template_env, workspace_dir):
         # GATHER THE C++ PROJECTS.
-        project_files = workspace_dir.ant_glob('*.cbp')
+        project_files = CachedAntGlob(workspace_dir, '*.cbp')
         if not project_files:
             return
 
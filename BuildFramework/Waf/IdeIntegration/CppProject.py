@@ -2,6 +2,7 @@ from __future__ import absolute_import, division, print_function
 
 from waflib.Node import Node
 from Waf.IdeIntegration.Project import Project
+from Waf.Utilities.GlobCache import CachedAntGlob
 
 ## \package Waf.IdeIntegration.CppProject
 ## This package defines an interface for task generators that represent a C++ project.
@@ -14,6 +15,10 @@ class CppProject(Project):
 
     # The binary output of the compilation.
     def GetOutputFile(self):
+        # The output of the linker is an intermediate file when its symbols are separated.
+        separate_symbols_task = getattr(self.waf_project, 'separate_symbols_task', None)
+        if separate_symbols_task:
+            return separate_symbols_task.outputs[0]
         return self.waf_project.link_task.outputs[0]
 
     # The working directory of the application when run from the IDE.
@@ -66,7 +71,7 @@ class CppProject(Project):
     # The header files of the project.
     def GetHeaderFiles(self):
         # INCLUDE HEADER FILES.
-        include_files = self.GetSourceDir().ant_glob('**/*.h')
+        include_files = CachedAntGlob(self.GetSourceDir(), '**/*.h')
         return include_files
 
     # The source files of the project.
@@ -74,11 +79,15 @@ class CppProject(Project):
         # EXCLUDE GENERATED FILES.
         # The symbols are imported from header files even if they are not part of the project.
         is_user_written = lambda file: not file.is_child_of(self.waf_project.bld.bldnode)
-        source_files = self.waf_project.to_nodes(self.waf_project.source)
+        source_files = self.waf_project.to_nodes(self.GetOriginalSource())
         user_written_files = [file for file in source_files if is_user_written(file)]
         return user_written_files
 
     # The source directory is the parent directory shared by all source files.
     def GetSourceDir(self):
-        source_dir = super(CppProject, self).GetSourceDir(self.waf_project.source)
+        source_dir = super(CppProject, self).GetSourceDir(self.GetOriginalSource())
         return source_dir
+
+    # The source files given by the project, before they are combined by a unity build.
+    def GetOriginalSource(self):
+        return getattr(self.waf_project, 'unity_original_source', self.waf_project.source)
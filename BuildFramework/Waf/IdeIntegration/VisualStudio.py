@@ -20,6 +20,7 @@ from Waf.Utilities import GetTargetProjects
 from Waf.Utilities import GetWafScriptFilepath
 from Waf.Utilities import OpenFileInDefaultProgram
 from Waf.Utilities import UuidMd5Hash
+from Waf.Utilities.GlobCache import CachedAntGlob
 
 ## \package Waf.IdeIntegration.VisualStudio
 ## This package defines a command for generating project files for the Visual Studio IDE.
@@ -231,7 +232,7 @@ class VisualStudioContext(BuildContext):
     # Generates a solution file containing all projects in the given directory.
     def GenerateSolutionFile(self, template_env, solution_dir):
         # GATHER THE C++ PROJECTS.
-        cpp_project_files = solution_dir.ant_glob('*.vcxproj')
+        cpp_project_files = CachedAntGlob(solution_dir, '*.vcxproj')
         cpp_projects = self.GatherProjectInfo(cpp_project_files)
         if cpp_projects:
             # GENERATE THE C++ SOLUTION FILE.
@@ -248,7 +249,7 @@ class VisualStudioContext(BuildContext):
             return cpp_sln_file.abspath()
 
         # GATHER THE .NET PROJECTS.
-        dot_net_project_files = solution_dir.get_bld().ant_glob('*.csproj')
+        dot_net_project_files = CachedAntGlob(solution_dir.get_bld(), '*.csproj')
         dot_net_projects = self.GatherProjectInfo(dot_net_project_files)
         if dot_net_projects:
             # GENERATE THE DOT NET SOLUTION FILE.
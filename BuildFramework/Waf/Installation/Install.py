@@ -12,6 +12,7 @@ from waflib.TaskGen import after_method
 from waflib.Tools import cxx
 
 from Waf.Utilities import Platform
+from Waf.Utilities.GlobCache import CachedAntGlob
 
 ## \package Waf.Installation.Install
 ## This package customizes the Waf install command for our products. The command copies the build to
@@ -159,7 +160,7 @@ def InstallIncludeFiles(project):
     if not isinstance(exported_includes, list):
         exported_includes = [exported_includes]
     for exported_include in exported_includes:
-        header_files.extend(project.path.ant_glob(os.path.join(exported_include, '**/*.h')))
+        header_files.extend(CachedAntGlob(project.path, os.path.join(exported_include, '**/*.h')))
         
     # INSTALL THE INCLUDE FILES.
     # The relative_trick argument will preserve the folder hierarchy when installing whole folders.
@@ -214,7 +215,7 @@ def InstallGeneratedIncludeFiles(project):
         # Note that remove = False must be specified in the ant_glob() calls below to prevent
         # the files from being removed, since the default behavior is to remove any files that 
         # do not exist (and generated files are typically generated after this function is run).
-        generated_header_files.extend(project.path.get_bld().ant_glob(os.path.join(exported_include, '**/*.h'), remove = False))
+        generated_header_files.extend(CachedAntGlob(project.path.get_bld(), os.path.join(exported_include, '**/*.h'), remove = False))
    
     LIST_EMPTY_COUNT = 0
     generated_headers_present =  (len(generated_header_files) != LIST_EMPTY_COUNT)
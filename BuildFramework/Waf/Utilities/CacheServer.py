@@ -0,0 +1,184 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import re
+import tarfile
+import threading
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from waflib import Context
+from waflib import Errors
+from waflib import Logs
+from waflib import Options
+
+from Waf.Utilities.CompilationCache import GetCacheEntryPath
+from Waf.Utilities.CompilationCache import PackEntry
+from Waf.Utilities.CompilationCache import TrimCompilationCache
+from Waf.Utilities.CompilationCache import UnpackEntry
+
+## \package Waf.Utilities.CacheServer
+## This package defines the 'cache-server' command, which shares a compilation cache directory with
+## other machines. Continuous integration builds upload the outputs of the tasks they run, and other
+## builds download them instead of running the tasks again.
+##
+## ~~~
+## # Serve the cache on a build server...
+## waf cache-server --compilation-cache=/srv/waf_cache --compilation-cache-size=102400
+## # ...upload to it from the continuous integration builds...
+## waf build --compilation-cache-server=http://buildserver:8421 --compilation-cache-upload
+## # ...and download from it everywhere else.
+## waf build --compilation-cache-server=http://buildserver:8421
+## ~~~
+##
+## The served directory has the same layout as a local compilation cache, so it is kept within its
+## size limit the same way. The server is a reference implementation with no authentication, so it
+## should only be run on a trusted network.
+
+## The port on which the server listens, unless another port is given.
+DEFAULT_CACHE_SERVER_PORT = 8421
+
+## The keys of cache entries are MD5 hashes.
+CACHE_KEY_PATTERN = re.compile('^[0-9a-f]{32}$')
+
+## Adds the options for the cache server command.
+## \param[in] options_context - The options context is shared by all user defined options methods.
+def options(options_context):
+    # CREATE AN OPTION GROUP FOR THE CACHE SERVER OPTIONS.
+    cache_server_option_group = options_context.add_option_group("Cache server options")
+
+    # LOAD THE COMMAND LINE ARGUMENTS.
+    cache_server_option_group.add_option(
+        '--cache-server-port',
+        action = 'store',
+        type = 'int',
+        default = DEFAULT_CACHE_SERVER_PORT,
+        help = 'The port on which the cache-server command listens. [default: %default]')
+
+## Serves the compilation cache directory to builds on other machines.
+class CacheServerContext(Context.Context):
+    '''serves the compilation cache to builds on other machines'''
+    cmd = 'cache-server'
+
+    # Runs the server until the command is interrupted.
+    def execute(self):
+        # CHECK THE CACHE DIRECTORY.
+        cache_path = Options.options.compilation_cache
+        if not cache_path:
+            raise Errors.WafError('The directory to serve must be given with --compilation-cache.')
+        cache_path = os.path.abspath(os.path.expanduser(cache_path))
+
+        # RUN THE SERVER.
+        server = CacheServer(
+            ('', Options.options.cache_server_port),
+            cache_path,
+            Options.options.compilation_cache_size * 1024 * 1024)
+        Logs.info('Serving the compilation cache {} on port {}'.format(cache_path, Options.options.cache_server_port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+## An HTTP server that handles each request on a thread of its own.
+class CacheServer(ThreadingMixIn, HTTPServer):
+    ## Requests in progress do not keep the server running once it is interrupted.
+    daemon_threads = True
+
+    ## Creates the server.
+    ## \param[in] server_address - The host and port on which to listen.
+    ## \param[in] cache_path - The directory of the served cache.
+    ## \param[in] size_limit - The size limit of the cache in bytes.
+    def __init__(self, server_address, cache_path, size_limit):
+        HTTPServer.__init__(self, server_address, CacheRequestHandler)
+        self.cache_path = cache_path
+        self.size_limit = size_limit
+        self.lock = threading.Lock()
+        self.stored_size_since_trim = 0
+
+    ## Records the size of an uploaded entry, trimming the cache once a tenth of its size limit has
+    ## been uploaded. Trimming reads the whole cache, so it is not done after every upload.
+    ## \param[in] stored_size - The size of the uploaded entry in bytes.
+    def AddStoredSize(self, stored_size):
+        with self.lock:
+            self.stored_size_since_trim += stored_size
+            trim_needed = (self.stored_size_since_trim > (self.size_limit / 10))
+            if trim_needed:
+                self.stored_size_since_trim = 0
+        if trim_needed:
+            evicted_size = TrimCompilationCache(self.cache_path, self.size_limit)
+            Logs.info('Evicted {:.1f} MB from the compilation cache'.format(evicted_size / (1024 * 1024)))
+
+## Handles the requests of the cache server. An entry is downloaded with a GET request to '/<key>' and
+## uploaded with a PUT request to the same path.
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    ## Sends an entry to a build.
+    def do_GET(self):
+        # FIND THE ENTRY.
+        cache_entry_path = self.GetCacheEntryPath()
+        if not cache_entry_path:
+            return
+        if not os.path.isdir(cache_entry_path):
+            self.send_error(404)
+            return
+
+        # SEND THE ENTRY.
+        # The entry is marked as recently used so that it is not evicted.
+        try:
+            archive_bytes = PackEntry(cache_entry_path)
+            os.utime(cache_entry_path, None)
+        except (EnvironmentError, tarfile.TarError):
+            # The entry was evicted while it was read.
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(archive_bytes)))
+        self.end_headers()
+        self.wfile.write(archive_bytes)
+
+    ## Stores an entry uploaded by a build.
+    def do_PUT(self):
+        # READ THE ENTRY.
+        cache_entry_path = self.GetCacheEntryPath()
+        if not cache_entry_path:
+            return
+        archive_size = int(self.headers.get('Content-Length', 0))
+        archive_bytes = self.rfile.read(archive_size)
+
+        # STORE THE ENTRY.
+        # An entry that already exists is kept, since entries with the same key have the same outputs.
+        if not os.path.isdir(cache_entry_path):
+            try:
+                stored_size = UnpackEntry(archive_bytes, self.server.cache_path, cache_entry_path)
+                self.server.AddStoredSize(stored_size)
+            except EnvironmentError:
+                # Another build uploaded the same entry in the meantime.
+                pass
+            except tarfile.TarError as error:
+                self.send_error(400, str(error))
+                return
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    ## Returns the directory of the entry named by the path of the request.
+    ## \return The directory, or None if the path does not name an entry, in which case the error
+    ##      has been sent.
+    def GetCacheEntryPath(self):
+        key = self.path.strip('/')
+        if not CACHE_KEY_PATTERN.match(key):
+            self.send_error(400, 'Not a cache key')
+            return None
+        return GetCacheEntryPath(self.server.cache_path, key)
+
+    ## Logs requests in the debug zone of the server rather than on standard error.
+    def log_message(self, format, *args):
+        Logs.debug('cache-server: {} {}'.format(self.address_string(), format % args))
@@ -0,0 +1,631 @@
+from __future__ import absolute_import, division, print_function
+
+import io
+import os
+import shutil
+import tarfile
+import threading
+import uuid
+try:
+    from queue import Queue
+    from urllib.error import HTTPError
+    from urllib.request import Request
+    from urllib.request import urlopen
+except ImportError:
+    from Queue import Queue
+    from urllib2 import HTTPError
+    from urllib2 import Request
+    from urllib2 import urlopen
+
+from waflib import Build
+from waflib import Logs
+from waflib import Options
+from waflib import Task
+from waflib import Utils
+
+## \package Waf.Utilities.CompilationCache
+## This package stores the outputs of compiler and linker tasks in a directory shared by all builds
+## on a machine. Before a task is run, its outputs are restored from the cache if a task with the
+## same key has already been run by any build, in any checkout or variant.
+##
+## The key of a task covers the same things as the Waf task signature: the command of the task, the
+## environment variables it uses, the contents of its inputs and dependent nodes, and the contents of
+## the headers found by the scanner. Unlike the signature, the key does not depend on where the code
+## base is checked out. Paths below the source and build directories are made relative before the
+## environment variables are hashed, and the compiler itself is identified by its size and time of
+## modification. Debugging information in restored outputs refers to the checkout that produced them.
+##
+## Each cache entry is a directory named after the key, holding one file per output of the task. The
+## least recently used entries are deleted when the cache grows beyond its size limit.
+##
+## The cache may also be shared by several machines through a cache server, such as the one run by the
+## 'cache-server' command. Entries missing from the local cache are fetched from the server by a pool
+## of threads as soon as their tasks are ready to run, so the scheduler never waits on the network.
+## Builds that are allowed to upload (usually the continuous integration builds) send the entries they
+## store to the server in the background. The protocol is plain HTTP: an entry is read with a GET
+## request and written with a PUT request to '<server>/<key>', and is transferred as a compressed tar
+## archive of its files. If the server cannot be reached, it is not used for the rest of the build and
+## the tasks are run locally.
+
+## The classes of the tasks whose outputs are cached. Only tasks whose outputs are fully determined
+## by their signature may be cached.
+CACHEABLE_TASK_CLASS_NAMES = [
+    'c',
+    'cxx',
+    'cprogram',
+    'cshlib',
+    'cstlib',
+    'cxxprogram',
+    'cxxshlib',
+    'cxxstlib',
+    'CxxPrecompiledHeaderTask']
+
+## The environment variables holding the paths of programs. The programs are identified by their size
+## and time of modification, so that a cache entry is not used after a compiler is upgraded in place.
+PROGRAM_ENV_VAR_NAMES = ['AR', 'CC', 'CXX', 'LINK_CC', 'LINK_CXX']
+
+## The number of threads fetching entries from the cache server.
+SERVER_FETCH_THREAD_COUNT = 8
+
+## The time to wait for the cache server to respond, in seconds.
+SERVER_TIMEOUT_IN_SECONDS = 10
+
+## Guards the statistics updated by the parallel task consumers.
+_statistics_lock = threading.Lock()
+
+## Guards the creation of the connection to the cache server.
+_server_lock = threading.Lock()
+
+## Adds the options for the compilation cache.
+## \param[in] options_context - The options context is shared by all user defined options methods.
+def options(options_context):
+    # CREATE AN OPTION GROUP FOR THE COMPILATION CACHE OPTIONS.
+    cache_option_group = options_context.add_option_group("Compilation cache options")
+
+    # LOAD THE COMMAND LINE ARGUMENTS.
+    cache_option_group.add_option(
+        '--compilation-cache',
+        action = 'store',
+        default = os.environ.get('WAF_COMPILATION_CACHE', ''),
+        help = ('The directory in which compiler and linker outputs are cached. The cache is disabled by default, '
+            'unless the WAF_COMPILATION_CACHE environment variable is set.'))
+    cache_option_group.add_option(
+        '--compilation-cache-size',
+        action = 'store',
+        type = 'int',
+        default = int(os.environ.get('WAF_COMPILATION_CACHE_SIZE', 10240)),
+        help = 'The size of the compilation cache in megabytes. [default: %default]')
+    cache_option_group.add_option(
+        '--compilation-cache-server',
+        action = 'store',
+        default = os.environ.get('WAF_COMPILATION_CACHE_SERVER', ''),
+        help = ('The URL of a server sharing the compilation cache between machines, for example http://host:8421. '
+            'The WAF_COMPILATION_CACHE_SERVER environment variable is used by default.'))
+    cache_option_group.add_option(
+        '--compilation-cache-upload',
+        action = 'store_true',
+        default = bool(os.environ.get('WAF_COMPILATION_CACHE_UPLOAD')),
+        help = ('Upload the outputs of the tasks that are run to the cache server. Uploads are disabled by default, '
+            'unless the WAF_COMPILATION_CACHE_UPLOAD environment variable is set.'))
+
+## Returns the directory of the compilation cache.
+## \param[in] build_context - The context of the current build.
+## \return The absolute path of the cache, or None if the cache is disabled. If only a cache server is
+##      given, entries fetched from the server are kept in the build cache.
+def GetCompilationCachePath(build_context):
+    cache_path = getattr(Options.options, 'compilation_cache', '')
+    if cache_path:
+        return os.path.abspath(os.path.expanduser(cache_path))
+    if getattr(Options.options, 'compilation_cache_server', ''):
+        return os.path.join(build_context.cache_dir, 'compilation_cache')
+    return None
+
+## Checks if the outputs of a task can be cached.
+## \param[in] task - The task to check.
+## \return True if the outputs of the task can be cached; false otherwise.
+def IsCacheable(task):
+    return (task.__class__.__name__ in CACHEABLE_TASK_CLASS_NAMES) and bool(task.outputs)
+
+## Returns the key of a task in the compilation cache. The signature of the task must already have
+## been computed, so that the headers found by the scanner are known.
+## \param[in] task - The task to identify.
+## \return The key as a hexadecimal string.
+def GetCacheKey(task):
+    build_context = task.generator.bld
+    m = Utils.md5(task.hcode)
+    m.update(task.__class__.__name__.encode('utf-8'))
+
+    # HASH THE CONTENTS OF THE INPUTS, DEPENDENT NODES AND SCANNED HEADERS.
+    dependency_nodes = task.inputs + task.dep_nodes + build_context.node_deps.get(task.uid(), [])
+    for dependency_node in dependency_nodes:
+        m.update(dependency_node.get_bld_sig())
+
+    # HASH THE ENVIRONMENT VARIABLES.
+    # Paths within the code base are made relative so that the key is the same in every checkout and
+    # variant. The build directory is replaced first, since it is usually within the source directory.
+    path_replacements = [
+        (build_context.bldnode.abspath(), '${BUILD_DIR}'),
+        (build_context.srcnode.abspath(), '${SOURCE_DIR}')]
+    for var_name in task.vars:
+        value_text = repr(task.env[var_name])
+        for path, replacement in path_replacements:
+            value_text = value_text.replace(path, replacement)
+        m.update(value_text.encode('utf-8'))
+        if var_name in PROGRAM_ENV_VAR_NAMES:
+            m.update(GetProgramStamp(task.env[var_name]).encode('utf-8'))
+
+    # HASH THE LOCATIONS OF THE OUTPUTS.
+    for output_node in task.outputs:
+        m.update(output_node.path_from(build_context.bldnode).encode('utf-8'))
+
+    return Utils.to_hex(m.digest())
+
+## Returns a stamp identifying the version of a program.
+## \param[in] program - The command running the program, as stored in the environment.
+## \return The size and time of modification of the program, or an empty string if it is not found.
+def GetProgramStamp(program):
+    program_path = Utils.to_list(program)[0] if program else ''
+    try:
+        program_stat = os.stat(program_path)
+    except OSError:
+        return ''
+    return '{}:{}'.format(program_stat.st_size, program_stat.st_mtime)
+
+## Returns the directory of a cache entry.
+## \param[in] cache_path - The directory of the compilation cache.
+## \param[in] key - The key of the task.
+def GetCacheEntryPath(cache_path, key):
+    return os.path.join(cache_path, key[:2], key)
+
+## Restores the outputs of a task from the compilation cache.
+## \param[in] task - The task whose outputs should be restored.
+## \param[in] cache_entry_path - The directory of the cache entry for the task.
+## \return True if the outputs were restored; false if the task is not in the cache.
+def RestoreOutputs(task, cache_entry_path):
+    # CHECK IF THE TASK IS IN THE CACHE.
+    if not os.path.isdir(cache_entry_path):
+        return False
+
+    # COPY THE OUTPUTS.
+    # The entry may be evicted by another build while it is copied, in which case the task is run.
+    try:
+        for output_index, output_node in enumerate(task.outputs):
+            output_node.parent.mkdir()
+            shutil.copy2(os.path.join(cache_entry_path, str(output_index)), output_node.abspath())
+
+        # MARK THE ENTRY AS RECENTLY USED.
+        os.utime(cache_entry_path, None)
+    except EnvironmentError as error:
+        Logs.debug('cache: could not restore {}: {}'.format(task, error))
+        return False
+    return True
+
+## Stores the outputs of a task in the compilation cache. Entries are written to a temporary
+## directory and then renamed, so other builds never see a partially written entry.
+## \param[in] task - The task whose outputs should be stored.
+## \param[in] cache_path - The directory of the compilation cache.
+## \param[in] cache_entry_path - The directory of the cache entry for the task.
+## \return The size of the stored outputs in bytes, or zero if they were not stored.
+def StoreOutputs(task, cache_path, cache_entry_path):
+    temporary_path = os.path.join(cache_path, 'tmp', uuid.uuid4().hex)
+    try:
+        # COPY THE OUTPUTS.
+        os.makedirs(temporary_path)
+        stored_size = 0
+        for output_index, output_node in enumerate(task.outputs):
+            cached_output_path = os.path.join(temporary_path, str(output_index))
+            shutil.copy2(output_node.abspath(), cached_output_path)
+            stored_size += os.path.getsize(cached_output_path)
+
+        PublishEntry(temporary_path, cache_entry_path)
+        return stored_size
+    except EnvironmentError as error:
+        Logs.debug('cache: could not store {}: {}'.format(task, error))
+        shutil.rmtree(temporary_path, ignore_errors = True)
+        return 0
+
+## Moves a completely written entry into the cache.
+## \param[in] temporary_path - The directory to which the entry was written.
+## \param[in] cache_entry_path - The directory of the cache entry.
+def PublishEntry(temporary_path, cache_entry_path):
+    # CREATE THE PARENT DIRECTORY.
+    entry_parent_path = os.path.dirname(cache_entry_path)
+    if not os.path.isdir(entry_parent_path):
+        os.makedirs(entry_parent_path)
+
+    # MOVE THE ENTRY.
+    # Another build may have stored the same entry in the meantime.
+    os.rename(temporary_path, cache_entry_path)
+
+## Packs the files of a cache entry into an archive to be sent to or from a cache server.
+## \param[in] cache_entry_path - The directory of the cache entry.
+## \return The contents of the compressed tar archive.
+def PackEntry(cache_entry_path):
+    # The fastest compression is used, since most of the size of object files is saved at any level.
+    archive_file = io.BytesIO()
+    archive = tarfile.open(fileobj = archive_file, mode = 'w:gz', compresslevel = 1)
+    try:
+        for output_name in sorted(os.listdir(cache_entry_path)):
+            archive.add(os.path.join(cache_entry_path, output_name), arcname = output_name)
+    finally:
+        archive.close()
+    return archive_file.getvalue()
+
+## Unpacks an archive created by PackEntry into the cache.
+## \param[in] archive_bytes - The contents of the archive.
+## \param[in] cache_path - The directory of the cache.
+## \param[in] cache_entry_path - The directory of the cache entry.
+## \return The size of the unpacked files in bytes.
+def UnpackEntry(archive_bytes, cache_path, cache_entry_path):
+    temporary_path = os.path.join(cache_path, 'tmp', uuid.uuid4().hex)
+    try:
+        # EXTRACT THE FILES.
+        # Entries only hold files named after the index of an output, so nothing can be written
+        # outside of the entry.
+        os.makedirs(temporary_path)
+        unpacked_size = 0
+        archive = tarfile.open(fileobj = io.BytesIO(archive_bytes), mode = 'r:gz')
+        try:
+            for member in archive.getmembers():
+                if not (member.isfile() and member.name.isdigit()):
+                    raise tarfile.TarError('Unexpected member {} in a cache entry.'.format(member.name))
+                archive.extract(member, temporary_path)
+                unpacked_size += member.size
+        finally:
+            archive.close()
+
+        PublishEntry(temporary_path, cache_entry_path)
+        return unpacked_size
+    except (EnvironmentError, tarfile.TarError):
+        shutil.rmtree(temporary_path, ignore_errors = True)
+        raise
+
+## Records the outcome of looking up a task in the cache.
+## \param[in,out] build_context - The context of the current build. The statistics are stored in
+##      the 'compilation_cache_statistics' attribute.
+## \param[in] statistic_name - 'hits', 'server_hits', 'misses' or 'stored_bytes'.
+## \param[in] amount - The amount to add to the statistic.
+def AddCacheStatistic(build_context, statistic_name, amount = 1):
+    with _statistics_lock:
+        if not getattr(build_context, 'compilation_cache_statistics', None):
+            build_context.compilation_cache_statistics = {'hits': 0, 'server_hits': 0, 'misses': 0, 'stored_bytes': 0}
+        build_context.compilation_cache_statistics[statistic_name] += amount
+
+## Shares the compilation cache with other machines through a cache server. Entries are fetched and
+## uploaded by background threads.
+class CacheServerConnection(object):
+    ## Starts the threads fetching and uploading entries.
+    ## \param[in] server_url - The URL of the cache server.
+    ## \param[in] cache_path - The directory of the local cache.
+    ## \param[in] upload_enabled - True if entries are uploaded to the server; false otherwise.
+    def __init__(self, server_url, cache_path, upload_enabled):
+        self.server_url = server_url.rstrip('/')
+        self.cache_path = cache_path
+        self.upload_enabled = upload_enabled
+        self.available = True
+        self.lock = threading.Lock()
+        self.fetch_events_by_key = {}
+        self.fetched_keys = set()
+        self.fetch_queue = Queue()
+        self.upload_queue = Queue()
+
+        # START THE THREADS.
+        # The threads do not keep Waf running if the build is interrupted.
+        thread_functions = [self.FetchEntries] * SERVER_FETCH_THREAD_COUNT
+        if upload_enabled:
+            thread_functions.append(self.UploadEntries)
+        for thread_function in thread_functions:
+            thread = threading.Thread(target = thread_function)
+            thread.daemon = True
+            thread.start()
+
+    ## Starts fetching an entry from the server in the background.
+    ## \param[in] key - The key of the entry.
+    def Prefetch(self, key):
+        with self.lock:
+            already_fetched = (key in self.fetch_events_by_key)
+            if (not self.available) or already_fetched:
+                return
+            fetch_event = threading.Event()
+            self.fetch_events_by_key[key] = fetch_event
+        self.fetch_queue.put((key, fetch_event))
+
+    ## Fetches an entry from the server, waiting for the background fetch if one has been started.
+    ## \param[in] key - The key of the entry. The entry is stored in the local cache if it is found.
+    def Fetch(self, key):
+        # CHECK IF THE ENTRY IS ALREADY BEING FETCHED.
+        with self.lock:
+            fetch_event = self.fetch_events_by_key.get(key)
+            fetch_started = (fetch_event is not None)
+            if not fetch_started:
+                fetch_event = threading.Event()
+                self.fetch_events_by_key[key] = fetch_event
+
+        # WAIT FOR THE ENTRY.
+        if fetch_started:
+            fetch_event.wait()
+        else:
+            self.DownloadEntry(key)
+            fetch_event.set()
+
+    ## Queues an entry of the local cache to be uploaded to the server.
+    ## \param[in] key - The key of the entry.
+    def Upload(self, key):
+        if self.upload_enabled and self.available:
+            self.upload_queue.put(key)
+
+    ## Waits for the queued entries to be uploaded.
+    def Close(self):
+        if self.upload_enabled:
+            self.upload_queue.join()
+
+    ## Fetches the entries queued by Prefetch. This method runs on the fetch threads.
+    def FetchEntries(self):
+        while True:
+            key, fetch_event = self.fetch_queue.get()
+            try:
+                self.DownloadEntry(key)
+            finally:
+                fetch_event.set()
+
+    ## Uploads the entries queued by Upload. This method runs on the upload thread.
+    def UploadEntries(self):
+        while True:
+            key = self.upload_queue.get()
+            try:
+                self.UploadEntry(key)
+            finally:
+                self.upload_queue.task_done()
+
+    ## Downloads an entry into the local cache.
+    ## \param[in] key - The key of the entry.
+    def DownloadEntry(self, key):
+        # CHECK IF THE ENTRY IS NEEDED.
+        cache_entry_path = GetCacheEntryPath(self.cache_path, key)
+        if (not self.available) or os.path.isdir(cache_entry_path):
+            return
+
+        # DOWNLOAD THE ENTRY.
+        try:
+            response = urlopen(self.GetEntryUrl(key), timeout = SERVER_TIMEOUT_IN_SECONDS)
+            try:
+                archive_bytes = response.read()
+            finally:
+                response.close()
+        except HTTPError as error:
+            # The server does not have the entry.
+            if (404 != error.code):
+                Logs.debug('cache: could not fetch {} from the server: {}'.format(key, error))
+            return
+        except EnvironmentError as error:
+            self.Disable(error)
+            return
+
+        # STORE THE ENTRY IN THE LOCAL CACHE.
+        try:
+            UnpackEntry(archive_bytes, self.cache_path, cache_entry_path)
+            with self.lock:
+                self.fetched_keys.add(key)
+        except (EnvironmentError, tarfile.TarError) as error:
+            Logs.debug('cache: could not store {} from the server: {}'.format(key, error))
+
+    ## Uploads an entry of the local cache.
+    ## \param[in] key - The key of the entry.
+    def UploadEntry(self, key):
+        # PACK THE ENTRY.
+        # The entry may have been evicted by another build in the meantime.
+        if not self.available:
+            return
+        try:
+            archive_bytes = PackEntry(GetCacheEntryPath(self.cache_path, key))
+        except (EnvironmentError, tarfile.TarError) as error:
+            Logs.debug('cache: could not pack {}: {}'.format(key, error))
+            return
+
+        # UPLOAD THE ENTRY.
+        request = Request(self.GetEntryUrl(key), data = archive_bytes)
+        request.add_header('Content-Type', 'application/octet-stream')
+        request.get_method = lambda: 'PUT'
+        try:
+            urlopen(request, timeout = SERVER_TIMEOUT_IN_SECONDS).close()
+        except HTTPError as error:
+            Logs.debug('cache: could not upload {} to the server: {}'.format(key, error))
+        except EnvironmentError as error:
+            self.Disable(error)
+
+    ## Returns the URL of an entry on the server.
+    ## \param[in] key - The key of the entry.
+    def GetEntryUrl(self, key):
+        return '{}/{}'.format(self.server_url, key)
+
+    ## Stops using the server for the rest of the build, so that tasks are run locally instead of
+    ## waiting for a server that cannot be reached.
+    ## \param[in] error - The error raised when connecting to the server.
+    def Disable(self, error):
+        with self.lock:
+            was_available = self.available
+            self.available = False
+        if was_available:
+            Logs.warn('The compilation cache server {} cannot be reached, so tasks are run locally: {}'.format(
+                self.server_url,
+                error))
+
+## Returns the connection to the cache server used by the current build.
+## \param[in,out] build_context - The context of the current build. The connection is stored in the
+##      'cache_server_connection' attribute.
+## \return The connection, or None if no cache server is used.
+def GetCacheServerConnection(build_context):
+    server_url = getattr(Options.options, 'compilation_cache_server', '')
+    if not server_url:
+        return None
+    with _server_lock:
+        connection = getattr(build_context, 'cache_server_connection', None)
+        if not connection:
+            connection = CacheServerConnection(
+                server_url,
+                GetCompilationCachePath(build_context),
+                Options.options.compilation_cache_upload)
+            build_context.cache_server_connection = connection
+    return connection
+
+## Starts fetching the outputs of a task that is ready to run from the cache server, if they are not
+## already in the local cache.
+## \param[in] task - The task that is ready to run. Its signature has been computed.
+def PrefetchOutputs(task):
+    # CHECK IF THE OUTPUTS MAY BE ON THE SERVER.
+    if not IsCacheable(task):
+        return
+    build_context = task.generator.bld
+    connection = GetCacheServerConnection(build_context)
+    if not connection:
+        return
+
+    # FETCH THE OUTPUTS.
+    key = GetCacheKey(task)
+    cache_entry_path = GetCacheEntryPath(GetCompilationCachePath(build_context), key)
+    if not os.path.isdir(cache_entry_path):
+        connection.Prefetch(key)
+
+## Deletes the least recently used entries until the cache is within its size limit.
+## \param[in] cache_path - The directory of the compilation cache.
+## \param[in] size_limit - The size limit in bytes.
+## \return The number of bytes deleted.
+def TrimCompilationCache(cache_path, size_limit):
+    # FIND THE SIZE AND LAST USE OF EACH ENTRY.
+    entries = []
+    total_size = 0
+    for prefix_name in os.listdir(cache_path):
+        prefix_path = os.path.join(cache_path, prefix_name)
+        if (2 != len(prefix_name)) or not os.path.isdir(prefix_path):
+            continue
+        for key in os.listdir(prefix_path):
+            entry_path = os.path.join(prefix_path, key)
+            try:
+                entry_size = sum(
+                    os.path.getsize(os.path.join(entry_path, output_name))
+                    for output_name in os.listdir(entry_path))
+                entries.append((os.path.getmtime(entry_path), entry_size, entry_path))
+            except OSError:
+                # The entry was deleted by another build.
+                continue
+            total_size += entry_size
+
+    # DELETE THE LEAST RECENTLY USED ENTRIES.
+    deleted_size = 0
+    for last_use_time, entry_size, entry_path in sorted(entries):
+        if (total_size - deleted_size) <= size_limit:
+            break
+        shutil.rmtree(entry_path, ignore_errors = True)
+        deleted_size += entry_size
+    return deleted_size
+
+## Reports the use of the cache by the current build and keeps the cache within its size limit.
+## \param[in,out] build_context - The context of the current build. The statistics are cleared
+##      once they have been reported.
+def ReportCompilationCache(build_context):
+    # WAIT FOR THE UPLOADS TO THE SERVER.
+    connection = getattr(build_context, 'cache_server_connection', None)
+    if connection:
+        connection.Close()
+
+    # CHECK IF THE CACHE WAS USED.
+    cache_path = GetCompilationCachePath(build_context)
+    statistics = getattr(build_context, 'compilation_cache_statistics', None)
+    build_context.compilation_cache_statistics = None
+    if not (cache_path and statistics):
+        return
+
+    # KEEP THE CACHE WITHIN ITS SIZE LIMIT.
+    # The cache only grows when outputs are stored or fetched from the server.
+    evicted_size = 0
+    if statistics['stored_bytes'] or statistics['server_hits']:
+        size_limit = Options.options.compilation_cache_size * 1024 * 1024
+        evicted_size = TrimCompilationCache(cache_path, size_limit)
+
+    # REPORT THE STATISTICS.
+    lookup_count = statistics['hits'] + statistics['misses']
+    Logs.info('Compilation cache: {} hits ({} from the server), {} misses ({:.0%} hit rate), {:.1f} MB stored, {:.1f} MB evicted'.format(
+        statistics['hits'],
+        statistics['server_hits'],
+        statistics['misses'],
+        statistics['hits'] / lookup_count if lookup_count else 0,
+        statistics['stored_bytes'] / (1024 * 1024),
+        evicted_size / (1024 * 1024)))
+
+# Restore the outputs of cacheable tasks from the cache instead of running them, and store the outputs
+# of the tasks that are run. The patch wraps the method called by the task consumers, so it must only
+# be applied once even if this module is loaded more than once.
+_task_process_is_patched = getattr(Task.Task.process, 'uses_compilation_cache', False)
+if not _task_process_is_patched:
+    _old_task_process = Task.Task.process
+    def _task_process(self):
+        # CHECK IF THE TASK CAN BE CACHED.
+        build_context = self.generator.bld
+        cache_path = GetCompilationCachePath(build_context)
+        if not (cache_path and IsCacheable(self)):
+            return _old_task_process(self)
+
+        # FETCH THE OUTPUTS FROM THE SERVER.
+        # The fetch has usually been started when the task became ready to run.
+        key = GetCacheKey(self)
+        cache_entry_path = GetCacheEntryPath(cache_path, key)
+        connection = GetCacheServerConnection(build_context)
+        if connection and not os.path.isdir(cache_entry_path):
+            connection.Fetch(key)
+
+        # RESTORE THE OUTPUTS FROM THE CACHE.
+        # The task is then completed as if it had been run.
+        outputs_restored = RestoreOutputs(self, cache_entry_path)
+        if outputs_restored:
+            AddCacheStatistic(build_context, 'hits')
+            if connection and (key in connection.fetched_keys):
+                AddCacheStatistic(build_context, 'server_hits')
+            self.restored_from_cache = True
+            self.post_run()
+            self.hasrun = Task.SUCCESS
+            return
+
+        # RUN THE TASK AND STORE ITS OUTPUTS.
+        # The task may have been restored by an earlier build in the same process, such as one of the
+        # builds of the 'watch' command, but it is run by this one.
+        AddCacheStatistic(build_context, 'misses')
+        self.restored_from_cache = False
+        _old_task_process(self)
+        if Task.SUCCESS == self.hasrun:
+            stored_size = StoreOutputs(self, cache_path, cache_entry_path)
+            AddCacheStatistic(build_context, 'stored_bytes', stored_size)
+            if connection and stored_size:
+                connection.Upload(key)
+    # The guards of other patches of the method are kept, so that they are not applied again either.
+    _task_process.__dict__.update(_old_task_process.__dict__)
+    _task_process.uses_compilation_cache = True
+    Task.Task.process = _task_process
+
+# Start fetching the outputs of each task from the cache server as soon as the task is ready to run.
+# The scheduler checks which tasks are ready ahead of the task consumers, so the outputs are usually
+# fetched by the time a consumer runs the task.
+_task_runnable_status_is_patched = getattr(Task.Task.runnable_status, 'prefetches_compilation_cache', False)
+if not _task_runnable_status_is_patched:
+    _old_task_runnable_status = Task.Task.runnable_status
+    def _task_runnable_status(self):
+        # Execute the original method.
+        status = _old_task_runnable_status(self)
+        if Task.RUN_ME == status:
+            PrefetchOutputs(self)
+        return status
+    _task_runnable_status.__dict__.update(_old_task_runnable_status.__dict__)
+    _task_runnable_status.prefetches_compilation_cache = True
+    Task.Task.runnable_status = _task_runnable_status
+
+# Report the use of the cache once the build is done. The build state is stored whether or not the
+# build succeeds.
+_build_store_is_patched = getattr(Build.BuildContext.store, 'reports_compilation_cache', False)
+if not _build_store_is_patched:
+    _old_build_store = Build.BuildContext.store
+    def _build_store(self):
+        # Execute the original method.
+        _old_build_store(self)
+        ReportCompilationCache(self)
+    _build_store.__dict__.update(_old_build_store.__dict__)
+    _build_store.reports_compilation_cache = True
+    Build.BuildContext.store = _build_store
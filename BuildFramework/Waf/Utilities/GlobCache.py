@@ -0,0 +1,179 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import threading
+import time
+
+from waflib import Build
+from waflib import Logs
+from waflib import Node
+from waflib import Utils
+
+from Waf.Dependency.DependencyGraph import CalculateStamps
+from Waf.Dependency.DependencyGraph import IsRecentlyModified
+
+## \package Waf.Utilities.GlobCache
+## This package caches the results of ant_glob() between commands. Globbing a large directory tree
+## lists every directory in it and checks whether every entry is a directory, which takes seconds
+## on large trees of headers. A cached glob only checks the modification times of the directories
+## it listed, since adding, removing or renaming an entry of a directory changes its modification
+## time.
+##
+## ~~~
+## header_files = CachedAntGlob(project.path, 'Code/**/*.h')
+## ~~~
+##
+## Globs are cached by the directory they start from and their arguments, and are only globbed
+## again once one of the directories they listed changes. The cache is shared by all commands and
+## variants, and is stored in the build cache at the end of each command. Globs returning generators
+## are not cached.
+
+## The name of the glob cache in the build cache.
+GLOB_CACHE_FILE_NAME = 'glob_cache.pickle'
+
+## Globs that have not been used for this long are removed from the cache.
+UNUSED_GLOB_LIFETIME_IN_SECONDS = 30 * 24 * 60 * 60
+
+## Guards the cache, which is shared by the parallel task consumers.
+_glob_cache_lock = threading.Lock()
+
+## The cached globs by key, once loaded from the build cache.
+_globs_by_key = None
+
+## True if the cached globs have changed since they were loaded.
+_glob_cache_changed = False
+
+## The modification times of the directories listed by the glob running on each thread.
+_listed_dirs = threading.local()
+
+## Returns the path of the glob cache in the build cache.
+## \param[in] build_context - The context of the current command.
+def GetGlobCachePath(build_context):
+    return os.path.join(build_context.cache_dir, GLOB_CACHE_FILE_NAME)
+
+## Returns the cached globs, loading them from the build cache if they have not been loaded yet.
+## The cache lock must be held.
+## \param[in] build_context - The context of the current command.
+## \return The cached globs by key.
+def LoadGlobCache(build_context):
+    global _globs_by_key
+    if _globs_by_key is None:
+        # The globs are pickled like the build state, since they are loaded by every command.
+        try:
+            _globs_by_key = Build.cPickle.loads(Utils.readf(GetGlobCachePath(build_context), 'rb'))
+        except (EnvironmentError, EOFError):
+            _globs_by_key = {}
+        except Exception as error:
+            Logs.debug('glob_cache: the stored globs cannot be loaded: {!r}'.format(error))
+            _globs_by_key = {}
+    return _globs_by_key
+
+## Finds nodes like ant_glob(), reusing the nodes found by a previous command if none of the
+## directories that were listed have changed since.
+## \param[in] node - The directory from which to glob.
+## \param[in] k - The positional arguments of ant_glob().
+## \param[in] kw - The keyword arguments of ant_glob().
+## \return The nodes found.
+def CachedAntGlob(node, *k, **kw):
+    # CHECK IF THE GLOB CAN BE CACHED.
+    # Only globs within a build with a build cache can be cached.
+    build_context = getattr(node, 'ctx', None)
+    cache_dir = getattr(build_context, 'cache_dir', None)
+    is_cacheable = cache_dir and os.path.isdir(cache_dir) and not kw.get('generator')
+    if not is_cacheable:
+        return node.ant_glob(*k, **kw)
+
+    # REUSE THE CACHED GLOB IF NO LISTED DIRECTORY HAS CHANGED.
+    global _glob_cache_changed
+    glob_key = repr((node.abspath(), k, sorted(kw.items())))
+    with _glob_cache_lock:
+        cached_glob = LoadGlobCache(build_context).get(glob_key)
+    current_time = time.time()
+    if cached_glob and (CalculateStamps(cached_glob['stamps'].keys()) == cached_glob['stamps']):
+        # The time the glob was last used is only updated daily, so the cache is not stored
+        # after every command.
+        if (current_time - cached_glob['last_used_time']) > (24 * 60 * 60):
+            with _glob_cache_lock:
+                cached_glob['last_used_time'] = current_time
+                _glob_cache_changed = True
+        return [build_context.root.make_node(path) for path in cached_glob['paths']]
+
+    # GLOB, RECORDING THE DIRECTORIES THAT ARE LISTED.
+    _listed_dirs.modification_times_by_path = {}
+    try:
+        nodes = node.ant_glob(*k, **kw)
+    finally:
+        modification_times_by_path = _listed_dirs.modification_times_by_path
+        _listed_dirs.modification_times_by_path = None
+
+    # CACHE THE GLOB.
+    # The directories are stamped like the inputs of the dependency graph, where missing directories
+    # have empty stamps. Globs listing recently modified directories are not cached.
+    recently_modified = IsRecentlyModified(modification_times_by_path.values())
+    if not recently_modified:
+        stamps = dict(
+            (path, '' if (modification_time is None) else repr(modification_time))
+            for path, modification_time in modification_times_by_path.items())
+        with _glob_cache_lock:
+            LoadGlobCache(build_context)[glob_key] = {
+                'paths': [found_node.abspath() for found_node in nodes],
+                'stamps': stamps,
+                'last_used_time': current_time}
+            _glob_cache_changed = True
+    return nodes
+
+## Stores the cached globs in the build cache if they have changed. Globs that have not been used
+## for a long time are removed.
+## \param[in] build_context - The context of the current command.
+def StoreGlobCache(build_context):
+    # CHECK IF THE CACHE HAS CHANGED.
+    global _glob_cache_changed
+    with _glob_cache_lock:
+        if not _glob_cache_changed:
+            return
+        _glob_cache_changed = False
+
+        # REMOVE THE GLOBS THAT ARE NO LONGER USED.
+        oldest_last_used_time = time.time() - UNUSED_GLOB_LIFETIME_IN_SECONDS
+        for glob_key, cached_glob in list(_globs_by_key.items()):
+            if cached_glob['last_used_time'] < oldest_last_used_time:
+                del _globs_by_key[glob_key]
+        glob_cache_data = Build.cPickle.dumps(_globs_by_key, Build.PROTOCOL)
+
+    # STORE THE CACHE.
+    try:
+        Utils.writef(GetGlobCachePath(build_context), glob_cache_data, 'wb')
+    except EnvironmentError as error:
+        Logs.warn('Could not store the glob cache: {}'.format(error))
+
+# Record the modification time of each directory listed by a glob before it is listed, so that a
+# change made while globbing invalidates the cached glob. The patches must only be applied once
+# even if this module is loaded more than once.
+_node_listdir_is_patched = getattr(Node.Node.listdir, 'records_glob_dirs', False)
+if not _node_listdir_is_patched:
+    _old_node_listdir = Node.Node.listdir
+    def _node_listdir(self):
+        modification_times_by_path = getattr(_listed_dirs, 'modification_times_by_path', None)
+        if modification_times_by_path is not None:
+            dir_path = self.abspath()
+            try:
+                modification_times_by_path[dir_path] = os.stat(dir_path).st_mtime
+            except OSError:
+                modification_times_by_path[dir_path] = None
+        return _old_node_listdir(self)
+    _node_listdir.__dict__.update(_old_node_listdir.__dict__)
+    _node_listdir.records_glob_dirs = True
+    Node.Node.listdir = _node_listdir
+
+# Store the cached globs at the end of every command that can glob, whether or not it succeeds.
+_build_execute_is_patched = getattr(Build.BuildContext.execute, 'stores_glob_cache', False)
+if not _build_execute_is_patched:
+    _old_build_execute = Build.BuildContext.execute
+    def _build_execute(self):
+        try:
+            return _old_build_execute(self)
+        finally:
+            StoreGlobCache(self)
+    _build_execute.__dict__.update(_old_build_execute.__dict__)
+    _build_execute.stores_glob_cache = True
+    Build.BuildContext.execute = _build_execute
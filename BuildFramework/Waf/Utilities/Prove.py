@@ -1,16 +1,45 @@
 from __future__ import absolute_import, division, print_function
 
-from collections import defaultdict
-import itertools
-
+from waflib import Errors
+from waflib import Logs
+from waflib import Options
 from waflib.Build import BuildContext
 
-from Waf.Dependency.Parents import GetImmediateParents
+from Waf.Dependency.Critical import MAX_REMAINING_DURATION_WEIGHT
+from Waf.Dependency.DependencyGraph import GetDependencyGraph
 from Waf.Utilities import GetTargetProjects
+from Waf.Utilities.TaskHistory import LoadProjectDurations
+from Waf.Utilities.TaskHistory import LoadProjectFailures
 
 ## \package Waf.Utilities.Prove
 ## This package defines the 'prove' command.
 
+## The difference in task weight between consecutive projects in the proving order. Waf runs the
+## ready task with the highest weight plus the number of tasks waiting on it, and every build adds
+## a weight for the recorded duration of the tasks, so the step must be larger than both for the
+## order to take precedence. The step leaves as much room for waiting tasks as for the duration.
+PROVE_ORDER_WEIGHT_STEP = 2 * MAX_REMAINING_DURATION_WEIGHT
+
+## Adds the options for the prove command.
+## \param[in] options_context - The options context is shared by all user defined options methods.
+def options(options_context):
+    # CREATE AN OPTION GROUP FOR THE PROVE OPTIONS.
+    prove_option_group = options_context.add_option_group("Prove options")
+
+    # LOAD THE COMMAND LINE ARGUMENTS.
+    prove_option_group.add_option(
+        '--fail-fast',
+        action = 'store_true',
+        default = False,
+        help = 'Stop proving as soon as any project fails to build, even if --keep is given.')
+    prove_option_group.add_option(
+        '--prove-order',
+        action = 'store',
+        choices = ['cheapest', 'likely-to-fail'],
+        default = 'cheapest',
+        help = ('The order in which children are built, based on previous builds: the cheapest first, '
+            'or the most recently failed first.'))
+
 ## Proves that changes to the given targets are healthy by building all children. The command will
 ## also run child tests if tests are enabled.
 class ProveContext(BuildContext):
@@ -22,39 +51,89 @@ class ProveContext(BuildContext):
         # PRESERVE THE BEHAVIOR OF THE BUILD COMMAND.
         super(ProveContext, self).pre_build()
 
-        # GATHER THE CHILDREN OF ALL PROJECTS.
+        # LOAD THE DEPENDENCY GRAPH.
         # A project expresses parent dependencies using the 'use', 'depends_on', 'runs_after'
-        # or dynamic attribute. The children are gathered up front so that the algorithm can
-        # efficiently traverse the project tree from parent to children.
-        children_by_parent_name = defaultdict(set)
-        projects = list(itertools.chain.from_iterable(self.groups))
-        for project in projects:
-            # Get the immediate parents of the project.
-            parent_names = GetImmediateParents(project)
-
-            # Add this project as a child of its parent project.
-            for parent_name in parent_names:
-                children_by_parent_name[parent_name].add(project)
+        # or dynamic attribute. The reverse transitive closure of the graph gives all direct and
+        # indirect children of every project without traversing the project tree.
+        dependency_graph = GetDependencyGraph(self)
+        child_closure = dependency_graph.GetChildClosure()
 
         # TARGET PROJECTS ARE RESTRICTED BASED ON THE COMMAND CONTEXT.
         # This provides consistent target semantics across all commands.
-        target_projects = GetTargetProjects(self)
-
-        # BUILD ALL CHILDREN OF THE GIVEN TARGETS.
-        visited_target_names = set()
-        while target_projects:
-            # VISIT EACH TARGET EXACTLY ONCE.
-            target_project = target_projects.pop()
-            already_visited = target_project.name in visited_target_names
-            if already_visited:
-                continue
-            else:
-                visited_target_names.add(target_project.name)
-
-            # BUILD THE CURRENT PROJECT.
-            # If the project has already been built, then the result will be cached.
+        proven_target_projects = GetTargetProjects(self)
+        self.proven_target_names = set(target_project.name for target_project in proven_target_projects)
+
+        # FIND ALL CHILDREN OF THE GIVEN TARGETS.
+        # The children of all targets are merged as bitsets. Targets that are children of other
+        # targets are built as targets.
+        child_bits = 0
+        for target_name in self.proven_target_names:
+            child_bits |= child_closure.GetReachableBits(target_name)
+        child_names = child_closure.GetNamesFromBits(child_bits) - self.proven_target_names
+
+        # BUILD THE TARGETS AND ALL CHILDREN.
+        # If a project has already been built, then the result will be cached.
+        for target_project in proven_target_projects:
             target_project.post()
+        child_projects = []
+        for child_name in sorted(child_names):
+            child_project = self.get_tgen_by_name(child_name)
+            child_project.post()
+            child_projects.append(child_project)
+
+        # ORDER THE CHILDREN.
+        # Building the children most likely to give a verdict first gives feedback sooner. The
+        # targets are built before all children, since every child depends on at least one of them.
+        OrderChildProjects(self, child_projects, Options.options.prove_order)
+        target_weight = (len(child_projects) + 1) * PROVE_ORDER_WEIGHT_STEP
+        for target_project in proven_target_projects:
+            for task in target_project.tasks:
+                task.weight = target_weight
+
+        # STOP AT THE FIRST FAILURE IF REQUESTED.
+        if Options.options.fail_fast:
+            self.keep = 0
+
+    # Builds the targets and children, reporting the projects that could not be proven.
+    def compile(self):
+        try:
+            super(ProveContext, self).compile()
+        except Errors.BuildError as error:
+            # REPORT THE BROKEN PROJECTS.
+            # A broken child means the change to the target broke a project that depends on it.
+            broken_project_names = set(getattr(task.generator, 'name', '') for task in error.tasks)
+            for broken_project_name in sorted(broken_project_names):
+                is_target = (broken_project_name in self.proven_target_names)
+                Logs.error('Prove failed: {} {} is broken'.format(
+                    'target' if is_target else 'child',
+                    broken_project_name))
+            raise
+
+## Orders the tasks of the given child projects by setting their weight. The order is based on the
+## history of previous builds. Projects without a history are built last in the cheapest-first
+## order, since nothing is known about their cost.
+## \param[in] build_context - The context of the current build.
+## \param[in,out] child_projects - The posted child projects. The weight of each of their tasks is set.
+## \param[in] prove_order - 'cheapest' to build the projects that took the least time first, or
+##      'likely-to-fail' to build the projects that failed most recently first.
+def OrderChildProjects(build_context, child_projects, prove_order):
+    # LOAD THE HISTORY OF THE PROJECTS.
+    durations_by_project_name = LoadProjectDurations(build_context)
+    failures_by_project_name = LoadProjectFailures(build_context)
+
+    # DETERMINE THE ORDER OF THE PROJECTS.
+    def GetCostKey(project):
+        duration = durations_by_project_name.get(project.name)
+        return ((duration is None), duration, project.name)
+    def GetFailureKey(project):
+        failure_count, last_failure_time = failures_by_project_name.get(project.name, (0, 0))
+        return (-last_failure_time, -failure_count) + GetCostKey(project)
+    order_key = GetFailureKey if ('likely-to-fail' == prove_order) else GetCostKey
+    ordered_projects = sorted(child_projects, key = order_key)
 
-            # VISIT ALL CHILDREN.
-            child_projects = children_by_parent_name[target_project.name]
-            target_projects.extend(child_projects)
+    # WEIGHT THE TASKS OF EACH PROJECT.
+    # The first project is given the highest weight.
+    for project_index, project in enumerate(ordered_projects):
+        weight = (len(ordered_projects) - project_index) * PROVE_ORDER_WEIGHT_STEP
+        for task in project.tasks:
+            task.weight = weight
@@ -0,0 +1,283 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import sqlite3
+import threading
+import time
+
+from waflib import Build
+from waflib import Logs
+from waflib import Task
+from waflib import Utils
+
+## \package Waf.Utilities.TaskHistory
+## This package records how long each task takes to run, how it exited, how large its outputs are and
+## which projects have failed to build. The history is stored in the build cache when the build state
+## is stored, so it is available to later commands that analyze or order the build (for example,
+## 'critical' and 'prove') and to the scheduler, which starts the longest tasks first.
+##
+## Tasks are identified by their unique ID, which is derived from the task class and the paths of
+## its inputs and outputs. The ID is stable across builds, so the most recent duration of a task is
+## kept until the task runs again. The signature of the inputs of the most recent run is recorded
+## alongside it, since the signature changes whenever the task has to run again. Tasks run by a
+## sub-task pipeline also record the duration of each sub-task, so that a slow task can be broken
+## down into its steps.
+
+## Guards the history recorded by the parallel task consumers.
+_recording_lock = threading.Lock()
+
+## Returns the path of the task history in the build cache. Each variant has its own history because
+## the same task may take very different amounts of time with different settings.
+## \param[in] build_context - The context of the current build.
+def GetTaskHistoryPath(build_context):
+    history_file_name = '{}_task_history.sqlite'.format(build_context.variant or 'default')
+    return os.path.join(build_context.cache_dir, history_file_name)
+
+## Returns the key identifying the given task in the task history.
+## \param[in] task - The task to identify.
+def GetTaskKey(task):
+    return Utils.to_hex(task.uid())
+
+## Opens the task history, creating it if it does not exist.
+## \param[in] build_context - The context of the current build.
+## \return The connection to the task history database.
+def OpenTaskHistory(build_context):
+    connection = sqlite3.connect(GetTaskHistoryPath(build_context))
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS task_runs ('
+        'task_key TEXT PRIMARY KEY, '
+        'project_name TEXT, '
+        'signature TEXT, '
+        'duration REAL, '
+        'exit_status INTEGER, '
+        'output_size INTEGER, '
+        'run_time REAL)')
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS sub_task_runs ('
+        'task_key TEXT, '
+        'sub_task_index INTEGER, '
+        'sub_task_name TEXT, '
+        'duration REAL, '
+        'PRIMARY KEY (task_key, sub_task_index))')
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS project_failures ('
+        'project_name TEXT PRIMARY KEY, '
+        'failure_count INTEGER, '
+        'last_failure_time REAL)')
+    return connection
+
+## Loads the most recent duration of each task.
+## \param[in] build_context - The context of the current build.
+## \return The durations in seconds by task key. Tasks that have never run successfully are excluded.
+def LoadTaskDurations(build_context):
+    rows = QueryTaskHistory(build_context, 'SELECT task_key, duration FROM task_runs WHERE duration IS NOT NULL')
+    return dict(rows)
+
+## Loads the durations of the sub-tasks of each task, as of the most recent successful run.
+## \param[in] build_context - The context of the current build.
+## \return The name and duration in seconds of each sub-task in the order in which they are run, by
+##      task key. Tasks without sub-tasks are excluded.
+def LoadSubTaskDurations(build_context):
+    rows = QueryTaskHistory(
+        build_context,
+        'SELECT task_key, sub_task_name, duration FROM sub_task_runs ORDER BY task_key, sub_task_index')
+    sub_task_durations_by_task_key = {}
+    for task_key, sub_task_name, duration in rows:
+        sub_task_durations_by_task_key.setdefault(task_key, []).append((sub_task_name, duration))
+    return sub_task_durations_by_task_key
+
+## Loads the total of the most recent durations of the tasks of each project.
+## \param[in] build_context - The context of the current build.
+## \return The durations in seconds by project name. Projects that have never run successfully are
+##      excluded.
+def LoadProjectDurations(build_context):
+    rows = QueryTaskHistory(build_context, 'SELECT project_name, SUM(duration) FROM task_runs WHERE duration IS NOT NULL GROUP BY project_name')
+    return dict(rows)
+
+## Loads the failure history of each project.
+## \param[in] build_context - The context of the current build.
+## \return Tuples of the number of failed builds and the time of the last failure, by project name.
+##      Projects that have never failed are excluded.
+def LoadProjectFailures(build_context):
+    rows = QueryTaskHistory(build_context, 'SELECT project_name, failure_count, last_failure_time FROM project_failures')
+    return dict((project_name, (failure_count, last_failure_time)) for project_name, failure_count, last_failure_time in rows)
+
+## Runs a query against the task history.
+## \param[in] build_context - The context of the current build.
+## \param[in] query - The SQL query to run.
+## \return The rows returned by the query. No rows are returned if there is no history.
+def QueryTaskHistory(build_context, query):
+    # CHECK IF ANY TASKS HAVE BEEN RECORDED.
+    if not os.path.isfile(GetTaskHistoryPath(build_context)):
+        return []
+
+    # RUN THE QUERY.
+    try:
+        connection = OpenTaskHistory(build_context)
+        try:
+            return connection.execute(query).fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error as error:
+        Logs.warn('Could not load the task history: {}'.format(error))
+        return []
+
+## Returns the exit status of a task that has just been run.
+## \param[in] task - The task that has been run.
+## \return 0 if the task succeeded, the exit code of the command if it failed, or -1 if the task
+##      raised an exception or did not create its outputs.
+def GetTaskExitStatus(task):
+    if (Task.SUCCESS == task.hasrun):
+        return 0
+    exit_code = getattr(task, 'err_code', None)
+    if (Task.CRASHED == task.hasrun) and isinstance(exit_code, int):
+        return exit_code
+    return -1
+
+## Returns the total size of the outputs of a task.
+## \param[in] task - The task that has been run.
+## \return The size in bytes. Outputs that do not exist are ignored.
+def GetTaskOutputSize(task):
+    output_size = 0
+    for output in task.outputs:
+        try:
+            output_size += os.path.getsize(output.abspath())
+        except OSError:
+            pass
+    return output_size
+
+## Records a task that has just been run. This method is called by the task consumers, so it may be
+## called from several threads at once.
+## \param[in] task - The task that has been run.
+## \param[in] duration - The time taken to run the task, in seconds.
+def RecordTaskDuration(task, duration):
+    # CHECK IF THE TASK WAS RUN.
+    # Outputs restored from the compilation cache say nothing about the cost of running the task.
+    restored_from_cache = getattr(task, 'restored_from_cache', False)
+    if restored_from_cache:
+        return
+
+    build_context = task.generator.bld
+    project_name = getattr(task.generator, 'name', '')
+    task_successful = (Task.SUCCESS == task.hasrun)
+    signature = getattr(task, 'cache_sig', None)
+
+    # GATHER THE DURATIONS OF THE SUB-TASKS.
+    sub_task_durations = []
+    sub_task_pipeline = getattr(task, 'sub_task_pipeline', None)
+    if sub_task_pipeline and task_successful:
+        sub_task_durations = [
+            (sub_task_name, sub_task_duration)
+            for sub_task_name, sub_task_duration, sub_task_result in sub_task_pipeline.sub_task_results]
+
+    # DESCRIBE THE RUN.
+    # Only successful runs are representative of the cost of the task, so the duration, output
+    # size and sub-task durations of a failed run are not recorded.
+    task_run = (
+        project_name,
+        Utils.to_hex(signature) if signature else None,
+        duration if task_successful else None,
+        GetTaskExitStatus(task),
+        GetTaskOutputSize(task) if task_successful else None,
+        time.time(),
+        sub_task_durations)
+
+    with _recording_lock:
+        # RECORD THE RUN.
+        if not hasattr(build_context, 'recorded_task_runs'):
+            build_context.recorded_task_runs = {}
+        build_context.recorded_task_runs[GetTaskKey(task)] = task_run
+
+        # RECORD FAILURES BY PROJECT.
+        if not task_successful:
+            if not hasattr(build_context, 'recorded_project_failures'):
+                build_context.recorded_project_failures = set()
+            build_context.recorded_project_failures.add(project_name)
+
+## Stores the task runs and failures recorded during the current build in the task history.
+## \param[in,out] build_context - The context of the current build. The recorded history is cleared
+##      once it has been stored.
+def StoreTaskHistory(build_context):
+    # CHECK IF THE BUILD STATE IS KEPT.
+    # The builds run by configuration checks do not have a build cache.
+    if not os.path.isdir(build_context.cache_dir):
+        return
+
+    # CHECK IF ANY TASKS WERE RUN.
+    with _recording_lock:
+        recorded_task_runs = getattr(build_context, 'recorded_task_runs', {})
+        recorded_project_failures = getattr(build_context, 'recorded_project_failures', set())
+        build_context.recorded_task_runs = {}
+        build_context.recorded_project_failures = set()
+    if not (recorded_task_runs or recorded_project_failures):
+        return
+
+    # STORE THE HISTORY.
+    # The previous run of each task is replaced, except that a failed run keeps the duration and
+    # output size of the last successful run. Each build counts once as a failure of a project, no
+    # matter how many of its tasks failed.
+    successful_run_rows = []
+    failed_run_rows = []
+    sub_task_rows = []
+    for task_key, task_run in recorded_task_runs.items():
+        project_name, signature, duration, exit_status, output_size, run_time, sub_task_durations = task_run
+        if duration is None:
+            failed_run_rows.append((task_key, project_name, signature, exit_status, run_time))
+        else:
+            successful_run_rows.append((task_key, project_name, signature, duration, exit_status, output_size, run_time))
+            sub_task_rows.extend(
+                (task_key, sub_task_index, sub_task_name, sub_task_duration)
+                for sub_task_index, (sub_task_name, sub_task_duration) in enumerate(sub_task_durations))
+    failure_time = time.time()
+    try:
+        connection = OpenTaskHistory(build_context)
+        try:
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO task_runs VALUES (?, ?, ?, ?, ?, ?, ?)', successful_run_rows)
+                # The sub-tasks of a task may have changed since it last ran, so all of them are replaced.
+                connection.executemany('DELETE FROM sub_task_runs WHERE task_key = ?', [(row[0],) for row in successful_run_rows])
+                connection.executemany('INSERT INTO sub_task_runs VALUES (?, ?, ?, ?)', sub_task_rows)
+                for task_key, project_name, signature, exit_status, run_time in failed_run_rows:
+                    connection.execute('INSERT OR IGNORE INTO task_runs (task_key) VALUES (?)', (task_key,))
+                    connection.execute(
+                        'UPDATE task_runs SET project_name = ?, signature = ?, exit_status = ?, run_time = ? WHERE task_key = ?',
+                        (project_name, signature, exit_status, run_time, task_key))
+                for project_name in recorded_project_failures:
+                    connection.execute('INSERT OR IGNORE INTO project_failures VALUES (?, 0, 0)', (project_name,))
+                    connection.execute(
+                        'UPDATE project_failures SET failure_count = failure_count + 1, last_failure_time = ? WHERE project_name = ?',
+                        (failure_time, project_name))
+        finally:
+            connection.close()
+    except sqlite3.Error as error:
+        Logs.warn('Could not store the task history: {}'.format(error))
+
+# Measure each task as it is run. The patch wraps the method called by the task consumers, so it
+# must only be applied once even if this module is loaded more than once.
+_task_process_is_patched = getattr(Task.Task.process, 'records_task_duration', False)
+if not _task_process_is_patched:
+    _old_task_process = Task.Task.process
+    def _task_process(self):
+        # Execute the original method.
+        start_time = time.time()
+        try:
+            return _old_task_process(self)
+        finally:
+            RecordTaskDuration(self, time.time() - start_time)
+    # The guards of other patches of the method are kept, so that they are not applied again either.
+    _task_process.__dict__.update(_old_task_process.__dict__)
+    _task_process.records_task_duration = True
+    Task.Task.process = _task_process
+
+# Store the task history along with the rest of the build state. The build state is stored whether
+# or not the build succeeds, so durations of tasks that ran before a failure are kept.
+_build_store_is_patched = getattr(Build.BuildContext.store, 'stores_task_history', False)
+if not _build_store_is_patched:
+    _old_build_store = Build.BuildContext.store
+    def _build_store(self):
+        # Execute the original method.
+        _old_build_store(self)
+        StoreTaskHistory(self)
+    _build_store.__dict__.update(_old_build_store.__dict__)
+    _build_store.stores_task_history = True
+    Build.BuildContext.store = _build_store
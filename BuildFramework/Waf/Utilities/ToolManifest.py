@@ -0,0 +1,432 @@
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import sys
+
+from waflib import Build
+from waflib import Configure
+from waflib import Context
+from waflib import Logs
+from waflib import Node
+from waflib import Options
+from waflib import Runner
+from waflib import Task
+from waflib import TaskGen
+from waflib import Utils
+
+## \package Waf.Utilities.ToolManifest
+## This package loads the custom Waf tools from a manifest, so that the tools that are not needed by
+## the current command are never imported. Importing every tool on every command is a large part of
+## the startup time of Waf, and some tools import large libraries (for example, the IDE generators
+## import jinja2).
+##
+## The manifest is generated by importing every tool once, and records what each tool provides: the
+## commands it defines, the options it adds and the features and task classes it registers. Tools that
+## only provide these are loaded lazily:
+## - A tool defining commands is loaded when one of its commands is run, or when one of its options or
+##   commands is given on the command line.
+## - A tool registering features or task classes is loaded when a project using the features is
+##   posted, or when a task of one of the classes is created.
+##
+## All other tools are loaded by every command as before. These are the packages of tools, the tools
+## that initialize or configure the command contexts and the tools that change Waf itself, such as by
+## patching its classes or adding methods to the command contexts. Tools that add options without
+## defining any commands are loaded by every command as well, since they may use the options anywhere.
+##
+## The manifest is kept in the build cache and is generated again whenever a tool is added, removed or
+## changed. A tool is attributed the changes made by the functions and classes defined in it, even when
+## it is first imported by another tool.
+
+## The path of the manifest, which is kept in the build cache like the stored options.
+TOOL_MANIFEST_PATH = 'build/c4che/tool_manifest.json'
+
+## The arguments that print the help. The help lists the commands and options of all tools.
+HELP_ARGUMENTS = ['-h', '--help']
+
+## The manifest used by the current command. Directories are added as their tools are described while
+## the manifest is generated.
+_manifest = None
+
+## True while the manifest is being generated.
+_generating_manifest = False
+
+## The depth of the nested calls loading tool directories.
+_load_depth = 0
+
+## The (tool directory path, tool name) pairs of the tools that have been loaded.
+_loaded_tool_keys = set()
+
+## The directories whose tools are being described while the manifest is generated.
+_described_tool_dir_paths = []
+
+## What each tool provides while the manifest is generated, by the path of the tool.
+_descriptions_by_tool_path = {}
+
+## Loads the tools of a directory that are needed by the current command. The function executes the
+## function of each tool that has the same name as the command of the context.
+## \param[in] context - The current command context.
+## \param[in] tool_dir_path - The absolute path of the directory containing the tools.
+def LoadToolDirectory(context, tool_dir_path):
+    global _manifest
+    global _generating_manifest
+    global _load_depth
+
+    # READ THE MANIFEST.
+    # The manifest can only be generated while the options are added, since the options of each tool
+    # must be recorded.
+    if _manifest is None:
+        _manifest = ReadToolManifest()
+        if _manifest is None:
+            _manifest = {'waf_version': Context.WAFVERSION, 'stamps': {}, 'tool_dirs': {}}
+            _generating_manifest = isinstance(context, Options.OptionsContext)
+
+    _load_depth += 1
+    try:
+        tools = _manifest['tool_dirs'].get(tool_dir_path)
+        if tools is not None:
+            # LOAD THE TOOLS NEEDED BY THE CURRENT COMMAND.
+            tool_names = [tool['name'] for tool in tools if IsToolNeeded(context, tool_dir_path, tool)]
+            for tool_name in tool_names:
+                _loaded_tool_keys.add((tool_dir_path, tool_name))
+            context.load(tool_names, tooldir = [tool_dir_path])
+        elif _generating_manifest:
+            # DESCRIBE THE TOOLS WHILE LOADING ALL OF THEM.
+            _manifest['tool_dirs'][tool_dir_path] = DescribeToolDirectory(context, tool_dir_path)
+        else:
+            # LOAD ALL TOOLS IN DIRECTORIES MISSING FROM THE MANIFEST.
+            context.load(FindToolNames(tool_dir_path), tooldir = [tool_dir_path])
+    finally:
+        _load_depth -= 1
+
+    # STORE THE MANIFEST ONCE ALL TOOLS HAVE BEEN DESCRIBED.
+    if _generating_manifest and (0 == _load_depth):
+        _generating_manifest = False
+        CompleteToolManifest(_manifest)
+        WriteToolManifest(_manifest)
+
+## Finds the tools in a directory. A tool is a Python script or a Python package, other than the
+## package of the directory itself.
+## \param[in] tool_dir_path - The absolute path of the directory containing the tools.
+## \return The names of the tools, in alphabetical order.
+def FindToolNames(tool_dir_path):
+    tool_names = []
+    for file_name in sorted(os.listdir(tool_dir_path)):
+        # CHECK IF THE FILE IS A TOOL.
+        file_path = os.path.join(tool_dir_path, file_name)
+        is_python_script = (
+            os.path.isfile(file_path) and
+            file_path.endswith('.py'))
+        is_python_module = (
+            os.path.isdir(file_path) and
+            os.path.isfile(os.path.join(file_path, '__init__.py')))
+        is_waf_tool = (is_python_script or is_python_module)
+        if not is_waf_tool:
+            continue
+
+        # CHECK IF THE FILE IS THE PACKAGE OF THE DIRECTORY.
+        tool_name, python_ext = os.path.splitext(file_name)
+        is_current_tool = (tool_name == '__init__')
+        if is_current_tool:
+            continue
+
+        tool_names.append(tool_name)
+    return tool_names
+
+## Checks if a tool must be loaded by the current command.
+## \param[in] context - The current command context.
+## \param[in] tool_dir_path - The absolute path of the directory containing the tool.
+## \param[in] tool - The description of the tool in the manifest.
+## \return True if the tool must be loaded; false if it can be loaded lazily.
+def IsToolNeeded(context, tool_dir_path, tool):
+    # CHECK IF THE TOOL IS ALWAYS LOADED.
+    if not tool['lazy']:
+        return True
+    already_loaded = ((tool_dir_path, tool['name']) in _loaded_tool_keys)
+    if already_loaded:
+        return True
+
+    # CHECK IF THE TOOL IS USED ON THE COMMAND LINE.
+    # The options are parsed after they are added, so the arguments are only checked for the commands
+    # and options of the tool. Options may be abbreviated to any unique prefix.
+    if not isinstance(context, Options.OptionsContext):
+        return False
+    for argument in sys.argv[1:]:
+        if argument in HELP_ARGUMENTS:
+            return True
+        if argument.startswith('--'):
+            option_string = argument.split('=', 1)[0]
+            if any(tool_option.startswith(option_string) for tool_option in tool['options']):
+                return True
+        elif argument in tool['commands']:
+            return True
+    return False
+
+## Loads the lazily loaded tools providing a command, feature or task class that has not been loaded.
+## \param[in] provided_name - The name of the command, feature or task class.
+## \param[in] provided_kind - 'commands', 'features' or 'task_classes'.
+def LoadLazyTools(provided_name, provided_kind):
+    if not _manifest:
+        return
+    for tool_dir_path, tools in _manifest['tool_dirs'].items():
+        for tool in tools:
+            tool_needed = (
+                tool['lazy'] and
+                (provided_name in tool[provided_kind]) and
+                ((tool_dir_path, tool['name']) not in _loaded_tool_keys))
+            if tool_needed:
+                LoadLazyTool(tool_dir_path, tool)
+
+## Loads a tool after the options have been parsed. The options of the tool were not given on the
+## command line, so they are set to their defaults.
+## \param[in] tool_dir_path - The absolute path of the directory containing the tool.
+## \param[in] tool - The description of the tool in the manifest.
+def LoadLazyTool(tool_dir_path, tool):
+    # LOAD THE TOOL.
+    Logs.debug('tools: loading {} lazily'.format(tool['name']))
+    _loaded_tool_keys.add((tool_dir_path, tool['name']))
+    module = Context.load_tool(tool['name'], [tool_dir_path])
+
+    # SET THE DEFAULTS OF ITS OPTIONS.
+    add_options = getattr(module, 'options', None)
+    if add_options:
+        options_context = Options.OptionsContext()
+        add_options(options_context)
+        default_values = options_context.parser.get_default_values()
+        for option_name, default_value in vars(default_values).items():
+            if not hasattr(Options.options, option_name):
+                setattr(Options.options, option_name, default_value)
+
+## Returns the paths of the tool directories and tools described by the manifest. Other caches
+## depending on the tools can be invalidated when they change.
+## \return The absolute paths, or an empty list if the tools have not been loaded.
+def GetToolPaths():
+    if not _manifest:
+        return []
+    return sorted(_manifest['stamps'])
+
+## Reads the manifest from the build cache.
+## \return The manifest, or None if it does not exist or is out of date.
+def ReadToolManifest():
+    # READ THE MANIFEST.
+    try:
+        manifest = json.loads(Utils.readf(TOOL_MANIFEST_PATH))
+    except (EnvironmentError, ValueError):
+        return None
+
+    # CHECK IF ANY TOOL HAS CHANGED.
+    # Adding or removing a tool changes the time of modification of its directory.
+    if manifest.get('waf_version') != Context.WAFVERSION:
+        return None
+    for path, modification_time in manifest['stamps'].items():
+        try:
+            if os.path.getmtime(path) != modification_time:
+                return None
+        except OSError:
+            return None
+    return manifest
+
+## Writes the manifest to the build cache.
+## \param[in] manifest - The manifest to write.
+def WriteToolManifest(manifest):
+    try:
+        manifest_dir_path = os.path.dirname(TOOL_MANIFEST_PATH)
+        if not os.path.isdir(manifest_dir_path):
+            os.makedirs(manifest_dir_path)
+        Utils.writef(TOOL_MANIFEST_PATH, json.dumps(manifest, indent = 1, sort_keys = True))
+    except EnvironmentError as error:
+        Logs.warn('Could not store the tool manifest: {}'.format(error))
+
+## Loads all tools of a directory, describing what each of them provides.
+## \param[in] context - The options context.
+## \param[in] tool_dir_path - The absolute path of the directory containing the tools.
+## \return The descriptions of the tools, which are completed once all tools have been loaded.
+def DescribeToolDirectory(context, tool_dir_path):
+    _described_tool_dir_paths.append(tool_dir_path)
+    tools = []
+    for tool_name in FindToolNames(tool_dir_path):
+        # LOAD THE TOOL.
+        # The registries of Waf are compared before and after, since the tool may change them both
+        # when it is imported and when its options are added.
+        registry_snapshot = TakeRegistrySnapshot()
+        option_strings_before = set(GetOptionStrings(context))
+        _loaded_tool_keys.add((tool_dir_path, tool_name))
+        context.load([tool_name], tooldir = [tool_dir_path])
+        module = sys.modules[tool_name]
+
+        # RECORD WHAT THE TOOL PROVIDES.
+        tool_path = GetModuleToolPath(module)
+        is_package = os.path.isdir(os.path.join(tool_dir_path, tool_name))
+        tool_file_path = os.path.join(tool_dir_path, tool_name, '__init__.py') if is_package else os.path.join(tool_dir_path, tool_name + '.py')
+        _manifest['stamps'][tool_file_path] = os.path.getmtime(tool_file_path)
+        description = _descriptions_by_tool_path.setdefault(tool_path, NewToolDescription())
+        description['options'] = sorted(set(GetOptionStrings(context)) - option_strings_before)
+        description['functions'] = [
+            function_name for function_name in ['options', 'init', 'configure', 'build']
+            if hasattr(module, function_name)]
+        description['is_package'] = is_package
+        AttributeRegistryChanges(registry_snapshot, tool_path)
+        tools.append({'name': tool_name, 'path': tool_path})
+
+    # STAMP THE DIRECTORY.
+    # The directory is stamped after its tools are imported, since Python may write compiled files
+    # to it.
+    _manifest['stamps'][tool_dir_path] = os.path.getmtime(tool_dir_path)
+    return tools
+
+## Completes the descriptions of the tools once all of them have been loaded. The changes a tool
+## makes may have been recorded while another tool was loaded, if that tool imported it.
+## \param[in,out] manifest - The manifest whose tools are described.
+def CompleteToolManifest(manifest):
+    for tools in manifest['tool_dirs'].values():
+        for tool in tools:
+            description = _descriptions_by_tool_path.get(tool.pop('path'), NewToolDescription())
+            tool['commands'] = sorted(description['commands'])
+            tool['options'] = description['options']
+            tool['features'] = sorted(description['features'])
+            tool['task_classes'] = sorted(description['task_classes'])
+
+            # CHECK IF THE TOOL CAN BE LOADED LAZILY.
+            # Options added by a tool without commands may be used by any command.
+            changes_waf = bool(description['changes'])
+            initializes_contexts = bool(set(description['functions']) - set(['options']))
+            has_unused_options = ('options' in description['functions']) and not description['commands']
+            tool['lazy'] = not (description['is_package'] or changes_waf or initializes_contexts or has_unused_options)
+            if description['changes']:
+                Logs.debug('tools: {} is always loaded, since it changes {}'.format(
+                    tool['name'],
+                    ', '.join(sorted(description['changes']))))
+
+## Returns an empty description of what a tool provides.
+def NewToolDescription():
+    return {
+        'commands': set(),
+        'options': [],
+        'features': set(),
+        'task_classes': set(),
+        'changes': set(),
+        'functions': [],
+        'is_package': False}
+
+## Returns the option strings added to an options context, such as '--targets'.
+## \param[in] context - The options context.
+def GetOptionStrings(context):
+    parser = getattr(context, 'parser', None)
+    if not parser:
+        return []
+    return [option_string for option in parser._get_all_options() for option_string in option._long_opts]
+
+## Returns the path identifying the tool that defines a module. A tool may be imported both as a Waf
+## tool and as part of the Waf package, so it is identified by its path rather than its name.
+## \param[in] module - The module.
+## \return The path of the tool without an extension, or None if the module is not a tool.
+def GetModuleToolPath(module):
+    module_path = getattr(module, '__file__', None)
+    if not module_path:
+        return None
+    tool_path = os.path.splitext(os.path.realpath(module_path))[0]
+    if os.path.basename(tool_path) == '__init__':
+        tool_path = os.path.dirname(tool_path)
+    return tool_path
+
+## Takes a snapshot of the registries of Waf and of the classes that tools may change.
+## \return The snapshot.
+def TakeRegistrySnapshot():
+    watched_objects = [
+        Task.Task,
+        TaskGen.task_gen,
+        Build.BuildContext,
+        Configure.ConfigurationContext,
+        Context.Context,
+        Options.OptionsContext,
+        Node.Node,
+        Runner.Parallel,
+        Logs]
+    watched_objects.extend(set(Task.classes.values()))
+    return {
+        'features': dict((feature_name, set(method_names)) for feature_name, method_names in TaskGen.feats.items()),
+        'task_classes': dict(Task.classes),
+        'commands': list(Context.classes),
+        'mappings': dict(TaskGen.task_gen.mappings),
+        'attributes': [(watched_object, dict(vars(watched_object))) for watched_object in watched_objects]}
+
+## Attributes the changes made to the registries since a snapshot to the tools defining them. Changes
+## made by values that are not defined by a tool are attributed to the tool that was being loaded.
+## \param[in] registry_snapshot - The snapshot taken before the tool was loaded.
+## \param[in] loaded_tool_path - The path of the tool that was being loaded.
+def AttributeRegistryChanges(registry_snapshot, loaded_tool_path):
+    # FIND THE TOOL DEFINING EACH VALUE.
+    # Values defined by modules outside the tool directories, such as the Waf tools, are attributed to
+    # the tool that imported them.
+    def GetDescription(value):
+        module = sys.modules.get(getattr(value, '__module__', None))
+        tool_path = GetModuleToolPath(module) if module else None
+        is_tool = tool_path and any(tool_path.startswith(tool_dir_path + os.sep) for tool_dir_path in _described_tool_dir_paths)
+        return _descriptions_by_tool_path.setdefault(tool_path if is_tool else loaded_tool_path, NewToolDescription())
+
+    # ATTRIBUTE THE COMMANDS.
+    for command_class in Context.classes:
+        is_new_command = (command_class not in registry_snapshot['commands']) and getattr(command_class, 'cmd', None)
+        if is_new_command:
+            GetDescription(command_class)['commands'].add(command_class.cmd)
+
+    # ATTRIBUTE THE FEATURES.
+    # The methods of the features are attributes of the task generator class.
+    feature_method_names = set()
+    for feature_name, method_names in TaskGen.feats.items():
+        new_method_names = set(method_names) - registry_snapshot['features'].get(feature_name, set())
+        for method_name in new_method_names:
+            feature_method_names.add(method_name)
+            GetDescription(getattr(TaskGen.task_gen, method_name, None))['features'].add(feature_name)
+
+    # ATTRIBUTE THE TASK CLASSES.
+    for task_class_name, task_class in Task.classes.items():
+        if registry_snapshot['task_classes'].get(task_class_name) is not task_class:
+            GetDescription(task_class)['task_classes'].add(task_class_name)
+
+    # ATTRIBUTE THE OTHER CHANGES.
+    for extension, method in TaskGen.task_gen.mappings.items():
+        if registry_snapshot['mappings'].get(extension) is not method:
+            GetDescription(method)['changes'].add('the {} extension'.format(extension))
+    for watched_object, old_attributes in registry_snapshot['attributes']:
+        for attribute_name, value in vars(watched_object).items():
+            is_changed = (old_attributes.get(attribute_name) is not value) and (attribute_name not in feature_method_names)
+            if is_changed:
+                GetDescription(value)['changes'].add('{}.{}'.format(watched_object.__name__, attribute_name))
+
+# Load the tools providing a command before its context is created. Waf runs the function of the
+# same name in the Waf scripts if no context class defines the command.
+_create_context_is_patched = getattr(Context.create_context, 'loads_lazy_tools', False)
+if not _create_context_is_patched:
+    _old_create_context = Context.create_context
+    def _create_context(cmd_name, *k, **kw):
+        LoadLazyTools(cmd_name, 'commands')
+        return _old_create_context(cmd_name, *k, **kw)
+    _create_context.__dict__.update(_old_create_context.__dict__)
+    _create_context.loads_lazy_tools = True
+    Context.create_context = _create_context
+
+# Load the tools providing the features of a project before it is posted.
+_task_gen_post_is_patched = getattr(TaskGen.task_gen.post, 'loads_lazy_tools', False)
+if not _task_gen_post_is_patched:
+    _old_task_gen_post = TaskGen.task_gen.post
+    def _task_gen_post(self):
+        if not getattr(self, 'posted', False):
+            for feature_name in ['*'] + Utils.to_list(getattr(self, 'features', [])):
+                LoadLazyTools(feature_name, 'features')
+        return _old_task_gen_post(self)
+    _task_gen_post.__dict__.update(_old_task_gen_post.__dict__)
+    _task_gen_post.loads_lazy_tools = True
+    TaskGen.task_gen.post = _task_gen_post
+
+# Load the tool providing a task class before a task of the class is created.
+_task_gen_create_task_is_patched = getattr(TaskGen.task_gen.create_task, 'loads_lazy_tools', False)
+if not _task_gen_create_task_is_patched:
+    _old_task_gen_create_task = TaskGen.task_gen.create_task
+    def _task_gen_create_task(self, name, *k, **kw):
+        if name not in Task.classes:
+            LoadLazyTools(name, 'task_classes')
+        return _old_task_gen_create_task(self, name, *k, **kw)
+    _task_gen_create_task.__dict__.update(_old_task_gen_create_task.__dict__)
+    _task_gen_create_task.loads_lazy_tools = True
+    TaskGen.task_gen.create_task = _task_gen_create_task
@@ -0,0 +1,522 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import defaultdict
+import ctypes
+import errno
+import os
+import select
+import stat
+import struct
+import sys
+import time
+
+from waflib import Context
+from waflib import Errors
+from waflib import Logs
+from waflib import Options
+from waflib import Task
+from waflib import Utils
+from waflib.Build import BuildContext
+
+from Waf.Dependency import RunAfterProject
+from Waf.Dependency.DependencyGraph import GetEvaluatedWscripts
+from Waf.Dependency.DependencyGraph import GetVariantConfigurationPath
+from Waf.Dependency.DependencyGraph import GetWscriptStampedPaths
+from Waf.Utilities.ToolManifest import GetToolPaths
+
+## \package Waf.Utilities.Watch
+## This package defines the 'watch' command, which builds the targets and then builds them again
+## whenever the files they are built from change, until it is interrupted.
+##
+## ~~~
+## waf watch --targets=ExampleGame
+## ~~~
+##
+## The command keeps the projects, their tasks and the node tree in memory between builds, so each
+## build after a change only hashes the changed files and runs the tasks depending on them. Starting
+## Python, loading the Waf tools and the build state, and declaring the projects are only done once.
+##
+## Changes are found with inotify on Linux, and by polling the files elsewhere or when --watch-poll is
+## given. Three kinds of files are watched:
+## - The source files and headers of the tasks. Changing them builds the targets again.
+## - The Waf scripts, the directories they list and the configuration of the variant. Changing them
+##   declares the projects again in a new build context, reusing the snapshots of the unchanged Waf
+##   scripts.
+## - The custom Waf tools. They cannot be loaded again by the running command, so changing them stops
+##   the command.
+
+## The number of seconds between the checks for changes when polling, unless another is given.
+DEFAULT_POLL_INTERVAL_IN_SECONDS = 0.5
+
+## The number of seconds without further changes after which the changes are built. Editors and
+## version control often write several files at once.
+SETTLE_TIME_IN_SECONDS = 0.1
+
+## The kinds of watched paths, from the most to the least important.
+TOOL_PATH = 'tool'
+DECLARATION_PATH = 'declaration'
+SOURCE_PATH = 'source'
+
+## The inotify events that may change the stamp of a watched path. Saving a file may create, modify
+## or rename it, depending on the editor.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+INOTIFY_EVENT_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+## The inotify event reported when events were lost, after which every watched path is checked.
+IN_Q_OVERFLOW = 0x00004000
+
+## The inotify event reported when a watch is removed, such as when its directory is deleted.
+IN_IGNORED = 0x00008000
+
+## Each inotify event starts with the watch descriptor, the event mask, a cookie and the length of
+## the name of the entry that changed.
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+
+## The number of bytes of inotify events read at once.
+INOTIFY_BUFFER_SIZE = 64 * 1024
+
+## Adds the options for the watch command.
+## \param[in] options_context - The options context is shared by all user defined options methods.
+def options(options_context):
+    # CREATE AN OPTION GROUP FOR THE WATCH OPTIONS.
+    watch_option_group = options_context.add_option_group("Watch options")
+
+    # LOAD THE COMMAND LINE ARGUMENTS.
+    watch_option_group.add_option(
+        '--watch-poll',
+        action = 'store_true',
+        default = False,
+        help = 'Poll the files for changes instead of using inotify.')
+    watch_option_group.add_option(
+        '--watch-interval',
+        action = 'store',
+        type = 'float',
+        default = DEFAULT_POLL_INTERVAL_IN_SECONDS,
+        help = 'The number of seconds between the checks for changes when polling. [default: %default]')
+
+## Builds the targets again whenever the files they are built from change.
+class WatchContext(BuildContext):
+    '''builds the targets again whenever their files change'''
+    cmd = 'watch'
+
+    # Builds until the command is interrupted. The projects are declared again in a new build
+    # context whenever the Waf scripts change, since they cannot be declared twice in one context.
+    def execute(self):
+        build_context = self
+        try:
+            while True:
+                super(WatchContext, build_context).execute()
+                build_context = Context.create_context(self.cmd)
+                build_context.options = Options.options
+                build_context.cmd = self.cmd
+        except KeyboardInterrupt:
+            pass
+
+    # Declares the projects and builds the targets whenever their files change. Returns once the
+    # projects must be declared again.
+    def execute_build(self):
+        # DECLARE THE PROJECTS.
+        Logs.info("Waf: Entering directory `%s'", self.variant_dir)
+        self.recurse([self.run_dir])
+        self.pre_build()
+
+        # WATCH THE FILES THAT DECLARE THE PROJECTS.
+        # They are stamped before the first build, so that changes made while building are found.
+        watched_files = WatchedFiles()
+        watched_files.Watch(GetToolPaths(), TOOL_PATH)
+        watched_files.Watch(GetDeclarationStampedPaths(self), DECLARATION_PATH)
+        file_watcher = CreateFileWatcher(watched_files)
+        try:
+            while True:
+                # BUILD THE TARGETS.
+                build_start_time = time.time()
+                projects_intact = self.BuildTargets()
+
+                # WATCH THE FILES THE TARGETS ARE BUILT FROM.
+                # The headers of the tasks may have changed during the build.
+                watched_files.WatchSources(GetSourcePaths(self), build_start_time)
+                try:
+                    file_watcher.Watch(watched_files.GetWatchedDirPaths())
+                except OSError as error:
+                    Logs.warn('Could not watch the files with inotify, so they are polled for changes instead: {}'.format(error))
+                    file_watcher.Close()
+                    file_watcher = PollingFileWatcher(watched_files, Options.options.watch_interval)
+                Logs.info('Watching {} files for changes (press Ctrl+C to stop)'.format(len(watched_files.kinds_by_path)))
+
+                # WAIT FOR THE FILES TO CHANGE.
+                changed_paths_by_kind = WaitForChanges(watched_files, file_watcher)
+                changed_paths = set().union(*changed_paths_by_kind.values())
+                Logs.info('Changed: {}'.format(', '.join(sorted(os.path.basename(path) for path in changed_paths))))
+                if changed_paths_by_kind[TOOL_PATH]:
+                    raise Errors.WafError('The Waf tools have changed, so the watch command must be run again.')
+                if changed_paths_by_kind[DECLARATION_PATH] or not projects_intact:
+                    # Waf keeps the Waf scripts it has loaded, so changed Waf scripts must be
+                    # forgotten to be evaluated again.
+                    Logs.info('Declaring the projects again')
+                    for changed_path in changed_paths_by_kind[DECLARATION_PATH]:
+                        Context.cache_modules.pop(changed_path, None)
+                    return
+
+                # BUILD THE CHANGED FILES AGAIN.
+                self.ForgetChangedFiles(changed_paths_by_kind[SOURCE_PATH])
+        finally:
+            file_watcher.Close()
+            Logs.info("Waf: Leaving directory `%s'", self.variant_dir)
+
+    ## Builds the targets once, reporting any errors instead of stopping the command.
+    ## \return False if a project failed to be posted, in which case it cannot be built until the
+    ##      projects are declared again; true otherwise.
+    def BuildTargets(self):
+        # BUILD THE TARGETS.
+        self.timer = Utils.Timer()
+        try:
+            self.compile()
+        except Errors.BuildError as error:
+            Logs.error(error.msg)
+            return True
+        except Errors.WafError as error:
+            # Projects are only posted once, even if posting them fails.
+            Logs.error(error.msg)
+            return False
+        finally:
+            try:
+                self.producer.bld = None
+                del self.producer
+            except AttributeError:
+                pass
+
+        # RUN THE POST-BUILD FUNCTIONS.
+        self.post_build()
+        Logs.info('Build finished successfully ({})'.format(self.timer))
+        return True
+
+    ## Prepares the tasks to be run again after files have changed. Waf caches the signatures of files
+    ## and tasks for the duration of a build, assuming that the outputs of a task are only read after
+    ## it has run. The signatures of the changed files are forgotten, along with those of the outputs
+    ## of every task that may run again.
+    ## \param[in] changed_paths - The absolute paths of the source files that changed.
+    def ForgetChangedFiles(self, changed_paths):
+        # FIND THE TASKS READING EACH FILE.
+        build_tasks = GetBuildTasks(self)
+        tasks_by_dependency_node = defaultdict(list)
+        for task in build_tasks:
+            for dependency_node in GetTaskDependencyNodes(self, task):
+                tasks_by_dependency_node[dependency_node].append(task)
+
+        # FORGET THE SIGNATURES OF THE FILES THAT MAY CHANGE.
+        # The tasks that did not succeed in the last build may run again, as may the tasks reading
+        # the changed files, directly or through the outputs of other tasks that may run again. Nodes
+        # are searched for rather than found, since the files may have been deleted.
+        node_signatures = getattr(self, 'cache_sig', {})
+        rerun_tasks = set(task for task in build_tasks if task.hasrun not in (Task.SUCCESS, Task.SKIPPED))
+        changed_nodes = [self.root.search_node(changed_path) for changed_path in changed_paths]
+        changed_nodes = [changed_node for changed_node in changed_nodes if changed_node]
+        for rerun_task in rerun_tasks:
+            changed_nodes.extend(rerun_task.outputs)
+        while changed_nodes:
+            changed_node = changed_nodes.pop()
+            node_signatures.pop(changed_node, None)
+            for task in tasks_by_dependency_node.get(changed_node, []):
+                if task not in rerun_tasks:
+                    rerun_tasks.add(task)
+                    changed_nodes.extend(task.outputs)
+
+        # RESET THE TASKS.
+        # The precedence constraints between groups of tasks are added again by each build. The
+        # barriers of the projects that tasks run after are emptied as the projects are built, so
+        # they are created again below. Tasks restored from the compilation cache may run this time,
+        # so they are no longer marked as restored, or their runs would not be recorded.
+        for task in build_tasks:
+            task.hasrun = Task.NOT_RUN
+            task.__dict__.pop('restored_from_cache', None)
+            task.run_after = set(
+                previous_task for previous_task in task.run_after
+                if not isinstance(previous_task, Task.TaskGroup))
+            for project in getattr(task, 'run_after_projects', []):
+                project.__dict__.pop('completion_barrier', None)
+            try:
+                del task.cache_sig
+            except AttributeError:
+                pass
+
+        # WAIT FOR THE PROJECTS AGAIN.
+        for task in build_tasks:
+            for project in getattr(task, 'run_after_projects', []):
+                RunAfterProject(task, project)
+
+        # FORGET THE HEADERS CACHED BY THE CUSTOM PREPROCESSOR.
+        # It caches the contents of headers and the results of searching for them.
+        for preprocessor_cache_name in ('preproc_cache_node', 'preproc_cache_lines'):
+            self.__dict__.pop(preprocessor_cache_name, None)
+
+## The files and directories watched for changes, along with their last known stamps.
+class WatchedFiles(object):
+    ## Creates an empty set of watched files.
+    def __init__(self):
+        self.kinds_by_path = {}
+        self.stamps_by_path = {}
+
+        # Paths found to have changed before they were watched.
+        self.changed_paths = set()
+
+    ## Starts watching the given paths. Paths that are already watched keep their kind.
+    ## \param[in] paths - The absolute paths of the files and directories.
+    ## \param[in] kind - The kind of the paths.
+    def Watch(self, paths, kind):
+        for path in paths:
+            if path not in self.kinds_by_path:
+                self.kinds_by_path[path] = kind
+                self.stamps_by_path[path] = StampWatchedPath(path)
+
+    ## Watches the source files of the tasks instead of those previously watched.
+    ## \param[in] source_paths - The absolute paths of the source files.
+    ## \param[in] build_start_time - The time at which the build started. Source files modified since
+    ##      then may have been modified after the build read them, so they are considered changed.
+    def WatchSources(self, source_paths, build_start_time):
+        # STOP WATCHING THE SOURCE FILES NO LONGER USED.
+        source_paths = set(source_paths)
+        for path, kind in list(self.kinds_by_path.items()):
+            if (SOURCE_PATH == kind) and (path not in source_paths):
+                del self.kinds_by_path[path]
+                del self.stamps_by_path[path]
+
+        # WATCH THE NEW SOURCE FILES.
+        # Source files that were already watched were stamped before the build.
+        new_source_paths = [path for path in source_paths if path not in self.kinds_by_path]
+        self.Watch(new_source_paths, SOURCE_PATH)
+        for path in new_source_paths:
+            stamp = self.stamps_by_path[path]
+            modified_during_build = isinstance(stamp, tuple) and (stamp[0] >= build_start_time)
+            if modified_during_build:
+                self.changed_paths.add(path)
+
+    ## Returns the directories in which the watched paths may change.
+    def GetWatchedDirPaths(self):
+        dir_paths = set()
+        for path, stamp in self.stamps_by_path.items():
+            is_dir = isinstance(stamp, list)
+            dir_paths.add(path if is_dir else os.path.dirname(path))
+        return dir_paths
+
+    ## Stamps the given paths again, recording the stamps of those that changed.
+    ## \param[in] candidate_paths - The paths that may have changed, or None if any watched path may
+    ##      have changed. Paths that are not watched are ignored.
+    ## \return The changed paths by kind.
+    def FindChanges(self, candidate_paths):
+        # INCLUDE THE PATHS THAT CHANGED BEFORE THEY WERE WATCHED.
+        changed_paths_by_kind = defaultdict(set)
+        for path in self.changed_paths:
+            if path in self.kinds_by_path:
+                changed_paths_by_kind[self.kinds_by_path[path]].add(path)
+        self.changed_paths = set()
+
+        # STAMP THE CANDIDATE PATHS.
+        if candidate_paths is None:
+            candidate_paths = list(self.kinds_by_path)
+        for path in candidate_paths:
+            kind = self.kinds_by_path.get(path)
+            if kind is None:
+                continue
+            stamp = StampWatchedPath(path)
+            if stamp != self.stamps_by_path[path]:
+                self.stamps_by_path[path] = stamp
+                changed_paths_by_kind[kind].add(path)
+        return changed_paths_by_kind
+
+## Finds changes to the watched files by checking all of them at regular intervals.
+class PollingFileWatcher(object):
+    ## Creates the watcher.
+    ## \param[in] watched_files - The watched files.
+    ## \param[in] poll_interval - The number of seconds between the checks for changes.
+    def __init__(self, watched_files, poll_interval):
+        self.watched_files = watched_files
+        self.poll_interval = poll_interval
+
+    ## Watches the given directories, which is not needed when polling.
+    ## \param[in] dir_paths - The absolute paths of the directories.
+    def Watch(self, dir_paths):
+        pass
+
+    ## Waits for the next check for changes.
+    ## \param[in] timeout - The number of seconds to wait, or None to wait for the poll interval.
+    ## \return None, since any watched path may have changed.
+    def Wait(self, timeout):
+        time.sleep(self.poll_interval if (timeout is None) else timeout)
+        return None
+
+    ## Stops watching.
+    def Close(self):
+        pass
+
+## Finds changes to the watched files with the inotify API of Linux, which reports the changed
+## entries of the watched directories.
+class InotifyFileWatcher(object):
+    ## Creates the watcher.
+    def __init__(self):
+        # The functions of the C library are found in the running program.
+        self.libc = ctypes.CDLL(None, use_errno = True)
+        self.inotify_fd = self.libc.inotify_init()
+        if self.inotify_fd < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number))
+        self.dir_paths_by_watch_descriptor = {}
+        self.watched_dir_paths = set()
+
+    ## Watches the given directories, in addition to those already watched.
+    ## \param[in] dir_paths - The absolute paths of the directories. Missing directories are not
+    ##      watched, but are found to be created through their parent directories.
+    def Watch(self, dir_paths):
+        for dir_path in set(dir_paths) - self.watched_dir_paths:
+            encoded_dir_path = dir_path if isinstance(dir_path, bytes) else dir_path.encode(sys.getfilesystemencoding())
+            watch_descriptor = self.libc.inotify_add_watch(self.inotify_fd, encoded_dir_path, INOTIFY_EVENT_MASK)
+            if watch_descriptor < 0:
+                error_number = ctypes.get_errno()
+                if error_number in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(error_number, os.strerror(error_number), dir_path)
+            self.dir_paths_by_watch_descriptor[watch_descriptor] = dir_path
+            self.watched_dir_paths.add(dir_path)
+
+    ## Waits for changes to the watched directories.
+    ## \param[in] timeout - The number of seconds to wait, or None to wait until a change.
+    ## \return The paths that may have changed, or None if any watched path may have changed.
+    def Wait(self, timeout):
+        # READ THE EVENTS.
+        readable_fds, _, _ = select.select([self.inotify_fd], [], [], timeout)
+        if not readable_fds:
+            return []
+        events = os.read(self.inotify_fd, INOTIFY_BUFFER_SIZE)
+
+        # FIND THE PATHS THAT MAY HAVE CHANGED.
+        changed_paths = set()
+        offset = 0
+        while offset < len(events):
+            watch_descriptor, event_mask, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(events, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            entry_name = events[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+            if event_mask & IN_Q_OVERFLOW:
+                return None
+            dir_path = self.dir_paths_by_watch_descriptor.get(watch_descriptor)
+            if dir_path is None:
+                continue
+            changed_paths.add(dir_path)
+            if entry_name:
+                if not isinstance(entry_name, str):
+                    entry_name = entry_name.decode(sys.getfilesystemencoding())
+                changed_paths.add(os.path.join(dir_path, entry_name))
+            if event_mask & IN_IGNORED:
+                # The directory must be watched again if it is created again.
+                del self.dir_paths_by_watch_descriptor[watch_descriptor]
+                self.watched_dir_paths.discard(dir_path)
+        return changed_paths
+
+    ## Stops watching.
+    def Close(self):
+        os.close(self.inotify_fd)
+
+## Creates the watcher used to find changes to the watched files.
+## \param[in] watched_files - The watched files.
+## \return The watcher.
+def CreateFileWatcher(watched_files):
+    uses_inotify = sys.platform.startswith('linux') and not Options.options.watch_poll
+    if uses_inotify:
+        try:
+            return InotifyFileWatcher()
+        except (AttributeError, OSError) as error:
+            Logs.warn('Could not use inotify, so files are polled for changes instead: {}'.format(error))
+    return PollingFileWatcher(watched_files, Options.options.watch_interval)
+
+## Waits until the watched files change and the changes settle.
+## \param[in,out] watched_files - The watched files, whose stamps are updated.
+## \param[in] file_watcher - The watcher finding the paths that may have changed.
+## \return The changed paths by kind.
+def WaitForChanges(watched_files, file_watcher):
+    # WAIT FOR THE FIRST CHANGE.
+    # Files modified while building are found to have changed right away.
+    changed_paths_by_kind = watched_files.FindChanges([])
+    while not changed_paths_by_kind:
+        changed_paths_by_kind = watched_files.FindChanges(file_watcher.Wait(None))
+
+    # WAIT FOR THE CHANGES TO SETTLE.
+    while True:
+        more_changed_paths_by_kind = watched_files.FindChanges(file_watcher.Wait(SETTLE_TIME_IN_SECONDS))
+        if not more_changed_paths_by_kind:
+            return changed_paths_by_kind
+        for kind, changed_paths in more_changed_paths_by_kind.items():
+            changed_paths_by_kind[kind].update(changed_paths)
+
+## Stamps a watched path. Files are stamped by modification time and size, which is enough to find
+## changes without reading them. Directories are stamped by their entries, since their modification
+## time also changes when editors create and delete temporary files while saving.
+## \param[in] path - The absolute path of the file or directory.
+## \return The stamp of the path, or None if it does not exist.
+def StampWatchedPath(path):
+    try:
+        path_status = os.stat(path)
+        if stat.S_ISDIR(path_status.st_mode):
+            return sorted(entry_name for entry_name in os.listdir(path) if not IsIgnoredEntryName(entry_name))
+    except OSError:
+        return None
+    return (path_status.st_mtime, path_status.st_size)
+
+## Returns whether an entry of a watched directory is ignored. Hidden entries, editor backup files
+## and compiled Python files are never part of a build.
+## \param[in] entry_name - The name of the entry.
+def IsIgnoredEntryName(entry_name):
+    return (
+        entry_name.startswith(('.', '#')) or
+        entry_name.endswith(('~', '.pyc')) or
+        ('__pycache__' == entry_name))
+
+## Returns the paths that must be watched to find changes to the projects declared by the Waf
+## scripts. They are the paths stamped by the Waf script snapshot, which include the directories
+## listed by the Waf scripts, or the paths around the Waf scripts if they were not snapshotted.
+## \param[in] build_context - The context in which the projects were declared.
+## \return The absolute paths of the files and directories.
+def GetDeclarationStampedPaths(build_context):
+    stamped_paths = set([GetVariantConfigurationPath(build_context)])
+    for wscript_node in GetEvaluatedWscripts(build_context):
+        stamped_paths.update(GetWscriptStampedPaths(build_context, wscript_node))
+    wscript_snapshot = getattr(build_context, 'wscript_snapshot', None)
+    if wscript_snapshot:
+        stamped_paths.update(wscript_snapshot.stamped_paths)
+    return stamped_paths
+
+## Returns the tasks of the projects that have been posted.
+## \param[in] build_context - The context of the build.
+def GetBuildTasks(build_context):
+    build_tasks = []
+    for group_index in range(len(build_context.groups)):
+        group_tasks = build_context.get_tasks_group(group_index)
+        build_tasks.extend(task for task in group_tasks if isinstance(task, Task.Task))
+    return build_tasks
+
+## Returns the files read by a task, including the headers found when it was last scanned.
+## \param[in] build_context - The context of the build.
+## \param[in] task - The task.
+## \return The nodes of the files.
+def GetTaskDependencyNodes(build_context, task):
+    return task.inputs + task.dep_nodes + build_context.node_deps.get(task.uid(), [])
+
+## Returns the source files read by the tasks of the projects that have been posted. Files in the
+## build directory are built by other tasks, so they are not included.
+## \param[in] build_context - The context of the build.
+## \return The absolute paths of the source files.
+def GetSourcePaths(build_context):
+    source_paths = set()
+    for task in GetBuildTasks(build_context):
+        for dependency_node in GetTaskDependencyNodes(build_context, task):
+            if not dependency_node.is_bld():
+                source_paths.add(dependency_node.abspath())
+    return source_paths
@@ -12,6 +12,8 @@ import uuid
 from waflib import Logs
 from waflib import Utils
 
+from Waf.Utilities.ToolManifest import LoadToolDirectory
+
 ## \package Waf.Utilities
 ## This package contains general commands used in the development work flow and utility functions
 ## used in many custom tools.
@@ -20,6 +22,18 @@ from waflib import Utils
 ## command context is initialized.
 ## \param[in] options_context - The options context is shared by all user defined options methods.
 def options(options_context):
+    # CREATE AN OPTION GROUP FOR THE UTILITY OPTIONS.
+    utility_option_group = options_context.add_option_group("Utility options")
+
+    # LOAD THE COMMAND LINE ARGUMENTS.
+    # Commands that find or generate files may open them.
+    utility_option_group.add_option(
+        '--open',
+        action = 'store_true',
+        default = False,
+        help = 'Open the files found or generated by the command in their default programs.')
+
+    # ADD THE OPTIONS FOR THE UTILITY TOOLS.
     LoadTools(options_context, __file__)
 
 ## Initializes the command context for the current tool and all sub-tools. This method is executed
@@ -35,44 +49,18 @@ def init(command_context):
 def configure(configure_context):
     LoadTools(configure_context, __file__)
 
-## Loads the Waf tools in the directory of the currently executing Python script.
+## Loads the Waf tools in the directory of the currently executing Python script. Tools that are
+## not needed by the current command are loaded lazily, as described by the tool manifest.
 ## \param[in] context - The current command context.
 ## \param[in] python_script_path - The path to the currently executing Python script.
 def LoadTools(context, python_script_path):
-    # GATHER THE WAF TOOLS IN THE CURRENT DIRECTORY.
+    # LOAD THE WAF TOOLS IN THE CURRENT DIRECTORY.
     # The tools are a Waf thing with init, configure, etc. They define extensions to waf, or code
-    # that should be run during commands.
+    # that should be run during commands. The method with the same name as the command of the
+    # current context will be executed.
     current_file_path = os.path.realpath(python_script_path)
     tool_dir_path = os.path.dirname(current_file_path)
-    tool_names = []
-    for file_name in os.listdir(tool_dir_path):
-        # CHECK IF THE FILE IS A PYTHON SCRIPT.
-        # A Waf tools is a Python script other than the currently executing Python script or a
-        # Python module.
-        file_path = os.path.join(tool_dir_path, file_name)
-        is_python_script = (
-            os.path.isfile(file_path) and
-            file_path.endswith('.py'))
-        is_python_module = (
-            os.path.isdir(file_path) and
-            os.path.isfile(os.path.join(file_path, '__init__.py')))
-        is_waf_tool = (is_python_script or is_python_module)
-        if not is_waf_tool:
-            continue
-
-        # CHECK IF THE FILE IS THE CURRENT WAF TOOL.
-        # The current tool should not be loaded again.
-        tool_name, python_ext = os.path.splitext(file_name)
-        is_current_tool = (tool_name == '__init__')
-        if is_current_tool:
-            continue
-
-        # STORE THE WAF TOOL NAME.
-        tool_names.append(tool_name)
-
-    # LOAD THE WAF TOOLS.
-    # The method with the same name as the command of the current context will be executed.
-    context.load(tool_names, tooldir = tool_dir_path)
+    LoadToolDirectory(context, tool_dir_path)
 
 ## Generates a UUID using a MD5 hash. The UUID is returned in canonical form.
 ## For example, 550e8400-e29b-41d4-a716-446655440000
@@ -85,15 +73,75 @@ def UuidMd5Hash(text):
 ## Returns the projects targeted by the given command. Targets are defined in
 ## two ways. First, they can be specified explicitly using the "--targets"
 ## option. Second, they can be specified implicitly by executing the command
-## from a sub-directory.
+## from a sub-directory. The targets are only selected once per command, so
+## the function may be called by every step of a command.
 ## \param command_context - The context describes both how the command was
 ## executed and all projects in the build system.
 ## \returns The projects targeted by the given command.
 def GetTargetProjects(command_context):
     # LOAD ALL PROJECTS.
+    projects = GetAllProjects(command_context)
+
+    # CHECK IF THE TARGETS HAVE ALREADY BEEN SELECTED.
+    # The targets are selected again if projects have been declared since.
+    discovered_projects = getattr(command_context, 'discovered_projects', None)
+    discovered_target_projects = getattr(command_context, 'discovered_target_projects', None)
+    targets_selected = (
+        discovered_projects and
+        discovered_target_projects and
+        (discovered_target_projects[0] is discovered_projects))
+    if targets_selected:
+        return list(discovered_target_projects[1])
+
+    # SELECT THE TARGETS FROM ALL PROJECTS.
+    target_projects = SelectTargetProjects(command_context, projects)
+    if discovered_projects:
+        command_context.discovered_target_projects = (discovered_projects, target_projects)
+    return list(target_projects)
+
+## Returns all projects in the build system. The Waf scripts are evaluated to
+## declare the projects if they have not been evaluated already. The projects
+## are only gathered once per command, and are indexed by name in the cache
+## used by get_tgen_by_name().
+## \param command_context - The context describes both how the command was
+## executed and all projects in the build system.
+## \returns The task generators of all projects, in declaration order.
+def GetAllProjects(command_context):
+    # CHECK IF THE PROJECTS HAVE ALREADY BEEN GATHERED.
+    # Waf replaces its cache of task generators by name whenever a task
+    # generator is declared, so the gathered projects are kept for as long as
+    # the cache is.
+    discovered_projects = getattr(command_context, 'discovered_projects', None)
+    projects_already_gathered = (
+        discovered_projects and
+        (discovered_projects[0] is command_context.task_gen_cache_names))
+    if projects_already_gathered:
+        return list(discovered_projects[1])
+
+    # GATHER THE PROJECTS.
     command_context.recurse([command_context.run_dir])
     projects = list(itertools.chain.from_iterable(command_context.groups))
 
+    # KEEP THE PROJECTS FOR THE REST OF THE COMMAND.
+    # Projects are still being declared while a Waf script is evaluated.
+    waf_script_being_evaluated = bool(command_context.stack_path)
+    if not waf_script_being_evaluated:
+        projects_by_name = command_context.task_gen_cache_names
+        for project in projects:
+            project_name = getattr(project, 'name', None)
+            if project_name is not None:
+                projects_by_name[project_name] = project
+        command_context.discovered_projects = (projects_by_name, projects)
+    return list(projects)
+
+## Returns the projects targeted by the given command from the given projects.
+## See GetTargetProjects() for the semantics of the targets.
+## \param command_context - The context describes how the command was executed.
+## \param projects - The projects to select from. Each project must provide a
+## name and a path (the directory node of the Waf script defining it), so
+## lightweight project records may be given instead of task generators.
+## \returns The projects targeted by the given command.
+def SelectTargetProjects(command_context, projects):
     # TARGETS MAY BE SPECIFIED EXPLICITLY.
     targets_specified = command_context.targets
     if targets_specified:
@@ -186,6 +234,14 @@ def PrintWafSettings(command_context):
     if command_context.env.SYMBOLS:
         current_variant_settings.append("symbols")
 
+    # Check if split debugging information is enabled.
+    if command_context.env.SYMBOLS and command_context.env.SPLIT_DWARF:
+        current_variant_settings.append("split dwarf")
+
+    # Check if header dependencies are found by the compiler.
+    if command_context.env.COMPILER_DEPENDENCIES:
+        current_variant_settings.append("compiler dependencies")
+
     # Check if optimization is enabled.
     if command_context.env.OPTIMIZE:
         current_variant_settings.append("optimize")